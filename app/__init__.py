@@ -1,21 +1,43 @@
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
 from .extensions import db, migrate, login_manager, jwt
 from .models import *  # Import your models
-from .routes import api_bp, main_routes  # Import the blueprints
+from .routes import api_bp, main_routes, internal_routes  # Import the blueprints
+from .utils import pool_metrics, db_routing, events, shared_store, throttle, cache, coalesce, admission, profiler, metrics, slow_queries, structured_logging, tracing, directory, ranking, suggest
+from .commands import register_commands
 from flask_cors import CORS
 
 def create_app():
     app = Flask(__name__)
     CORS(app, 
-     origins=["https://tutor-match-4ce860e71f03.herokuapp.com/"],
+     origins=["https://tutor-match-4ce860e71f03.herokuapp.com"],
      methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-     allow_headers=["Content-Type", "Authorization"])
+     allow_headers=["Content-Type", "Authorization", "X-Profile", "X-Primary-Pin"],
+     expose_headers=["X-Next-Cursor", "X-Request-ID", "X-Primary-Pin"])
 
     # Load configuration
     app.config.from_object('config.Config')
 
+    if app.config['PROXY_FIX_HOPS']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_HOPS'], x_proto=app.config['PROXY_FIX_HOPS'])
+
     # Initialize extensions
+    structured_logging.init_app(app)  # First, so every later hook logs with a request id
+    tracing.init_app(app)  # Root span around everything after it
+    pool_metrics.init_app(app)  # Must run before db.init_app creates the engines
     db.init_app(app)
+    metrics.init_app(app)  # Only starts a timer, so ahead of admission: shed requests are counted too
+    admission.init_app(app)  # Shed before any other work
+    db_routing.init_app(app)
+    events.init_app(app)
+    shared_store.init_app(app)
+    throttle.init_app(app)
+    cache.init_app(app)
+    coalesce.init_app(app)
+    directory.init_app(app)
+    ranking.init_app(app)
+    suggest.init_app(app)
+    slow_queries.init_app(app)
     migrate.init_app(app, db)
     login_manager.init_app(app)
     jwt.init_app(app)
@@ -23,5 +45,11 @@ def create_app():
     # Register the Blueprints
     app.register_blueprint(api_bp, url_prefix='/api')  # API routes under /api
     app.register_blueprint(main_routes)  # Main routes at the root
+    app.register_blueprint(internal_routes)  # Operator-only routes at /internal
+
+    profiler.init_app(app)  # Wraps the views, so after the blueprints
+
+    # CLI commands (flask import ...)
+    register_commands(app)
 
     return app
\ No newline at end of file
@@ -0,0 +1,215 @@
+import json
+import logging
+import pstats
+import time
+from collections import Counter
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from .utils.bulk_import import IMPORTERS, detect_format, parse_records, run_import
+from .utils.profiler import load_captures
+from .extensions import db
+from .utils import ranking, rollups, search
+from .utils.slow_queries import load_records
+
+logger = logging.getLogger(__name__)
+
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(sorted(IMPORTERS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']),
+              help='Input format; guessed from the file extension by default.')
+@with_appcontext
+def import_command(kind, path, fmt):
+    """Bulk-imports users, subjects or classes from a CSV or NDJSON file."""
+    fmt = fmt or detect_format(filename=path)
+    if not fmt:
+        raise click.UsageError("Can't tell the format from the file name; pass --format.")
+
+    with open(path, encoding='utf-8-sig') as f:
+        try:
+            records = parse_records(f.read(), fmt)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+
+    result = run_import(kind, records, current_app.config,
+                        hash_workers=current_app.config['BULK_IMPORT_HASH_WORKERS'])
+    click.echo(f"Imported {result.inserted} {kind}, {len(result.errors)} rows rejected.")
+    for error in result.errors:
+        click.echo(json.dumps(error), err=True)
+
+
+@click.command('profile-report')
+@click.option('--endpoint', help='Only requests to this endpoint, e.g. api.find_tutors.')
+@click.option('--sort', type=click.Choice(['tottime', 'cumulative']), default='tottime',
+              help='Rank frames by own time or by time including callees.')
+@click.option('--limit', default=25, show_default=True, help='Frames to show.')
+@with_appcontext
+def profile_report_command(endpoint, sort, limit):
+    """Aggregates captured request profiles and prints the hottest frames."""
+    captures = load_captures(current_app.config['PROFILE_DIR'], endpoint)
+    if not captures:
+        raise click.ClickException(f"No profiles in {current_app.config['PROFILE_DIR']}")
+
+    totals, requests_per_endpoint, wall = Counter(), Counter(), 0.0
+    stats = None
+    for summary, prof_path in captures:
+        requests_per_endpoint[summary['endpoint']] += 1
+        wall += summary['wall_ms']
+        totals.update(summary['split_ms'])
+        try:
+            if stats is None:
+                stats = pstats.Stats(prof_path)
+            else:
+                stats.add(prof_path)
+        except (OSError, EOFError, TypeError, ValueError):
+            continue  # Rotated away or half-written
+
+    click.echo(f"{len(captures)} requests, {wall:.1f} ms wall in total")
+    for name, count in requests_per_endpoint.most_common():
+        click.echo(f"  {count:>5}  {name}")
+    click.echo("\nTime by category:")
+    profiled = sum(totals.values()) or 1
+    for category, ms in totals.most_common():
+        click.echo(f"  {category:<14} {ms:>10.1f} ms  {ms / profiled:>6.1%}")
+    if stats:
+        click.echo("")
+        stats.sort_stats(sort).print_stats(limit)
+
+
+@click.command('slow-query-report')
+@click.option('--hours', type=float, help='Only statements recorded in the last N hours.')
+@click.option('--endpoint', help='Only statements run by this endpoint, e.g. api.find_tutors.')
+@click.option('--limit', default=10, show_default=True, help='Query shapes to show.')
+@click.option('--plans/--no-plans', default=True, show_default=True, help='Print the latest plan of each shape.')
+@with_appcontext
+def slow_query_report_command(hours, endpoint, limit, plans):
+    """Groups recorded slow queries by fingerprint, costliest first."""
+    since = time.time() - hours * 3600 if hours else None
+    records = [r for r in load_records(current_app.config['SLOW_QUERY_DIR'], since)
+               if not endpoint or r['endpoint'] == endpoint]
+    if not records:
+        raise click.ClickException(f"No slow queries in {current_app.config['SLOW_QUERY_DIR']}")
+
+    groups = {}
+    for record in records:
+        groups.setdefault(record['fingerprint'], []).append(record)
+    ranked = sorted(groups.values(), key=lambda group: -sum(r['duration_ms'] for r in group))
+
+    click.echo(f"{len(records)} slow statements, {len(groups)} distinct shapes")
+    for group in ranked[:limit]:
+        durations = sorted(r['duration_ms'] for r in group)
+        endpoints = Counter(r['endpoint'] or '(no request)' for r in group)
+        click.echo(f"\n{group[0]['fingerprint']}  {len(group)} calls, {sum(durations):.1f} ms total, "
+                   f"median {durations[len(durations) // 2]:.1f} ms, max {durations[-1]:.1f} ms")
+        click.echo("  from " + ", ".join(f"{name} ({count})" for name, count in endpoints.most_common(3)))
+        click.echo(f"  {group[0]['sql']}")
+        explained = [r for r in group if r.get('plan')]
+        if plans and explained:
+            latest = explained[-1]
+            kind = 'EXPLAIN ANALYZE' if latest.get('analyzed') else 'EXPLAIN'
+            click.echo(f"  {kind} with params {json.dumps(latest['params'])}:")
+            for line in json.dumps(latest['plan'], indent=2).splitlines():
+                click.echo(f"    {line}")
+
+
+@click.group('rollups')
+def rollups_group():
+    """Analytics rollups behind /api/admin/analytics."""
+
+
+@rollups_group.command('run')
+@click.option('--full', is_flag=True, help='Rebuild every row instead of catching up from the watermark.')
+@click.option('--every', type=int, default=None,
+              help='Keep running, once per this many seconds (default ROLLUP_INTERVAL_SECONDS).')
+@click.option('--loop', is_flag=True, help='Keep running at the --every interval.')
+@with_appcontext
+def rollups_run_command(full, every, loop):
+    """Brings the daily rollups up to date."""
+    interval = every or current_app.config['ROLLUP_INTERVAL_SECONDS']
+    while True:
+        started = time.monotonic()
+        try:
+            result = rollups.run(current_app.config, full=full)
+            click.echo(json.dumps(result))
+        except Exception:
+            db.session.rollback()
+            if not (loop or every):
+                raise
+            logger.exception("Rollup run failed")
+        finally:
+            db.session.remove()
+        if not (loop or every):
+            return
+        full = False
+        time.sleep(max(interval - (time.monotonic() - started), 0))
+
+
+@click.group('search')
+def search_group():
+    """Maintenance of the denormalized tutor search columns."""
+
+
+@search_group.command('sweep')
+@click.option('--every', type=int, default=None,
+              help='Keep running, once per this many seconds (default SEARCH_SWEEP_INTERVAL_SECONDS).')
+@click.option('--loop', is_flag=True, help='Keep running at the --every interval.')
+@with_appcontext
+def search_sweep_command(every, loop):
+    """Moves next_available_at past slots that have started."""
+    interval = every or current_app.config['SEARCH_SWEEP_INTERVAL_SECONDS']
+    while True:
+        started = time.monotonic()
+        try:
+            updated = search.sweep_next_available()
+            click.echo(json.dumps({"tutors_updated": updated,
+                                   "seconds": round(time.monotonic() - started, 3)}))
+        except Exception:
+            db.session.rollback()
+            if not (loop or every):
+                raise
+            logger.exception("Search sweep failed")
+        finally:
+            db.session.remove()
+        if not (loop or every):
+            return
+        time.sleep(max(interval - (time.monotonic() - started), 0))
+
+
+@click.group('ranking')
+def ranking_group():
+    """Offline tables behind the recommended search order."""
+
+
+@ranking_group.command('build')
+@click.option('--every', type=int, default=None,
+              help='Keep running, once per this many seconds (default RANKING_BUILD_INTERVAL_SECONDS).')
+@click.option('--loop', is_flag=True, help='Keep running at the --every interval.')
+@with_appcontext
+def ranking_build_command(every, loop):
+    """Rebuilds the tutor co-occurrence counts from booking history."""
+    interval = every or current_app.config['RANKING_BUILD_INTERVAL_SECONDS']
+    while True:
+        started = time.monotonic()
+        try:
+            click.echo(json.dumps(ranking.build(current_app.config)))
+        except Exception:
+            db.session.rollback()
+            if not (loop or every):
+                raise
+            logger.exception("Ranking build failed")
+        finally:
+            db.session.remove()
+        if not (loop or every):
+            return
+        time.sleep(max(interval - (time.monotonic() - started), 0))
+
+
+def register_commands(app):
+    app.cli.add_command(import_command)
+    app.cli.add_command(profile_report_command)
+    app.cli.add_command(slow_query_report_command)
+    app.cli.add_command(rollups_group)
+    app.cli.add_command(search_group)
+    app.cli.add_command(ranking_group)
@@ -2,9 +2,10 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_jwt_extended import JWTManager
+from .utils.db_routing import RoutingSession
 
-# Initialize SQLAlchemy
-db = SQLAlchemy()
+# Initialize SQLAlchemy (reads may be routed to replicas, see utils/db_routing.py)
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 # Initialize Flask-Migrate
 migrate = Migrate()
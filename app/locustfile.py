@@ -103,3 +103,34 @@ class FullBookingFlow(HttpUser):
 class WebsiteUser(FullBookingFlow):
     tasks = [FullBookingFlow.tutor_student_booking_flow]
 
+
+
+class ReadHeavyUser(HttpUser):
+    """
+    I/O-bound read mix (search, classes, session list) for comparing serving
+    modes. Every request spends most of its time waiting on Postgres, which
+    is where gevent/gthread workers pull ahead of sync ones.
+    """
+    wait_time = between(0, 0.1)
+    host = "http://127.0.0.1:8000/api"
+    behavior = BookingBehavior()
+
+    def on_start(self):
+        student_data = self.behavior.generate_user_data("student")
+        self.behavior.register_user(self.client, student_data)
+        login_response = self.behavior.login_user(self.client, student_data["username"])
+        self.headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+
+    @task(3)
+    def search_tutors(self):
+        self.client.get("/student/tutors", params={
+            "availability": random.choice(["morning", "afternoon", "evening"])
+        }, headers=self.headers, name="/student/tutors")
+
+    @task(2)
+    def list_classes(self):
+        self.client.get("/classes", headers=self.headers)
+
+    @task(1)
+    def list_sessions(self):
+        self.client.get("/student/sessions", headers=self.headers)
@@ -1,9 +1,9 @@
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 from app.extensions import db
 from sqlalchemy.dialects.postgresql import UUID
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import Numeric, UniqueConstraint, func
+from sqlalchemy import Numeric, UniqueConstraint, func, update, cast, or_, and_, select, event
 
 ### User Model ###
 class User(db.Model):
@@ -57,28 +57,60 @@ class Tutor(db.Model):
     user_id = db.Column(UUID(as_uuid=True), db.ForeignKey('user.id'), unique=True, nullable=False)
     hourly_rate = db.Column(Numeric(10, 2), nullable=False)
     bio = db.Column(db.Text)
+
+    # Review stats, kept up to date by record_review() so profiles and
+    # searches never aggregate the reviews table
+    review_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    average_rating = db.Column(Numeric(3, 2), nullable=False, default=0, server_default='0')
+    rating_1_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_2_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_3_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_4_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_5_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    # Start of the soonest open slot or rule occurrence, for sorting search
+    # results; refreshed on every availability write and swept once it passes
+    next_available_at = db.Column(db.DateTime, nullable=True)
+
+    # One index per search sort order, each ending in id as the tiebreaker
+    __table_args__ = (
+        db.Index('ix_tutors_hourly_rate', 'hourly_rate', 'id'),
+        db.Index('ix_tutors_rating', 'average_rating', 'review_count', 'id'),
+        db.Index('ix_tutors_review_count', 'review_count', 'id'),
+        db.Index('ix_tutors_next_available', 'next_available_at', 'id'),
+    )
     
     # Relationships
     user = db.relationship('User', back_populates='tutor_profile')
     classes = db.relationship('Class', secondary='tutor_class_association', back_populates='tutors')
     availability = db.relationship('TimeSlot', back_populates='tutor', cascade='all, delete-orphan')
+    availability_rules = db.relationship('AvailabilityRule', back_populates='tutor', cascade='all, delete-orphan')
     reviews = db.relationship('Review', back_populates='tutor')
 
     def calculate_average_rating(self):
-        avg_rating = db.session.query(
-            func.avg(Review.rating)
-        ).filter(Review.tutor_id == self.id).scalar()
-        return round(float(avg_rating or 0), 2)
+        return round(float(self.average_rating or 0), 2)
 
     def get_rating_distribution(self):
-        distribution = db.session.query(
-            Review.rating,
-            func.count(Review.id)
-        ).filter(Review.tutor_id == self.id)\
-         .group_by(Review.rating)\
-         .order_by(Review.rating)\
-         .all()
-        return {str(rating): count for rating, count in distribution}
+        distribution = {}
+        for rating in range(1, 6):
+            count = getattr(self, f'rating_{rating}_count')
+            if count:
+                distribution[str(rating)] = count
+        return distribution
+
+    @staticmethod
+    def record_review(tutor_id, rating):
+        """Folds a new review into the stored stats with one atomic UPDATE."""
+        rating_count = getattr(Tutor, f'rating_{rating}_count')
+        db.session.execute(
+            update(Tutor).where(Tutor.id == tutor_id).values({
+                Tutor.review_count: Tutor.review_count + 1,
+                Tutor.rating_sum: Tutor.rating_sum + rating,
+                Tutor.average_rating: cast(Tutor.rating_sum + rating, Numeric(10, 2)) / (Tutor.review_count + 1),
+                rating_count: rating_count + 1
+            })
+        )
 
     def to_dict(self, include_reviews=False):
         data = {
@@ -86,10 +118,9 @@ class Tutor(db.Model):
             "hourly_rate": float(self.hourly_rate),
             "bio": self.bio,
             "average_rating": self.calculate_average_rating(),
-            "total_reviews": len(self.reviews)
+            "total_reviews": self.review_count
         }
         if include_reviews:
-            data["reviews"] = [r.to_dict() for r in self.reviews]
             data["rating_distribution"] = self.get_rating_distribution()
         return data
 
@@ -100,6 +131,11 @@ tutor_class_association = db.Table(
     db.Column('class_id', UUID(as_uuid=True), db.ForeignKey('classes.id'), primary_key=True)
 )
 
+# Every insert/update of a slot or session (and every deletion, via
+# SyncTombstone) draws the next value, so clients can ask "what changed
+# since N" with an index range scan. See routes/sync_routes.py.
+sync_change_seq = db.Sequence('sync_change_seq', metadata=db.metadata)
+
 ### TimeSlot Model ###
 class TimeSlot(db.Model):
     __tablename__ = "time_slots"
@@ -109,10 +145,111 @@ class TimeSlot(db.Model):
     end_time = db.Column(db.DateTime, nullable=False)
     status = db.Column(db.String(20), default='available')
     student_id = db.Column(UUID(as_uuid=True), db.ForeignKey('students.id'))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    change_seq = db.Column(db.BigInteger, nullable=False,
+                           default=sync_change_seq.next_value(), onupdate=sync_change_seq.next_value())
+    # Set when the slot was materialized from a recurring rule at booking time
+    rule_id = db.Column(UUID(as_uuid=True), db.ForeignKey('availability_rules.id', ondelete='SET NULL'))
     
+    __table_args__ = (
+        # Calendar listings are range scans on start_time per tutor/student
+        db.Index('ix_time_slots_tutor_start', 'tutor_id', 'start_time', 'id'),
+        # One concrete slot per rule occurrence, however many students race for it
+        UniqueConstraint('rule_id', 'start_time', name='uq_time_slots_rule_start'),
+        # A user's booked sessions, newest first: students by their profile id,
+        # tutors through the booked slots alone
+        db.Index('ix_time_slots_student_start', 'student_id', 'start_time', 'id'),
+        db.Index('ix_time_slots_tutor_booked_start', 'tutor_id', 'start_time', 'id',
+                 postgresql_where=db.text('student_id IS NOT NULL')),
+        db.Index('ix_time_slots_tutor_change_seq', 'tutor_id', 'change_seq'),
+        db.Index('ix_time_slots_student_change_seq', 'student_id', 'change_seq'),
+        # Analytics rollups scan everything changed since their watermark
+        db.Index('ix_time_slots_change_seq', 'change_seq'),
+    )
+
     tutor = db.relationship('Tutor', back_populates='availability')
     student = db.relationship('Student', backref='booked_sessions')
 
+### AvailabilityRule Model ###
+class AvailabilityRule(db.Model):
+    """
+    Standing weekly availability: every `weekday` between `start_time` and
+    `end_time`, cut into `slot_minutes` slots, from `valid_from` until
+    `valid_until` (inclusive, open-ended if null). Times are naive UTC like
+    TimeSlot's. Occurrences are expanded at query time (see
+    utils/recurrence.py); a TimeSlot row is only written when one is booked.
+    """
+    __tablename__ = "availability_rules"
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    tutor_id = db.Column(UUID(as_uuid=True), db.ForeignKey('tutors.id'), nullable=False)
+    weekday = db.Column(db.Integer, nullable=False)  # 0 = Monday
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time, nullable=False)
+    slot_minutes = db.Column(db.Integer, nullable=False, default=60)
+    valid_from = db.Column(db.Date, nullable=False)
+    valid_until = db.Column(db.Date)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_availability_rules_tutor_weekday', 'tutor_id', 'weekday'),
+    )
+
+    tutor = db.relationship('Tutor', back_populates='availability_rules')
+    exceptions = db.relationship('AvailabilityException', back_populates='rule', cascade='all, delete-orphan')
+
+    def occurrences(self, window_start, window_end):
+        """Yields the (start, end) of each slot starting in [window_start, window_end)."""
+        first_day = max(window_start.date(), self.valid_from)
+        last_day = window_end.date() if self.valid_until is None else min(window_end.date(), self.valid_until)
+        skipped = {e.date for e in self.exceptions if e.start_time is None}
+        skipped_starts = {e.start_time for e in self.exceptions if e.start_time is not None}
+        step = timedelta(minutes=self.slot_minutes)
+
+        day = first_day + timedelta(days=(self.weekday - first_day.weekday()) % 7)
+        while day <= last_day:
+            if day not in skipped:
+                start = datetime.combine(day, self.start_time)
+                day_end = datetime.combine(day, self.end_time)
+                while start + step <= day_end:
+                    if window_start <= start < window_end and start not in skipped_starts:
+                        yield start, start + step
+                    start += step
+            day += timedelta(days=7)
+
+    def to_dict(self):
+        return {
+            "id": str(self.id),
+            "weekday": self.weekday,
+            "start_time": self.start_time.strftime('%H:%M'),
+            "end_time": self.end_time.strftime('%H:%M'),
+            "slot_minutes": self.slot_minutes,
+            "valid_from": self.valid_from.isoformat(),
+            "valid_until": self.valid_until.isoformat() if self.valid_until else None,
+            "exceptions": sorted(e.date.isoformat() for e in self.exceptions if e.start_time is None),
+            "skipped_occurrences": sorted(e.start_time.isoformat() for e in self.exceptions if e.start_time is not None)
+        }
+
+### AvailabilityException Model ###
+class AvailabilityException(db.Model):
+    """
+    A date on which a recurring rule does not apply, or with start_time
+    set, the one occurrence of the rule starting then.
+    """
+    __tablename__ = "availability_exceptions"
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    rule_id = db.Column(UUID(as_uuid=True), db.ForeignKey('availability_rules.id', ondelete='CASCADE'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    start_time = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('uq_availability_exceptions_rule_date', 'rule_id', 'date', unique=True,
+                 postgresql_where=db.text('start_time IS NULL')),
+        db.Index('uq_availability_exceptions_rule_start', 'rule_id', 'start_time', unique=True,
+                 postgresql_where=db.text('start_time IS NOT NULL')),
+    )
+
+    rule = db.relationship('AvailabilityRule', back_populates='exceptions')
+
 ### Student Model ###
 class Student(db.Model):
     __tablename__ = "students"
@@ -138,26 +275,161 @@ class Review(db.Model):
     
     __table_args__ = (
         db.CheckConstraint('rating >= 1 AND rating <= 5', name='valid_rating'),
+        db.Index('ix_reviews_tutor_created', 'tutor_id', 'created_at', 'id'),
+        db.Index('ix_reviews_created_at', 'created_at'),
     )
 
     tutor = db.relationship('Tutor', back_populates='reviews')
     student = db.relationship('Student', back_populates='reviews')
     timeslot = db.relationship('TimeSlot', backref='review')
 
-    def to_dict(self):
+    def to_dict(self, student_name=None):
+        if student_name is None:
+            student_name = f"{self.student.user.first_name} {self.student.user.last_name}"
         return {
             "id": str(self.id),
             "rating": self.rating,
             "comment": self.comment,
             "created_at": self.created_at.isoformat(),
             "student": {
-                "name": f"{self.student.user.first_name} {self.student.user.last_name}"
+                "name": student_name
             }
         }
+
+    @staticmethod
+    def page_for_tutor(tutor_id, limit, cursor=None):
+        """
+        Newest-first page of a tutor's reviews with reviewer names, in one
+        query. cursor is the (created_at, id) of the last review already
+        seen. Returns (reviews, last_key) where last_key is None on the
+        final page.
+        """
+        query = db.session.query(Review, User.first_name, User.last_name)\
+            .outerjoin(Student, Review.student_id == Student.id)\
+            .outerjoin(User, Student.user_id == User.id)\
+            .filter(Review.tutor_id == tutor_id)
+
+        if cursor:
+            created_at, review_id = cursor
+            query = query.filter(or_(
+                Review.created_at < created_at,
+                and_(Review.created_at == created_at, Review.id < review_id)
+            ))
+
+        rows = query.order_by(Review.created_at.desc(), Review.id.desc()).limit(limit + 1).all()
+
+        reviews = [
+            review.to_dict(student_name=f"{first_name} {last_name}" if first_name is not None else "")
+            for review, first_name, last_name in rows[:limit]
+        ]
+        last_key = None
+        if len(rows) > limit:
+            last = rows[limit - 1][0]
+            last_key = (last.created_at, last.id)
+        return reviews, last_key
     
 class TutoringSession(db.Model):
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     timeslot_id = db.Column(UUID(as_uuid=True), db.ForeignKey('time_slots.id'), nullable=False)
     student_id = db.Column(UUID(as_uuid=True), db.ForeignKey('user.id'), nullable=False)
     tutor_id = db.Column(UUID(as_uuid=True), db.ForeignKey('user.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    change_seq = db.Column(db.BigInteger, nullable=False,
+                           default=sync_change_seq.next_value(), onupdate=sync_change_seq.next_value())
+
+    __table_args__ = (
+        db.Index('ix_tutoring_session_student_id', 'student_id'),
+        db.Index('ix_tutoring_session_tutor_id', 'tutor_id'),
+        db.Index('ix_tutoring_session_timeslot_id', 'timeslot_id'),
+        db.Index('ix_tutoring_session_change_seq', 'change_seq'),
+        # Delta sync and the calendar ETag read a user's changes since a point
+        db.Index('ix_tutoring_session_student_change_seq', 'student_id', 'change_seq'),
+        db.Index('ix_tutoring_session_tutor_change_seq', 'tutor_id', 'change_seq'),
+    )
+
+### SyncTombstone Model ###
+class SyncTombstone(db.Model):
+    """Records a deleted slot or session for each user whose sync feed showed it."""
+    __tablename__ = "sync_tombstones"
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = db.Column(UUID(as_uuid=True), nullable=False)
+    entity = db.Column(db.String(30), nullable=False)  # 'time_slot' or 'tutoring_session'
+    entity_id = db.Column(UUID(as_uuid=True), nullable=False)
+    change_seq = db.Column(db.BigInteger, nullable=False, default=sync_change_seq.next_value())
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # The day the deleted row counted on in analytics rollups: a slot's
+    # start, a session's creation. Null on tombstones older than the column.
+    entity_day = db.Column(db.Date)
+
+    __table_args__ = (
+        db.Index('ix_sync_tombstones_user_change_seq', 'user_id', 'change_seq'),
+        db.Index('ix_sync_tombstones_change_seq', 'change_seq'),
+    )
+
+
+### Analytics Rollups ###
+class DailyTutorRollup(db.Model):
+    """One tutor's activity on one (UTC) day; maintained by app/utils/rollups.py."""
+    __tablename__ = "daily_tutor_rollups"
+    day = db.Column(db.Date, primary_key=True)
+    tutor_id = db.Column(UUID(as_uuid=True), db.ForeignKey('tutors.id', ondelete='CASCADE'), primary_key=True)
+    # Slots starting that day, and the booked or completed ones among them
+    slots_offered = db.Column(db.Integer, nullable=False, default=0)
+    offered_minutes = db.Column(db.Integer, nullable=False, default=0)
+    slots_booked = db.Column(db.Integer, nullable=False, default=0)
+    booked_minutes = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(Numeric(12, 2), nullable=False, default=0)
+    # Sessions booked that day and not cancelled since, and sessions
+    # cancelled that day, whatever day they were for
+    bookings = db.Column(db.Integer, nullable=False, default=0)
+    cancellations = db.Column(db.Integer, nullable=False, default=0)
+    # Reviews written that day
+    reviews = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_daily_tutor_rollups_tutor_day', 'tutor_id', 'day'),
+    )
+
+
+class RollupWatermark(db.Model):
+    """How far the rollup job has read each source."""
+    __tablename__ = "rollup_watermarks"
+    name = db.Column(db.String(50), primary_key=True)
+    change_seq = db.Column(db.BigInteger)
+    position = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+
+### Search Ranking ###
+class TutorCooccurrence(db.Model):
+    """
+    How many students booked both tutors; rebuilt by `flask ranking build`
+    (app/utils/ranking.py). Each pair is stored both ways round.
+    """
+    __tablename__ = "tutor_cooccurrence"
+    tutor_id = db.Column(UUID(as_uuid=True), db.ForeignKey('tutors.id', ondelete='CASCADE'), primary_key=True)
+    other_tutor_id = db.Column(UUID(as_uuid=True), db.ForeignKey('tutors.id', ondelete='CASCADE'), primary_key=True)
+    students = db.Column(db.Integer, nullable=False)
+
+
+def _write_tombstones(connection, entity, entity_id, user_ids, entity_day):
+    connection.execute(SyncTombstone.__table__.insert(), [
+        {"id": uuid.uuid4(), "user_id": user_id, "entity": entity, "entity_id": entity_id, "entity_day": entity_day}
+        for user_id in user_ids if user_id is not None
+    ])
+
+
+@event.listens_for(TimeSlot, 'after_delete')
+def _time_slot_deleted(mapper, connection, target):
+    # Slots are only synced to their tutor; students see sessions
+    tutor_user_id = connection.scalar(select(Tutor.user_id).where(Tutor.id == target.tutor_id))
+    _write_tombstones(connection, 'time_slot', target.id, [tutor_user_id], target.start_time.date())
+
+
+@event.listens_for(TutoringSession, 'after_delete')
+def _tutoring_session_deleted(mapper, connection, target):
+    _write_tombstones(connection, 'tutoring_session', target.id, [target.student_id, target.tutor_id],
+                      target.created_at.date() if target.created_at else None)
\ No newline at end of file
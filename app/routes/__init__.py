@@ -6,6 +6,11 @@ api_bp = Blueprint('api', __name__)
 # Import route files to register them
 from .user_routes import * # Import all routes from user_routes
 from .main_routes import main_routes  # Import the main_routes Blueprint
+from .internal_routes import internal_routes  # Import the internal_routes Blueprint
 from .admin_routes import * # Import all routes from admin_routes
 from .tutor_routes import * # Import all routes from tutor_routes
-from .student_routes import * # Import all routes from student_routes
\ No newline at end of file
+from .student_routes import * # Import all routes from student_routes
+from .review_routes import * # Import all routes from review_routes
+from .sync_routes import * # Import all routes from sync_routes
+from .event_routes import * # Import all routes from event_routes
+from .search_routes import * # Import all routes from search_routes
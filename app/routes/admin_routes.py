@@ -1,8 +1,18 @@
+import time
+from datetime import datetime, timedelta
 from uuid import UUID
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required
-from ..models import db, Subject, Class, User, Student, Tutor, TimeSlot
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import func, select
+from werkzeug.security import generate_password_hash
+from ..models import (
+    db, Subject, Class, User, Student, Tutor, TimeSlot, DailyTutorRollup, tutor_class_association
+)
 from ..utils.decorators import admin_required
+from ..utils.bulk_import import detect_format, parse_records, run_import
+from ..utils import cache, profiler, rollups, suggest
+from ..utils.pagination import limit_arg, window_args
+from ..utils.throttle import get_login_throttle
 from . import api_bp
 
 # --- Helper Functions ---
@@ -31,7 +41,7 @@ def create_user():
     data = request.get_json()
     
     # Validate required fields
-    required = ['email', 'password', 'first_name', 'last_name', 'account_type']
+    required = ['username', 'email', 'password', 'first_name', 'last_name', 'account_type']
     if missing := [f for f in required if f not in data]:
         return jsonify({"message": f"Missing fields: {', '.join(missing)}"}), 400
 
@@ -41,6 +51,7 @@ def create_user():
 
     # Create user
     user = User(
+        username=data['username'],
         email=data['email'],
         first_name=data['first_name'],
         last_name=data['last_name'],
@@ -51,13 +62,13 @@ def create_user():
     db.session.flush()  # Get user ID before commit
 
     # Create profile
-    if user.role == 'student':
+    if user.account_type == 'student':
         profile = Student(
             user_id=user.id,
             major=data.get('major', 'Undeclared'),
             year=data.get('year', 1)
         )
-    elif user.role == 'tutor':
+    elif user.account_type == 'tutor':
         profile = Tutor(
             user_id=user.id,
             hourly_rate=data.get('hourly_rate', 0.0),
@@ -66,8 +77,11 @@ def create_user():
         if 'classes' in data:  # Assign classes if provided
             profile.classes = Class.query.filter(Class.id.in_(data['classes'])).all()
     
-    if user.role in ('student', 'tutor'):
+    if user.account_type in ('student', 'tutor'):
         db.session.add(profile)
+    if user.account_type == 'tutor':
+        db.session.flush()  # Assigns profile.id
+        cache.invalidate_tutor(profile.id)
 
     db.session.commit()
     return jsonify({
@@ -139,6 +153,9 @@ def update_user(user_id):
         user.tutor_profile.bio = data.get('bio', user.tutor_profile.bio)
         if 'classes' in data:
             user.tutor_profile.classes = Class.query.filter(Class.id.in_(data['classes'])).all()
+    if user.tutor_profile:
+        cache.invalidate_tutor(user.tutor_profile.id)
+    cache.invalidate(cache.SEARCH)  # Role changes add or drop a tutor
 
     db.session.commit()
     return jsonify({"message": "User updated"}), 200
@@ -152,6 +169,8 @@ def create_subject():
     
     subject = Subject(name=name)
     db.session.add(subject)
+    db.session.flush()
+    suggest.catalog_changed(subject_ids=[subject.id])
     db.session.commit()
     return jsonify({
         "id": str(subject.id),
@@ -181,6 +200,8 @@ def create_class():
         subject_id=subject.id
     )
     db.session.add(class_)
+    db.session.flush()
+    suggest.catalog_changed(class_ids=[class_.id])
     db.session.commit()
     ##return jsonify({
     ##    "id": str(class_.id),
@@ -192,4 +213,204 @@ def create_class():
         "id": str(class_.id),
         "section": class_.section,
         "subject_id": str(subject.id)
-    }), 201
\ No newline at end of file
+    }), 201
+
+# --- Bulk Import ---
+class _HashesBusy(Exception):
+    pass
+
+def _import_hash(password):
+    """
+    Hashes one imported password under a login hash slot, so imports and
+    logins share LOGIN_MAX_CONCURRENT_HASHES; sleep(0) lets other greenlets
+    run between rows under gevent.
+    """
+    throttle = get_login_throttle()
+    lease = throttle.acquire_hash_slot()
+    if not lease:
+        raise _HashesBusy()
+    try:
+        return generate_password_hash(password)
+    finally:
+        throttle.release_hash_slot(lease)
+        time.sleep(0)
+
+@api_bp.route('/admin/import/<any(users, subjects, classes):kind>', methods=['POST'])
+@admin_required
+def bulk_import(kind):
+    """
+    Imports many records at once. Send the file as multipart field "file",
+    or the raw body as text/csv or application/x-ndjson. Valid rows are
+    inserted; the rest are reported by row number. User imports over
+    HTTP are capped at BULK_IMPORT_HTTP_MAX_USERS rows; `flask import`
+    takes larger files.
+    """
+    upload = request.files.get('file')
+    if upload:
+        fmt = detect_format(upload.mimetype, upload.filename)
+        raw = upload.read()
+    else:
+        fmt = detect_format(request.mimetype)
+        raw = request.get_data()
+    if not fmt:
+        return jsonify({"message": "Send CSV or NDJSON data"}), 415
+
+    try:
+        records = parse_records(raw.decode('utf-8-sig'), fmt)
+    except (UnicodeDecodeError, ValueError) as e:
+        return jsonify({"message": f"Could not parse input: {e}"}), 400
+    if not records:
+        return jsonify({"message": "No records to import"}), 400
+
+    max_users = current_app.config['BULK_IMPORT_HTTP_MAX_USERS']
+    if kind == 'users' and len(records) > max_users:
+        return jsonify({
+            "message": f"Imports over HTTP take at most {max_users} users; "
+                       f"run `flask import users <file>` for larger files"
+        }), 413
+
+    if kind == 'users':
+        cache.invalidate(cache.SEARCH)
+    else:
+        suggest.catalog_changed()
+    try:
+        result = run_import(kind, records, current_app.config, hash_password=_import_hash)
+    except _HashesBusy:
+        return jsonify({"message": "Server busy, try again shortly"}), 503, {"Retry-After": "1"}
+    return jsonify(result.to_dict()), 200
+
+# --- Analytics ---
+# Served from daily_tutor_rollups (see `flask rollups run`), never from
+# the raw tables, so cost depends on the date range, not on history size
+
+_ROLLUP_SUMS = {
+    name: func.sum(getattr(DailyTutorRollup, name)).label(name)
+    for name in rollups.METRICS
+}
+
+def _analytics_days():
+    """?from= / ?to= as an inclusive range of days; the last 30 by default."""
+    start, end = window_args()
+    last = end.date() if end else datetime.utcnow().date()
+    first = start.date() if start else last - timedelta(days=29)
+    if first > last:
+        raise ValueError("'from' is after 'to'")
+    if (last - first).days >= current_app.config['ANALYTICS_MAX_DAYS']:
+        raise ValueError(f"At most {current_app.config['ANALYTICS_MAX_DAYS']} days per report")
+    return first, last
+
+def _report(row):
+    """The summed rollup columns of a result row, plus the derived ratios."""
+    report = {name: getattr(row, name) or 0 for name in rollups.METRICS}
+    report['revenue'] = float(report['revenue'])
+    report['utilization'] = (round(report['booked_minutes'] / report['offered_minutes'], 4)
+                             if report['offered_minutes'] else None)
+    report['average_rating'] = round(report['rating_sum'] / report['reviews'], 2) if report['reviews'] else None
+    del report['rating_sum']
+    return report
+
+def _analytics_response(first, last, key, items):
+    as_of = rollups.as_of()
+    return jsonify({
+        "from": first.isoformat(),
+        "to": last.isoformat(),
+        "as_of": as_of.isoformat() if as_of else None,
+        key: items
+    }), 200
+
+@api_bp.route('/admin/analytics/daily', methods=['GET'])
+@admin_required
+def analytics_daily():
+    """Bookings, cancellations, utilization, revenue and ratings per day."""
+    try:
+        first, last = _analytics_days()
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    rows = db.session.execute(
+        select(DailyTutorRollup.day, *_ROLLUP_SUMS.values())
+        .where(DailyTutorRollup.day.between(first, last))
+        .group_by(DailyTutorRollup.day)
+        .order_by(DailyTutorRollup.day)
+    ).all()
+    return _analytics_response(first, last, "days", [
+        {"day": row.day.isoformat(), **_report(row)} for row in rows
+    ])
+
+@api_bp.route('/admin/analytics/tutors', methods=['GET'])
+@admin_required
+def analytics_tutors():
+    """Per-tutor totals over the range, ranked by ?sort= (revenue by default)."""
+    try:
+        first, last = _analytics_days()
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    sort = request.args.get('sort', 'revenue')
+    if sort not in ('revenue', 'bookings', 'cancellations', 'slots_booked', 'reviews'):
+        return jsonify({"message": f"Cannot sort by {sort}"}), 400
+    limit = limit_arg(default=20, maximum=200)
+
+    totals = (
+        select(DailyTutorRollup.tutor_id, *_ROLLUP_SUMS.values())
+        .where(DailyTutorRollup.day.between(first, last))
+        .group_by(DailyTutorRollup.tutor_id)
+        .order_by(_ROLLUP_SUMS[sort].desc(), DailyTutorRollup.tutor_id)
+        .limit(limit)
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(totals, User.first_name, User.last_name)
+        .join(Tutor, Tutor.id == totals.c.tutor_id)
+        .join(User, User.id == Tutor.user_id)
+        .order_by(totals.c[sort].desc(), totals.c.tutor_id)
+    ).all()
+    return _analytics_response(first, last, "tutors", [{
+        "tutor_id": str(row.tutor_id),
+        "name": f"{row.first_name} {row.last_name}",
+        **_report(row)
+    } for row in rows])
+
+@api_bp.route('/admin/analytics/subjects', methods=['GET'])
+@admin_required
+def analytics_subjects():
+    """
+    Totals over the range per subject, counting the activity of every tutor
+    who teaches it. Slots are not tied to a subject, so a tutor teaching
+    two subjects counts toward both.
+    """
+    try:
+        first, last = _analytics_days()
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    teaches = (
+        select(Class.subject_id, tutor_class_association.c.tutor_id)
+        .join(tutor_class_association, tutor_class_association.c.class_id == Class.id)
+        .distinct()
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(Subject.id, Subject.name, Subject.code, *_ROLLUP_SUMS.values())
+        .join(teaches, teaches.c.subject_id == Subject.id)
+        .join(DailyTutorRollup, DailyTutorRollup.tutor_id == teaches.c.tutor_id)
+        .where(DailyTutorRollup.day.between(first, last))
+        .group_by(Subject.id, Subject.name, Subject.code)
+        .order_by(_ROLLUP_SUMS['revenue'].desc(), Subject.name)
+    ).all()
+    return _analytics_response(first, last, "subjects", [{
+        "subject_id": str(row.id),
+        "name": row.name,
+        "code": row.code,
+        **_report(row)
+    } for row in rows])
+
+# --- Diagnostics ---
+@api_bp.route('/admin/profile-token', methods=['POST'])
+@admin_required
+def profile_token():
+    """Token for the X-Profile header: requests carrying it are profiled."""
+    return jsonify({
+        "header": profiler.HEADER,
+        "token": profiler.issue_token(current_app, get_jwt_identity()),
+        "expires_in": current_app.config['PROFILE_TOKEN_MAX_AGE']
+    }), 200
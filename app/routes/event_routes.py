@@ -0,0 +1,127 @@
+import json
+import queue
+import time
+from uuid import UUID
+from flask import request, jsonify, Response, current_app, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from ..models import db, tutor_class_association
+from ..utils.events import get_bus
+from ..utils.pagination import window_args
+from . import api_bp
+
+# Hour ranges of the availability buckets used by find_tutors
+AVAILABILITY_HOURS = {
+    'morning': (6, 12),
+    'afternoon': (12, 18),
+    'evening': (18, 24),
+}
+
+# ======================
+# Server-Sent Events
+# ======================
+
+def _stream_serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='event-stream')
+
+
+@api_bp.route('/events/token', methods=['POST'])
+@jwt_required()
+def create_stream_token():
+    """
+    A short-lived token that only opens event streams. EventSource cannot
+    send headers, so browsers put this in the stream URL (?token=) rather
+    than their access token, which would end up in proxy and server logs.
+    """
+    ttl = current_app.config['SSE_TOKEN_SECONDS']
+    token = _stream_serializer().dumps({"user_id": get_jwt_identity()})
+    return jsonify({"token": token, "expires_in": ttl}), 200
+
+
+@api_bp.route('/events/slots', methods=['GET'])
+def stream_slot_events():
+    """
+    Streams slot changes (created, booked, cancelled, deleted) as SSE.
+    Authenticate with a stream token (?token=, from POST /api/events/token)
+    or an Authorization header. Subscribe to one tutor with ?tutor_id=, or
+    to a search with any of ?class_id=, ?availability= and ?from=/?to=.
+    The stream closes after SSE_MAX_STREAM_SECONDS and the browser
+    reconnects on its own; once the token has expired that reconnect is
+    refused, and the client fetches a new token.
+    """
+    if token := request.args.get('token'):
+        try:
+            _stream_serializer().loads(token, max_age=current_app.config['SSE_TOKEN_SECONDS'])
+        except SignatureExpired:
+            return jsonify({"error": "Stream token expired"}), 401
+        except BadSignature:
+            return jsonify({"error": "Invalid stream token"}), 401
+    else:
+        verify_jwt_in_request(locations=['headers'])
+
+    tutor_ids = None
+    if tutor_id := request.args.get('tutor_id'):
+        tutor_ids = {tutor_id}
+    elif class_id := request.args.get('class_id'):
+        try:
+            class_id = UUID(class_id)
+        except ValueError:
+            return jsonify({"error": "Invalid class_id"}), 400
+        rows = db.session.query(tutor_class_association.c.tutor_id).filter(
+            tutor_class_association.c.class_id == class_id
+        ).all()
+        tutor_ids = {str(row.tutor_id) for row in rows}
+
+    availability = request.args.get('availability')
+    if availability and availability not in AVAILABILITY_HOURS:
+        return jsonify({"error": "Invalid availability"}), 400
+    hours = AVAILABILITY_HOURS.get(availability)
+
+    try:
+        window_start, window_end = window_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Don't hold a pooled connection for the lifetime of the stream
+    db.session.remove()
+
+    def matches(event):
+        if not event['type'].startswith('slot.'):
+            return False  # The bus also carries search directory updates
+        if tutor_ids is not None and event['tutor_id'] not in tutor_ids:
+            return False
+        start = event['start_time']
+        if hours and not hours[0] <= int(start[11:13]) < hours[1]:
+            return False
+        if window_start and start < window_start.isoformat():
+            return False
+        if window_end and start >= window_end.isoformat():
+            return False
+        return True
+
+    config = current_app.config
+    keepalive = config.get('SSE_KEEPALIVE_SECONDS', 15)
+    max_duration = config.get('SSE_MAX_STREAM_SECONDS', 300)
+    retry_ms = config.get('SSE_RETRY_MS', 3000)
+    bus = get_bus()
+
+    def stream():
+        subscriber = bus.subscribe()
+        try:
+            yield f"retry: {retry_ms}\n\n"
+            deadline = time.monotonic() + max_duration
+            while time.monotonic() < deadline:
+                try:
+                    event = subscriber.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if matches(event):
+                    yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            bus.unsubscribe(subscriber)
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
@@ -0,0 +1,60 @@
+from flask import Blueprint, jsonify, Response
+from ..utils.decorators import internal_only
+from ..utils.pool_metrics import pool_stats
+from ..utils.cache import get_cache
+from ..utils.coalesce import get_single_flight
+from ..utils.admission import get_admission
+from ..utils.slow_queries import get_slow_query_recorder
+from ..utils.tracing import get_tracer
+from ..utils.directory import get_directory
+from ..utils.suggest import get_suggest_index
+from ..utils.metrics import get_metrics, render
+
+# Create a Blueprint for operator-only routes (metrics, diagnostics)
+internal_routes = Blueprint('internal_routes', __name__)
+
+@internal_routes.route('/internal/pool', methods=['GET'])
+@internal_only
+def get_pool_metrics():
+    return jsonify(pool_stats()), 200
+
+@internal_routes.route('/internal/cache', methods=['GET'])
+@internal_only
+def get_cache_metrics():
+    return jsonify(get_cache().stats()), 200
+
+@internal_routes.route('/internal/coalescing', methods=['GET'])
+@internal_only
+def get_coalescing_metrics():
+    return jsonify(get_single_flight().stats()), 200
+
+@internal_routes.route('/internal/admission', methods=['GET'])
+@internal_only
+def get_admission_metrics():
+    return jsonify(get_admission().stats()), 200
+
+@internal_routes.route('/internal/slow-queries', methods=['GET'])
+@internal_only
+def get_slow_query_metrics():
+    return jsonify(get_slow_query_recorder().stats()), 200
+
+@internal_routes.route('/internal/tracing', methods=['GET'])
+@internal_only
+def get_tracing_metrics():
+    return jsonify(get_tracer().exporter.stats()), 200
+
+@internal_routes.route('/internal/directory', methods=['GET'])
+@internal_only
+def get_directory_metrics():
+    return jsonify(get_directory().stats()), 200
+
+@internal_routes.route('/internal/suggest', methods=['GET'])
+@internal_only
+def get_suggest_metrics():
+    return jsonify(get_suggest_index().stats()), 200
+
+@internal_routes.route('/metrics', methods=['GET'])
+@internal_only
+def get_prometheus_metrics():
+    body = render(get_metrics().collect())
+    return Response(body, content_type='text/plain; version=0.0.4; charset=utf-8')
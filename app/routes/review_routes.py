@@ -2,15 +2,26 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from datetime import datetime
 from ..models import db, User, Tutor, Student, Class, Subject, TimeSlot, Review
-from ..utils.decorators import tutor_required, student_required, role_required
+from ..utils.decorators import student_required
+from ..utils import cache
 from . import api_bp
 
 @api_bp.route('/students/sessions/<uuid:session_id>/reviews', methods=['POST'])
 @student_required
 def create_review(session_id):
-    student_id = get_jwt_identity()
     data = request.get_json()
+
+    # bool is an int subclass: JSON true would pass as a rating of 1
+    rating = data.get('rating')
+    if isinstance(rating, bool) or not isinstance(rating, int) or not 1 <= rating <= 5:
+        return jsonify({"message": "Rating must be an integer from 1 to 5"}), 400
     
+    # Slots and reviews point at the student profile, not the user
+    student = Student.query.filter_by(user_id=get_jwt_identity()).first()
+    if not student:
+        return jsonify({"message": "Student profile not found"}), 404
+    student_id = student.id
+
     # Verify session exists and belongs to this student
     session = TimeSlot.query.filter_by(
         id=session_id,
@@ -29,11 +40,13 @@ def create_review(session_id):
         tutor_id=session.tutor_id,
         student_id=student_id,
         timeslot_id=session_id,
-        rating=data['rating'],
+        rating=rating,
         comment=data.get('comment', '')
     )
     
     db.session.add(review)
+    Tutor.record_review(session.tutor_id, rating)
+    cache.invalidate_tutor(session.tutor_id)
     db.session.commit()
     
     return jsonify({
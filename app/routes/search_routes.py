@@ -0,0 +1,18 @@
+from flask import request, jsonify
+from flask_jwt_extended import jwt_required
+from ..utils.pagination import limit_arg
+from ..utils.suggest import get_suggest_index, DEFAULT_LIMIT, MAX_LIMIT
+from . import api_bp
+
+
+@api_bp.route('/search/suggest', methods=['GET'])
+@jwt_required()
+def suggest():
+    """
+    Typeahead for the search box: tutors (by name or username), subjects
+    (by name or code) and class sections starting with ?q=, any word of
+    them included. Served from memory, so it can run on every keystroke.
+    """
+    text = request.args.get('q', '')
+    suggestions = get_suggest_index().suggest(text, limit_arg(DEFAULT_LIMIT, MAX_LIMIT))
+    return jsonify({"query": text, "suggestions": suggestions}), 200
@@ -1,89 +1,121 @@
-from flask import Blueprint, request, jsonify
+import logging
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
-from datetime import datetime
-from ..models import TutoringSession, db, User, Tutor, Student, Class, Subject, TimeSlot, Review
+from datetime import datetime, timedelta
+from uuid import UUID
+from ..models import (
+    TutoringSession, db, User, Tutor, Student, Class, Subject, TimeSlot, AvailabilityRule
+)
 from ..utils.decorators import student_required
+from ..utils import events, cache, search, ranking
+from ..utils.events import slot_event
+from ..utils.matching import find_matches
+from ..utils.coalesce import coalesced
+from ..utils.directory import get_directory
+from ..utils.recurrence import (
+    parse_virtual_slot_id, materialize, active_rules, virtual_slots, expansion_window
+)
+from ..utils.pagination import (
+    encode_cursor, decode_time_cursor, limit_arg, window_args, after_cursor, paged_response, parse_datetime
+)
 from . import api_bp
 from sqlalchemy import func
-from sqlalchemy.orm import aliased
 
-@api_bp.route('/student/tutors', methods=['GET'])
-@student_required
-def find_tutors():
-    availability = request.args.get('availability')
-    min_rating = request.args.get('min_rating', type=float)
-    search_query = request.args.get('query')  # Search term: class name or tutor name
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 10, type=int)
+logger = logging.getLogger(__name__)
 
-    # Start base query from Tutor, join User relationship
-    query = db.session.query(Tutor).join(Tutor.user)
 
-    # Create an alias for the Class table to avoid the duplicate alias issue
-    class_alias = aliased(Class)
+def _search_audience():
+    # Explicit sorts don't depend on who is asking, so all students share
+    # them; the recommended order is the student's own
+    return get_jwt_identity() if ranking.personalized(request.args) else None
 
-    # Filter by search term (first name, last name, username, or class section)
-    if search_query:
-        query = query.outerjoin(Tutor.classes).filter(
-            (User.username.ilike(f'%{search_query}%')) |
-            (User.first_name.ilike(f'%{search_query}%')) |
-            (User.last_name.ilike(f'%{search_query}%')) |
-            (Class.section.ilike(f'%{search_query}%'))
-        )
 
-    # Filter by availability
-    if availability:
-        now = datetime.utcnow()
-        if availability == 'morning':
-            start_hour, end_hour = 6, 12
-        elif availability == 'afternoon':
-            start_hour, end_hour = 12, 18
-        elif availability == 'evening':
-            start_hour, end_hour = 18, 24
-        else:
-            start_hour, end_hour = 0, 24
+@api_bp.route('/student/tutors', methods=['GET'])
+@student_required
+@coalesced(vary=_search_audience)
+def find_tutors():
+    response_cache = cache.get_cache()
+    key = response_cache.key([cache.SEARCH], 'find_tutors', cache.args_key(request.args), _search_audience())
+    cached = response_cache.get(key)
+    if cached is not None:
+        return jsonify(cached), 200
 
-        query = query.join(Tutor.availability).filter(
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = request.args.get('per_page', 10, type=int)
+    if per_page < 1:
+        per_page = 20  # What paginate() falls back to
+    with_facets = request.args.get('facets', 'true').lower() != 'false'
+    ranker = ranking.get_ranking().ranker(get_jwt_identity()) if ranking.personalized(request.args) else None
+
+    directory = get_directory()
+    if directory.enabled:
+        # Filter, count and sort in memory; only the page comes from the database
+        try:
+            tutor_ids, total, facets = directory.search(request.args, page, per_page, with_facets, ranker)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        by_id = {t.id: t for t in Tutor.query.options(db.joinedload(Tutor.user))
+                 .filter(Tutor.id.in_(tutor_ids))} if tutor_ids else {}
+        tutors = [by_id[tutor_id] for tutor_id in tutor_ids if tutor_id in by_id]
+    else:
+        try:
+            filters = search.tutor_filters(request.args)
+            order = search.sort_order(request.args) if ranker is None else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Every filter is an EXISTS or a column test, so no DISTINCT is needed
+        if ranker is None:
+            query = (db.session.query(Tutor).join(Tutor.user).options(db.contains_eager(Tutor.user))
+                     .filter(*filters.values()).order_by(*order))
+            pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+            tutors, total = pagination.items, pagination.total
+        else:
+            # Score every match from its columns, then load the page
+            rows = db.session.execute(
+                db.select(Tutor.id, Tutor.hourly_rate, Tutor.average_rating, Tutor.review_count)
+                .join(Tutor.user).where(*filters.values())
+            ).all()
+            ids, rates, ratings, reviews = zip(*rows) if rows else ((), (), (), ())
+            tutor_ids = ranker.rank(ids, [float(r) for r in rates], [float(a) for a in ratings], reviews,
+                                    limit=page * per_page)[(page - 1) * per_page:]
+            total = len(rows)
+            by_id = {t.id: t for t in Tutor.query.options(db.joinedload(Tutor.user))
+                     .filter(Tutor.id.in_(tutor_ids))} if tutor_ids else {}
+            tutors = [by_id[tutor_id] for tutor_id in tutor_ids if tutor_id in by_id]
+        facets = search.facet_counts(filters) if with_facets else None
+
+    # The next open slots of every tutor on the page, and the upcoming
+    # occurrences of their recurring rules, in one query each
+    page_ids = [t.id for t in tutors]
+    upcoming = {}
+    if page_ids:
+        position = func.row_number().over(partition_by=TimeSlot.tutor_id,
+                                          order_by=(TimeSlot.start_time, TimeSlot.id)).label('position')
+        numbered = db.select(TimeSlot.id, position).where(
+            TimeSlot.tutor_id.in_(page_ids),
             TimeSlot.status == 'available',
-            TimeSlot.start_time > now,
-            func.extract('hour', TimeSlot.start_time).between(start_hour, end_hour)
-        )
-
-    # Filter by minimum rating using subquery
-    if min_rating is not None:
-        rating_subquery = db.session.query(
-            Review.tutor_id,
-            func.avg(Review.rating).label('avg_rating')
-        ).group_by(Review.tutor_id).subquery()
-
-        query = query.join(rating_subquery, Tutor.id == rating_subquery.c.tutor_id).filter(
-            rating_subquery.c.avg_rating >= min_rating
-        )
-
-    # Paginate results
-    query = query.distinct()
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
-    tutors = pagination.items
+            TimeSlot.start_time > datetime.utcnow()
+        ).subquery()
+        for slot in TimeSlot.query.join(numbered, numbered.c.id == TimeSlot.id).filter(numbered.c.position <= 3):
+            upcoming.setdefault(slot.tutor_id, []).append(slot)
+    expand_start, expand_end = expansion_window()
+    recurring_slots = {}
+    for v in virtual_slots(active_rules(page_ids, expand_start, expand_end), expand_start, expand_end):
+        recurring_slots.setdefault(v.tutor_id, []).append(v)
 
     # Prepare response
     response = []
     for t in tutors:
-        avg_rating = db.session.query(func.avg(Review.rating)).filter(
-            Review.tutor_id == t.id
-        ).scalar() or 0
-
-        upcoming_slots = TimeSlot.query.filter(
-            TimeSlot.tutor_id == t.id,
-            TimeSlot.status == 'available',
-            TimeSlot.start_time > datetime.utcnow()
-        ).order_by(TimeSlot.start_time).limit(3).all()
+        upcoming_slots = sorted(upcoming.get(t.id, []) + recurring_slots.get(t.id, [])[:3],
+                                key=lambda s: s.start_time)[:3]
 
         response.append({
             "id": str(t.user.id),
             "name": f"{t.user.first_name} {t.user.last_name}",
             "hourly_rate": float(t.hourly_rate),
             "bio": t.bio,
-            "average_rating": round(float(avg_rating), 2),
+            "average_rating": t.calculate_average_rating(),
             "upcoming_slots": [
                 {
                     "id": str(slot.id),
@@ -94,18 +126,94 @@ def find_tutors():
             ]
         })
 
-    return jsonify({
+    result = {
         "tutors": response,
-        "total": pagination.total,
-        "page": pagination.page,
-        "per_page": pagination.per_page
-    }), 200
+        "total": total,
+        "page": page,
+        "per_page": per_page
+    }
+    if facets is not None:
+        result["facets"] = facets
+    response_cache.set(key, result, current_app.config['CACHE_SEARCH_TTL'])
+    return jsonify(result), 200
+
+
+# Bounds on a match request, so one call stays interactive
+MATCH_MAX_WINDOWS = 50
+MATCH_MAX_SPAN = timedelta(days=31)
+
+
+@api_bp.route('/student/match', methods=['POST'])
+@student_required
+def match_tutors():
+    """
+    Ranks tutor/slot pairs for a student's free time.
+    Body: {"windows": [{"start": ISO, "end": ISO}, ...], "class_id" or
+    "subject_id", optional "max_rate", "min_minutes" (30) and "limit" (20).
+    """
+    data = request.get_json() or {}
+
+    try:
+        windows = [
+            (parse_datetime(w['start']), parse_datetime(w['end']))
+            for w in data.get('windows') or []
+        ]
+        class_id = UUID(data['class_id']) if data.get('class_id') else None
+        subject_id = UUID(data['subject_id']) if data.get('subject_id') else None
+        max_rate = float(data['max_rate']) if data.get('max_rate') is not None else None
+        min_minutes = int(data.get('min_minutes', 30))
+        limit = max(1, min(int(data.get('limit', 20)), 100))
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid match request: {e}"}), 400
+
+    if not windows:
+        return jsonify({"error": "At least one time window is required"}), 400
+    if len(windows) > MATCH_MAX_WINDOWS:
+        return jsonify({"error": f"At most {MATCH_MAX_WINDOWS} windows are allowed"}), 400
+    if any(end <= start for start, end in windows):
+        return jsonify({"error": "Each window must end after it starts"}), 400
+    if max(end for _, end in windows) - min(start for start, _ in windows) > MATCH_MAX_SPAN:
+        return jsonify({"error": f"Windows must fall within {MATCH_MAX_SPAN.days} days"}), 400
+    if not (class_id or subject_id):
+        return jsonify({"error": "class_id or subject_id is required"}), 400
+
+    matches = find_matches(
+        windows, class_id=class_id, subject_id=subject_id, max_rate=max_rate,
+        min_overlap=timedelta(minutes=max(min_minutes, 1)), limit=limit
+    )
+
+    # Names for the tutors that made the cut, in one query
+    tutor_ids = {m.candidate.tutor_id for m in matches}
+    users = {
+        tutor_id: user for tutor_id, user in
+        db.session.query(Tutor.id, User).join(Tutor.user).filter(Tutor.id.in_(tutor_ids))
+    } if tutor_ids else {}
+
+    response = []
+    for m in matches:
+        user = users[m.candidate.tutor_id]
+        response.append({
+            "slot_id": str(m.candidate.slot_id),
+            "start_time": m.candidate.start.isoformat(),
+            "end_time": m.candidate.end.isoformat(),
+            "overlap_start": m.overlap_start.isoformat(),
+            "overlap_end": m.overlap_end.isoformat(),
+            "score": m.score,
+            "tutor": {
+                "id": str(user.id),
+                "name": f"{user.first_name} {user.last_name}",
+                "hourly_rate": float(m.candidate.hourly_rate),
+                "average_rating": float(m.candidate.average_rating),
+                "review_count": m.candidate.review_count
+            }
+        })
+
+    return jsonify({"matches": response}), 200
 
 
 @api_bp.route('/student/sessions', methods=['POST'])
 @student_required
 def book_session():
-    print("Reached book_session route")
     user_id = get_jwt_identity()
 
     # Fetch student profile by user_id
@@ -119,7 +227,17 @@ def book_session():
     if not slot_id:
         return jsonify({"error": "Timeslot ID is required"}), 400
 
-    slot = TimeSlot.query.filter_by(id=slot_id, status='available').first()
+    # An occurrence of a recurring rule only becomes a TimeSlot row now
+    try:
+        occurrence = parse_virtual_slot_id(slot_id)
+    except ValueError:
+        return jsonify({"error": "Invalid timeslot ID"}), 400
+    if occurrence:
+        slot = materialize(*occurrence)
+        if slot and slot.status != 'available':
+            slot = None
+    else:
+        slot = TimeSlot.query.filter_by(id=slot_id, status='available').first()
     if not slot:
         return jsonify({"message": "Timeslot not available"}), 400
 
@@ -144,6 +262,9 @@ def book_session():
         slot.status = 'booked'
         slot.student_id = student.id
         ##slot.class_id = data.get('class_id')  # Optional
+        events.publish(slot_event('booked', slot))
+        cache.invalidate_tutor(slot.tutor_id)
+        search.refresh_next_available(slot.tutor_id)
 
         db.session.commit()
 
@@ -155,6 +276,7 @@ def book_session():
 
     except Exception as e:
         db.session.rollback()
+        logger.exception("Booking failed", extra={"slot_id": slot_id})
         return jsonify({"error": str(e)}), 500
 
 
@@ -163,9 +285,16 @@ def book_session():
 def get_booked_sessions_student():
     user_id = get_jwt_identity()
 
+    try:
+        window_start, window_end = window_args()
+        cursor = decode_time_cursor(request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    limit = limit_arg(default=50, maximum=200)
+
     try:
         # Get the student's TutoringSession entries
-        sessions = db.session.query(
+        query = db.session.query(
             TutoringSession,
             TimeSlot,
             User  # Tutor's User info
@@ -174,12 +303,29 @@ def get_booked_sessions_student():
         ).join(
             User, TutoringSession.tutor_id == User.id
         ).filter(
+            # Booked slots carry the student's profile id: this walks
+            # ix_time_slots_student_start in page order
+            TimeSlot.student_id == db.select(Student.id).where(Student.user_id == user_id).scalar_subquery(),
             TutoringSession.student_id == user_id
-        ).order_by(TimeSlot.start_time.desc()).all()
+        )
+
+        if window_start:
+            query = query.filter(TimeSlot.start_time >= window_start)
+        if window_end:
+            query = query.filter(TimeSlot.start_time < window_end)
+        if cursor:
+            query = query.filter(after_cursor(TimeSlot.start_time, TimeSlot.id, cursor, descending=True))
+
+        sessions = query.order_by(TimeSlot.start_time.desc(), TimeSlot.id.desc()).limit(limit + 1).all()
+
+        next_cursor = None
+        if len(sessions) > limit:
+            last_slot = sessions[limit - 1][1]
+            next_cursor = encode_cursor(last_slot.start_time, last_slot.id)
 
         # Build response list
         result = []
-        for session, slot, tutor_user in sessions:
+        for session, slot, tutor_user in sessions[:limit]:
             result.append({
                 "session_id": str(session.id),
                 "start_time": slot.start_time.isoformat(),
@@ -192,8 +338,7 @@ def get_booked_sessions_student():
                 }
             })
 
-        return jsonify(result), 200
+        return paged_response(result, next_cursor), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    
\ No newline at end of file
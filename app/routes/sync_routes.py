@@ -0,0 +1,303 @@
+from datetime import datetime, timedelta
+from uuid import UUID
+from flask import request, jsonify, Response, url_for, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from itsdangerous import URLSafeSerializer, BadSignature
+from sqlalchemy import func, literal, select, union, union_all
+from sqlalchemy.orm import aliased
+from ..models import db, User, Tutor, Student, TimeSlot, TutoringSession, SyncTombstone
+from ..utils.pagination import encode_cursor, decode_cursor, limit_arg
+from . import api_bp
+
+# How far back the iCalendar feed reaches
+CALENDAR_PAST_DAYS = 30
+
+# ======================
+# Delta Sync
+# ======================
+
+@api_bp.route('/sync', methods=['GET'])
+@jwt_required()
+def sync_changes():
+    """
+    Returns the caller's slots (tutors) and sessions changed since ?token=,
+    plus deletions. Without a token the first call returns everything.
+    Keep calling with the returned sync_token while has_more is true.
+    """
+    user_id = UUID(get_jwt_identity())
+    try:
+        since = _decode_sync_token(request.args.get('token'))
+    except ValueError:
+        return jsonify({"error": "Invalid sync token"}), 400
+    limit = limit_arg(default=200, maximum=1000)
+
+    role = get_jwt().get('account_type')
+    tutor = Tutor.query.filter_by(user_id=user_id).first() if role == 'tutor' else None
+
+    def group_of(seq):
+        return [item for source in _fetch_changes(user_id, role, tutor, seq - 1, through=seq) for item in source]
+
+    settled_before = datetime.utcnow() - timedelta(seconds=current_app.config['SYNC_SETTLE_SECONDS'])
+    changes, has_more = _merge_changes(
+        _fetch_changes(user_id, role, tutor, since, limit + 1), limit, settled_before, group_of)
+
+    result = {"slots": [], "sessions": [], "deleted": []}
+    for _, _, kind, item in changes:
+        result[kind].append(item)
+    if not tutor:
+        del result["slots"]
+
+    high_water = changes[-1][0] if changes else since
+    result["sync_token"] = encode_cursor(high_water)
+    result["has_more"] = has_more
+    return jsonify(result), 200
+
+
+def _decode_sync_token(token):
+    values = decode_cursor(token)
+    if not values:
+        return 0
+    try:
+        return int(values[0])
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid sync token") from e
+
+
+def _fetch_changes(user_id, role, tutor, since, limit=None, through=None):
+    """
+    The caller's changes with since < change_seq (<= through), as one list
+    per source of (seq, changed_at, kind, item) in change order, each
+    holding at most limit rows.
+    """
+    def window(query, seq):
+        query = query.filter(seq > since)
+        if through is not None:
+            query = query.filter(seq <= through)
+        query = query.order_by(seq)
+        return query.limit(limit) if limit is not None else query
+
+    sources = []
+    if tutor:
+        slots = window(TimeSlot.query.filter(TimeSlot.tutor_id == tutor.id), TimeSlot.change_seq).all()
+        sources.append([(s.change_seq, s.updated_at, 'slots', _slot_to_dict(s)) for s in slots])
+
+    sources.append([
+        (seq, changed_at, 'sessions', _session_to_dict(session, slot, other, role))
+        for session, slot, other, seq, changed_at in _session_changes(user_id, role, since, window)
+    ])
+
+    tombstones = window(SyncTombstone.query.filter(SyncTombstone.user_id == user_id), SyncTombstone.change_seq).all()
+    sources.append([
+        (t.change_seq, t.deleted_at, 'deleted', {"type": t.entity, "id": str(t.entity_id)}) for t in tombstones
+    ])
+    return sources
+
+
+def _owned(user_id, role):
+    """
+    (condition on TutoringSession, condition on TimeSlot) selecting the
+    user's sessions and the booked slots behind them. Slots point at the
+    tutor's or student's profile, sessions at the user row.
+    """
+    if role == 'tutor':
+        profile = select(Tutor.id).where(Tutor.user_id == user_id).scalar_subquery()
+        return TutoringSession.tutor_id == user_id, TimeSlot.tutor_id == profile
+    profile = select(Student.id).where(Student.user_id == user_id).scalar_subquery()
+    return TutoringSession.student_id == user_id, TimeSlot.student_id == profile
+
+
+def _session_changes(user_id, role, since, window):
+    """Sessions that changed themselves or whose slot changed, in change order."""
+    other_user = aliased(User)
+    seq = func.greatest(TutoringSession.change_seq, TimeSlot.change_seq)
+    changed_at = func.greatest(TutoringSession.updated_at, TimeSlot.updated_at, type_=db.DateTime)
+    own_session, own_slot = _owned(user_id, role)
+
+    # One range scan per (owner, change_seq) index; a greatest() over both
+    # tables could use neither and would read the user's whole history
+    changed = union(
+        select(TutoringSession.id).where(own_session, TutoringSession.change_seq > since),
+        select(TutoringSession.id).join(TimeSlot, TutoringSession.timeslot_id == TimeSlot.id)
+        .where(own_slot, TimeSlot.change_seq > since, own_session),
+    ).subquery()
+
+    query = db.session.query(TutoringSession, TimeSlot, other_user, seq.label('seq'), changed_at.label('changed_at'))\
+        .join(TimeSlot, TutoringSession.timeslot_id == TimeSlot.id)\
+        .filter(own_session, TutoringSession.id.in_(select(changed.c.id)))
+
+    if role == 'tutor':
+        query = query.join(other_user, TutoringSession.student_id == other_user.id)
+    else:
+        query = query.join(other_user, TutoringSession.tutor_id == other_user.id)
+
+    return window(query, seq).all()
+
+
+def _merge_changes(sources, limit, settled_before, group_of):
+    """
+    Merges the per-source change lists and cuts one page.
+
+    Nothing from the first change made after settled_before on is served:
+    a transaction that drew a lower change_seq may still commit, and a
+    sync token past it would skip that change for good. A page that would
+    end inside a group of changes sharing one sequence number takes the
+    whole group, from group_of(seq), since the per-source lists may hold
+    only part of it.
+    """
+    merged = sorted((item for source in sources for item in source), key=lambda item: item[0])
+    fresh = next((seq for seq, changed_at, _, _ in merged
+                  if changed_at is not None and changed_at > settled_before), None)
+    if fresh is not None:
+        merged = [item for item in merged if item[0] < fresh]
+    if len(merged) <= limit:
+        return merged, False
+
+    boundary = merged[limit][0]
+    if merged[limit - 1][0] != boundary:
+        return merged[:limit], True
+    return [item for item in merged if item[0] < boundary] + group_of(boundary), True
+
+
+def _slot_to_dict(slot):
+    return {
+        "id": str(slot.id),
+        "start_time": slot.start_time.isoformat(),
+        "end_time": slot.end_time.isoformat(),
+        "status": slot.status,
+        "updated_at": slot.updated_at.isoformat() if slot.updated_at else None
+    }
+
+
+def _session_to_dict(session, slot, other_user, role):
+    return {
+        "session_id": str(session.id),
+        "slot_id": str(slot.id),
+        "start_time": slot.start_time.isoformat(),
+        "end_time": slot.end_time.isoformat(),
+        "status": slot.status,
+        ("student" if role == 'tutor' else "tutor"): {
+            "id": str(other_user.id),
+            "first_name": other_user.first_name,
+            "last_name": other_user.last_name,
+        }
+    }
+
+
+def _change_fingerprint(user_id, role, settled_before):
+    """
+    The latest change of each source this user's sync feed covers, read
+    off the top of its (owner, change_seq) index, as one string; or None
+    while the newest of them is younger than settled_before. Until then a
+    transaction that drew a lower number may still commit without moving
+    any maximum, so the fingerprint can't yet stand for the calendar.
+    """
+    own_session, own_slot = _owned(user_id, role)
+
+    def latest(seq, changed_at, *conditions):
+        return select(seq.label('seq'), changed_at.label('changed_at'))\
+            .where(*conditions).order_by(seq.desc()).limit(1).subquery()
+
+    marks = [
+        latest(SyncTombstone.change_seq, SyncTombstone.deleted_at, SyncTombstone.user_id == user_id),
+        latest(TutoringSession.change_seq, TutoringSession.updated_at, own_session),
+        latest(TimeSlot.change_seq, TimeSlot.updated_at, own_slot),
+    ]
+    latest_seq = {}
+    for source, seq, changed_at in db.session.execute(union_all(*(
+            select(literal(i).label('source'), mark.c.seq, mark.c.changed_at) for i, mark in enumerate(marks)))):
+        if changed_at is not None and changed_at > settled_before:
+            return None
+        latest_seq[source] = seq
+    return '.'.join(str(latest_seq.get(i, 0)) for i in range(len(marks)))
+
+# ======================
+# iCalendar Feed
+# ======================
+
+def _feed_serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='calendar-feed')
+
+
+@api_bp.route('/calendar/feed', methods=['GET'])
+@jwt_required()
+def get_calendar_feed_url():
+    # Calendar apps can't send a bearer token, so the feed URL carries a signed one
+    token = _feed_serializer().dumps({"user_id": get_jwt_identity()})
+    return jsonify({"url": url_for('api.get_calendar_feed', token=token, _external=True)}), 200
+
+
+@api_bp.route('/calendar/<token>.ics', methods=['GET'])
+def get_calendar_feed(token):
+    try:
+        user_id = UUID(_feed_serializer().loads(token)['user_id'])
+    except (BadSignature, KeyError, TypeError, ValueError):
+        return jsonify({"error": "Calendar feed not found"}), 404
+
+    user = db.session.get(User, user_id)
+    if not user:
+        return jsonify({"error": "Calendar feed not found"}), 404
+
+    # The change fingerprint only moves when something in this calendar
+    # changed, so it doubles as the ETag: unchanged polls cost one query.
+    # Without one (a change still settling) the feed is sent untagged.
+    settled_before = datetime.utcnow() - timedelta(seconds=current_app.config['SYNC_SETTLE_SECONDS'])
+    fingerprint = _change_fingerprint(user.id, user.account_type, settled_before)
+    etag = f"{user.id}-{fingerprint}" if fingerprint else None
+    if etag and request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    sessions = db.session.query(TutoringSession, TimeSlot, User)\
+        .join(TimeSlot, TutoringSession.timeslot_id == TimeSlot.id)
+    if user.account_type == 'tutor':
+        sessions = sessions.join(User, TutoringSession.student_id == User.id)\
+            .filter(TutoringSession.tutor_id == user.id)
+    else:
+        sessions = sessions.join(User, TutoringSession.tutor_id == User.id)\
+            .filter(TutoringSession.student_id == user.id)
+    sessions = sessions.filter(
+        TimeSlot.start_time >= datetime.utcnow() - timedelta(days=CALENDAR_PAST_DAYS)
+    ).order_by(TimeSlot.start_time).all()
+
+    response = Response(_render_calendar(sessions), mimetype='text/calendar')
+    if etag:
+        response.set_etag(etag)
+    last_modified = max((max(s.updated_at or s.created_at, slot.updated_at or s.created_at)
+                         for s, slot, _ in sessions), default=None)
+    if last_modified:
+        response.last_modified = last_modified
+    return response
+
+
+def _render_calendar(sessions):
+    stamp = _ics_time(datetime.utcnow())
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//TutorMatch//Sessions//EN",
+        "CALSCALE:GREGORIAN",
+        "X-WR-CALNAME:TutorMatch Sessions",
+    ]
+    for session, slot, other_user in sessions:
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:{session.id}@tutormatch",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART:{_ics_time(slot.start_time)}",
+            f"DTEND:{_ics_time(slot.end_time)}",
+            f"SUMMARY:{_ics_text(f'Tutoring session with {other_user.first_name} {other_user.last_name}')}",
+            "STATUS:CONFIRMED",
+            "END:VEVENT",
+        ]
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(lines) + "\r\n"
+
+
+def _ics_time(value):
+    # Times are stored as naive UTC
+    return value.strftime("%Y%m%dT%H%M%SZ")
+
+
+def _ics_text(value):
+    return value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
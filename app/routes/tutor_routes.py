@@ -1,12 +1,27 @@
-from flask import Blueprint, request, jsonify
+import logging
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
-from datetime import datetime
-from ..models import TutoringSession, db, User, Tutor, Student, Class, Subject, TimeSlot, Review
+import heapq
+from datetime import datetime, date, time, timedelta
+from ..models import (
+    TutoringSession, db, User, Tutor, Student, Class, Subject, TimeSlot, Review,
+    AvailabilityRule, AvailabilityException
+)
 from ..utils.decorators import tutor_required, admin_required
+from ..utils import events, cache, search
+from ..utils.events import slot_event
+from ..utils.recurrence import (
+    VirtualSlot, active_rules, virtual_slots, virtual_slot_id, expansion_window, parse_virtual_slot_id
+)
+from ..utils.pagination import (
+    encode_cursor, decode_time_cursor, limit_arg, window_args, after_cursor, paged_response
+)
 from . import api_bp
 from sqlalchemy.orm import aliased
 from uuid import UUID
 
+logger = logging.getLogger(__name__)
+
 
 # --- Tutor Routes ---
 @api_bp.route('/tutor/availability', methods=['POST']) # Time wasted debuggin esta vaina -> 14.5 hours
@@ -41,6 +56,10 @@ def create_availability():
     )
     
     db.session.add(slot)
+    db.session.flush()  # Assigns slot.id for the event
+    events.publish(slot_event('created', slot))
+    cache.invalidate_tutor(tutor.id)
+    search.refresh_next_available(tutor.id)
     db.session.commit()
     
     return jsonify({
@@ -60,18 +79,24 @@ def get_tutor_availability():
     if not tutor:
         return jsonify({"error": "Tutor profile not found"}), 404
 
-    slots = TimeSlot.query.filter_by(tutor_id=tutor.id).order_by(TimeSlot.start_time).all()
+    try:
+        window_start, window_end = window_args()
+        cursor = decode_time_cursor(request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    return jsonify([{
-        "id": str(s.id),
-        "start_time": s.start_time.isoformat(),
-        "end_time": s.end_time.isoformat(),
-        "status": s.status,
-        "student": {
-            "name": f"{s.student.user.first_name} {s.student.user.last_name}",
-            "major": s.student.major
-        } if s.student else None
-    } for s in slots]), 200
+    query = _slot_listing_query(tutor.id, window_start, window_end, cursor)
+
+    # Unbooked occurrences of recurring rules, merged in by start time
+    expand_from = window_start
+    if cursor and (expand_from is None or cursor[0] > expand_from):
+        expand_from = cursor[0]
+    expand_start, expand_end = expansion_window(expand_from, window_end)
+    virtual = virtual_slots(active_rules([tutor.id], expand_start, expand_end), expand_start, expand_end)
+    if cursor:
+        virtual = [v for v in virtual if (v.start_time, v.rule_id) > cursor]
+
+    return _slot_listing_response(query, limit_arg(default=50, maximum=200), virtual)
 
 @api_bp.route('/tutor/availability/<slot_id>', methods=['DELETE'])
 @tutor_required
@@ -83,16 +108,136 @@ def delete_availability(slot_id):
     if not tutor:
         return jsonify({"error": "Tutor profile not found"}), 404
 
+    # Deleting one occurrence of a recurring rule skips just that occurrence
+    try:
+        occurrence = parse_virtual_slot_id(slot_id)
+    except ValueError:
+        return jsonify({"error": "Slot not found or not authorized to delete"}), 404
+    if occurrence:
+        rule_id, start = occurrence
+        rule = AvailabilityRule.query.filter_by(id=rule_id, tutor_id=tutor.id).first()
+        if not rule or not any(rule.occurrences(start, start + timedelta(microseconds=1))):
+            return jsonify({"error": "Slot not found or not authorized to delete"}), 404
+        if TimeSlot.query.filter_by(rule_id=rule.id, start_time=start).first():
+            # Booked once already: it is a concrete slot, listed under its own id
+            return jsonify({"error": "This occurrence is a concrete slot; delete it by its id"}), 409
+        rule.exceptions.append(AvailabilityException(date=start.date(), start_time=start))
+        events.publish(slot_event('deleted', VirtualSlot(
+            virtual_slot_id(rule.id, start), tutor.id, rule.id, start, start + timedelta(minutes=rule.slot_minutes), 'available', None)))
+        cache.invalidate_tutor(tutor.id)
+        search.refresh_next_available(tutor.id)
+        db.session.commit()
+        return jsonify({"message": "Slot deleted"}), 200
+
     # Ensure the slot belongs to the logged-in tutor
     slot = TimeSlot.query.filter_by(id=slot_id, tutor_id=tutor.id).first()
     if not slot:
         return jsonify({"error": "Slot not found or not authorized to delete"}), 404
 
+    # A materialized occurrence is skipped too, or the rule would list it again
+    if slot.rule_id:
+        db.session.add(AvailabilityException(
+            rule_id=slot.rule_id, date=slot.start_time.date(), start_time=slot.start_time))
+    events.publish(slot_event('deleted', slot))
+    cache.invalidate_tutor(tutor.id)
+    search.refresh_next_available(tutor.id)
     db.session.delete(slot)
     db.session.commit()
 
     return jsonify({"message": "Slot deleted"}), 200
 
+# --- Recurring Availability ---
+@api_bp.route('/tutor/availability/rules', methods=['POST'])
+@tutor_required
+def create_availability_rule():
+    """
+    Body: {"weekday": 0-6 (Monday = 0), "start_time": "HH:MM", "end_time": "HH:MM",
+    optional "slot_minutes" (60), "valid_from" (today), "valid_until", "exceptions": [dates]}.
+    Times are UTC.
+    """
+    tutor = Tutor.query.filter_by(user_id=get_jwt_identity()).first()
+    if not tutor:
+        return jsonify({"error": "Tutor profile not found"}), 404
+
+    data = request.get_json() or {}
+    try:
+        weekday = int(data['weekday'])
+        start_time = time.fromisoformat(data['start_time'])
+        end_time = time.fromisoformat(data['end_time'])
+        slot_minutes = int(data.get('slot_minutes', 60))
+        valid_from = date.fromisoformat(data['valid_from']) if data.get('valid_from') else datetime.utcnow().date()
+        valid_until = date.fromisoformat(data['valid_until']) if data.get('valid_until') else None
+        exception_dates = {date.fromisoformat(d) for d in data.get('exceptions') or []}
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid rule: {str(e)}"}), 400
+
+    if not 0 <= weekday <= 6:
+        return jsonify({"error": "weekday must be 0 (Monday) to 6 (Sunday)"}), 400
+    if start_time >= end_time:
+        return jsonify({"error": "End time must be after start time"}), 400
+    if not 15 <= slot_minutes <= 8 * 60:
+        return jsonify({"error": "slot_minutes must be between 15 and 480"}), 400
+    if valid_until and valid_until < valid_from:
+        return jsonify({"error": "valid_until must not be before valid_from"}), 400
+
+    rule = AvailabilityRule(
+        tutor_id=tutor.id,
+        weekday=weekday,
+        start_time=start_time,
+        end_time=end_time,
+        slot_minutes=slot_minutes,
+        valid_from=valid_from,
+        valid_until=valid_until,
+        exceptions=[AvailabilityException(date=d) for d in exception_dates]
+    )
+    db.session.add(rule)
+    db.session.flush()  # Assigns rule.id for the occurrence ids
+    _publish_occurrences('created', rule)
+    cache.invalidate_tutor(tutor.id)
+    search.refresh_next_available(tutor.id)
+    db.session.commit()
+    return jsonify(rule.to_dict()), 201
+
+@api_bp.route('/tutor/availability/rules', methods=['GET'])
+@tutor_required
+def get_availability_rules():
+    tutor = Tutor.query.filter_by(user_id=get_jwt_identity()).first()
+    if not tutor:
+        return jsonify({"error": "Tutor profile not found"}), 404
+
+    rules = AvailabilityRule.query.options(db.selectinload(AvailabilityRule.exceptions))\
+        .filter_by(tutor_id=tutor.id)\
+        .order_by(AvailabilityRule.weekday, AvailabilityRule.start_time).all()
+    return jsonify([rule.to_dict() for rule in rules]), 200
+
+@api_bp.route('/tutor/availability/rules/<uuid:rule_id>', methods=['DELETE'])
+@tutor_required
+def delete_availability_rule(rule_id):
+    # Booked occurrences are concrete TimeSlots and stay
+    tutor = Tutor.query.filter_by(user_id=get_jwt_identity()).first()
+    if not tutor:
+        return jsonify({"error": "Tutor profile not found"}), 404
+
+    rule = AvailabilityRule.query.filter_by(id=rule_id, tutor_id=tutor.id).first()
+    if not rule:
+        return jsonify({"error": "Rule not found"}), 404
+
+    _publish_occurrences('deleted', rule)
+    TimeSlot.query.filter_by(rule_id=rule.id).update({TimeSlot.rule_id: None})
+    db.session.delete(rule)
+    cache.invalidate_tutor(tutor.id)
+    search.refresh_next_available(tutor.id)
+    db.session.commit()
+    return jsonify({"message": "Rule deleted"}), 200
+
+def _publish_occurrences(kind, rule):
+    """
+    Slot events for the rule's unbooked occurrences in the default expansion
+    window, the ones listings show; later ones are seen when listed.
+    """
+    for occurrence in virtual_slots([rule], *expansion_window()):
+        events.publish(slot_event(kind, occurrence))
+
 @api_bp.route('/tutor/sessions', methods=['GET'])
 @tutor_required
 def get_tutor_sessions():
@@ -102,7 +247,13 @@ def get_tutor_sessions():
     if not tutor:
         return jsonify({"error": "Tutor profile not found"}), 404
 
-    query = TimeSlot.query.filter_by(tutor_id=tutor.id)
+    try:
+        window_start, window_end = window_args()
+        cursor = decode_time_cursor(request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    query = _slot_listing_query(tutor.id, window_start, window_end, cursor)
 
     status_filter = request.args.get('status', 'upcoming')
 
@@ -111,28 +262,87 @@ def get_tutor_sessions():
     elif status_filter == 'completed':
         query = query.filter(TimeSlot.end_time < datetime.utcnow())
 
-    sessions = query.order_by(TimeSlot.start_time).all()
-
-    return jsonify([{
+    # Class info removed since TimeSlot has no class_ref
+    return _slot_listing_response(query, limit_arg(default=50, maximum=200))
+
+
+def _slot_listing_query(tutor_id, window_start, window_end, cursor):
+    """
+    A tutor's slots with the booked student's name and major joined in,
+    ordered by (start_time, id) so the window and cursor are index range scans.
+    """
+    query = db.session.query(
+        TimeSlot, Student.major, User.first_name, User.last_name
+    ).outerjoin(
+        Student, TimeSlot.student_id == Student.id
+    ).outerjoin(
+        User, Student.user_id == User.id
+    ).filter(TimeSlot.tutor_id == tutor_id)
+
+    if window_start:
+        query = query.filter(TimeSlot.start_time >= window_start)
+    if window_end:
+        query = query.filter(TimeSlot.start_time < window_end)
+    if cursor:
+        query = query.filter(after_cursor(TimeSlot.start_time, TimeSlot.id, cursor))
+
+    return query.order_by(TimeSlot.start_time, TimeSlot.id)
+
+
+def _listing_key(row):
+    # Virtual slots sort by rule id within a start time, so one (time, uuid)
+    # cursor pages through both kinds
+    slot = row[0]
+    return slot.start_time, slot.rule_id if isinstance(slot, VirtualSlot) else slot.id
+
+
+def _slot_listing_response(query, limit, virtual=()):
+    rows = query.limit(limit + 1).all()
+    if virtual:
+        rows = list(heapq.merge(rows, [(v, None, None, None) for v in virtual], key=_listing_key))[:limit + 1]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(*_listing_key(rows[limit - 1]))
+
+    return paged_response([{
         "id": str(s.id),
         "start_time": s.start_time.isoformat(),
         "end_time": s.end_time.isoformat(),
         "status": s.status,
         "student": {
-            "name": f"{s.student.user.first_name} {s.student.user.last_name}",
-            "major": s.student.major
-        } if s.student else None,
-        # Class info removed since TimeSlot has no class_ref
-    } for s in sessions]), 200
+            "name": f"{first_name} {last_name}",
+            "major": major
+        } if s.student_id and first_name is not None else None
+    } for s, major, first_name, last_name in rows[:limit]], next_cursor), 200
 
 
 @api_bp.route('/<uuid:tutor_id>', methods=['GET'])
 def get_tutor_profile(tutor_id):
+    response_cache = cache.get_cache()
+    key = response_cache.key([f'tutor:{tutor_id}'], 'profile', tutor_id, cache.args_key(request.args))
+    data = response_cache.get(key)
+    if data is not None:
+        return jsonify(data), 200
+
+    # Header comes from a single row: review stats are stored on the tutor
     tutor = Tutor.query.get_or_404(tutor_id)
     
     include_reviews = request.args.get('reviews', 'false').lower() == 'true'
+    data = tutor.to_dict(include_reviews=include_reviews)
+
+    if include_reviews:
+        # Newest reviews first, one page at a time (?limit=, ?cursor=)
+        try:
+            cursor = decode_time_cursor(request.args.get('cursor'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        reviews, last_key = Review.page_for_tutor(tutor.id, limit_arg(), cursor)
+        data["reviews"] = reviews
+        data["next_cursor"] = encode_cursor(*last_key) if last_key else None
     
-    return jsonify(tutor.to_dict(include_reviews=include_reviews)), 200
+    response_cache.set(key, data, current_app.config['CACHE_PROFILE_TTL'])
+    return jsonify(data), 200
 
 @api_bp.route('/tutor/<uuid:tutor_id>/classes', methods=['POST'])
 @tutor_required
@@ -153,6 +363,7 @@ def associate_tutor_with_classes(tutor_id):
             if class_instance and class_instance not in tutor.classes:
                 tutor.classes.append(class_instance)
 
+        cache.invalidate_tutor(tutor.id)
         db.session.commit()
         return jsonify({"message": "Tutor successfully associated with classes"}), 200
 
@@ -190,11 +401,18 @@ def get_tutor_by_user_id(user_id):
 def get_booked_sessions_tutor():
     user_id = get_jwt_identity()
 
+    try:
+        window_start, window_end = window_args()
+        cursor = decode_time_cursor(request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    limit = limit_arg(default=50, maximum=200)
+
     try:
         # Aliases for clarity
         student_user = aliased(User)
 
-        sessions = db.session.query(
+        query = db.session.query(
             TutoringSession,
             TimeSlot,
             student_user
@@ -205,11 +423,28 @@ def get_booked_sessions_tutor():
         ).join(
             student_user, student_user.id == Student.user_id
         ).filter(
+            # Booked slots only: this walks ix_time_slots_tutor_booked_start in page order
+            TimeSlot.tutor_id == db.select(Tutor.id).where(Tutor.user_id == user_id).scalar_subquery(),
+            TimeSlot.student_id.isnot(None),
             TutoringSession.tutor_id == user_id
-        ).order_by(TimeSlot.start_time.desc()).all()
+        )
+
+        if window_start:
+            query = query.filter(TimeSlot.start_time >= window_start)
+        if window_end:
+            query = query.filter(TimeSlot.start_time < window_end)
+        if cursor:
+            query = query.filter(after_cursor(TimeSlot.start_time, TimeSlot.id, cursor, descending=True))
+
+        sessions = query.order_by(TimeSlot.start_time.desc(), TimeSlot.id.desc()).limit(limit + 1).all()
+
+        next_cursor = None
+        if len(sessions) > limit:
+            last_slot = sessions[limit - 1][1]
+            next_cursor = encode_cursor(last_slot.start_time, last_slot.id)
 
         result = []
-        for session, slot, user in sessions:
+        for session, slot, user in sessions[:limit]:
             result.append({
                 "session_id": str(session.id),
                 "start_time": slot.start_time.isoformat(),
@@ -222,7 +457,7 @@ def get_booked_sessions_tutor():
                 }
             })
 
-        return jsonify(result), 200
+        return paged_response(result, next_cursor), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -237,7 +472,6 @@ def delete_tutoring_session(session_id):
     try:
         # Fetch the session using the session_id
         session = TutoringSession.query.filter_by(id=session_id).first()
-        print(f"Session fetched: {session}")  # Log the session object
 
         if not session:
             return jsonify({"error": "Session not found."}), 404
@@ -251,6 +485,9 @@ def delete_tutoring_session(session_id):
         if timeslot:
             timeslot.status = 'available'
             timeslot.student_id = None  # Unassign student
+            events.publish(slot_event('cancelled', timeslot))
+            cache.invalidate_tutor(timeslot.tutor_id)
+            search.refresh_next_available(timeslot.tutor_id)
 
         # Delete the session
         db.session.delete(session)
@@ -260,6 +497,7 @@ def delete_tutoring_session(session_id):
 
     except Exception as e:
         db.session.rollback()
+        logger.exception("Cancelling session failed", extra={"session_id": session_id})
         return jsonify({"error": str(e)}), 500
 
 
@@ -1,3 +1,5 @@
+import logging
+import math
 from datetime import datetime
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import (
@@ -10,10 +12,15 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from ..models import Class, User, Student, Tutor, Subject
 from ..extensions import db, jwt
 from ..utils.decorators import tutor_required, student_required, account_type_required
+from ..utils.throttle import get_login_throttle
+from ..utils import cache
+from ..utils.coalesce import coalesced
 import uuid
 
 api_bp = Blueprint('api', __name__)
 
+logger = logging.getLogger(__name__)
+
 # Token blacklist (consider using Redis in production)
 blacklist = set()
 
@@ -54,6 +61,10 @@ def register():
                 # Add other tutor-specific fields
             )
             db.session.add(tutor)
+            db.session.flush()  # Assigns tutor.id
+            # A new tutor can show up in any cached search page; naming it
+            # lets the directories load just this tutor
+            cache.invalidate_tutor(tutor.id)
             '''
             # Handle class associations
             class_ids = data.get('classes', [])  # Optional field
@@ -77,7 +88,7 @@ def register():
 
     except Exception as e:
         db.session.rollback()
-        print("Registration error:", e)
+        logger.exception("Registration failed")
         return jsonify({"error": str(e)}), 400
 
 @api_bp.route('/login', methods=['POST'])
@@ -86,10 +97,6 @@ def login():
     username_or_email = data.get('username_or_email')  # Match JSON key exactly
     password = data.get('password')
 
-    print("📥 Login attempt:")
-    print("→ Email/Username:", username_or_email)
-    print("→ Password:", password)
-
     if not username_or_email or not password:
         return jsonify({"message": "Username / email and password are required"}), 400
 
@@ -98,10 +105,29 @@ def login():
         (User.email == username_or_email)
     ).first()
 
+    # Throttle by user id, so a username and an email of one user share
+    # their limits; names that match nobody are throttled as typed
+    throttle = get_login_throttle()
+    ip = request.remote_addr
+    account = str(user.id) if user else f"unknown:{username_or_email.strip().lower()}"
+    if retry_after := throttle.check(account, ip):
+        return _too_many_attempts(retry_after)
+
     if not user:
+        throttle.record_failure(account, ip)
         return jsonify({"message": "Invalid credentials"}), 401
 
-    if user and user.check_password(password):
+    # Cap concurrent hash checks instead of queuing KDF work without limit
+    lease = throttle.acquire_hash_slot()
+    if not lease:
+        return _too_many_attempts(1)
+    try:
+        password_ok = user.check_password(password)
+    finally:
+        throttle.release_hash_slot(lease)
+
+    if password_ok:
+        throttle.record_success(account, ip)
         access_token = create_access_token(
             identity=str(user.id),
             additional_claims={"account_type": user.account_type}
@@ -112,8 +138,16 @@ def login():
             account_type=user.account_type
         ), 200
 
+    throttle.record_failure(account, ip)
     return jsonify({"message": "Invalid credentials"}), 401
 
+def _too_many_attempts(retry_after):
+    retry_after = max(1, math.ceil(retry_after))
+    return jsonify({
+        "message": "Too many login attempts, try again later",
+        "retry_after": retry_after
+    }), 429, {"Retry-After": str(retry_after)}
+
 @api_bp.route('/logout', methods=['POST'])
 @jwt_required()
 def logout():
@@ -192,6 +226,8 @@ def update_profile():
                 user.tutor_profile.hourly_rate = float(data['hourly_rate'])
             if 'bio' in data:
                 user.tutor_profile.bio = data['bio']
+            if user.tutor_profile:
+                cache.invalidate_tutor(user.tutor_profile.id)
 
         db.session.commit()
         return jsonify({"message": "Profile updated successfully"}), 200
@@ -202,6 +238,7 @@ def update_profile():
 
 @api_bp.route('/classes', methods=['GET'])
 @jwt_required()
+@coalesced(vary='none')
 def get_classes():
     classes = Class.query.options(db.joinedload(Class.subject)).all()
     
@@ -222,7 +259,6 @@ def get_classes():
 @jwt.token_in_blocklist_loader
 def check_if_token_revoked(jwt_header, jwt_payload):
     jti = jwt_payload['jti']  # Get the JWT ID
-    print("Checking if token is revoked:", jti)  # Debugging
     return jti in blacklist   # Check if the JWT ID is in the blacklist
 
 # Checks JWT claims
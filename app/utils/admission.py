@@ -0,0 +1,147 @@
+import threading
+from flask import current_app, g, jsonify, request
+from app.extensions import db
+
+# Priority classes, most important first. A class is shed once the load
+# level reaches its SHED_AT entry; CRITICAL is never shed.
+CRITICAL, HIGH, NORMAL, LOW = 'critical', 'high', 'normal', 'low'
+SHED_AT = {LOW: 1, NORMAL: 2, HIGH: 3}
+
+# Endpoints that need no database, or that hold a request open for its
+# whole lifetime, are neither counted nor shed
+EXEMPT_ENDPOINTS = {
+    'main_routes.home',
+    'api.stream_slot_events',
+    'static',
+}
+EXEMPT_BLUEPRINTS = {'internal_routes'}
+
+ROUTE_PRIORITIES = {
+    # Bookings and cancellations: the reason the service exists
+    'api.book_session': CRITICAL,
+    'api.delete_tutoring_session': CRITICAL,
+    'api.login': HIGH,
+    # Discovery
+    'api.find_tutors': NORMAL,
+    'api.match_tutors': NORMAL,
+    'api.get_classes': NORMAL,
+    'api.get_tutor_profile': NORMAL,
+    # Admin listings and bulk work
+    'api.get_users': LOW,
+    'api.bulk_import': LOW,
+}
+
+
+def route_priority(endpoint, method, path):
+    if endpoint in ROUTE_PRIORITIES:
+        return ROUTE_PRIORITIES[endpoint]
+    if path.startswith('/api/admin/'):
+        return LOW
+    return NORMAL if method in ('GET', 'HEAD') else HIGH
+
+
+class AdmissionController:
+    """
+    Per-worker admission control. The load level comes from requests in
+    flight in this worker and from the database pool: the decaying average
+    of checkout waits, and whether every connection is taken. Low-priority
+    requests are turned away with 503 + Retry-After before they queue for
+    a connection, so bookings keep theirs when Postgres slows down.
+    """
+
+    def __init__(self, config):
+        options = config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        self.pool_capacity = options.get('pool_size', 5) + options.get('max_overflow', 10)
+        self.max_in_flight = config['ADMISSION_MAX_IN_FLIGHT'] or self.pool_capacity * 4
+        self.wait_elevated = config['ADMISSION_WAIT_ELEVATED_SECONDS']
+        self.wait_severe = config['ADMISSION_WAIT_SEVERE_SECONDS']
+        self.retry_after = config['ADMISSION_RETRY_AFTER_SECONDS']
+        self.enabled = config['ADMISSION_ENABLED']
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.admitted = {p: 0 for p in (CRITICAL, HIGH, NORMAL, LOW)}
+        self.shed = {p: 0 for p in (CRITICAL, HIGH, NORMAL, LOW)}
+
+    def _pool_pressure(self):
+        # Replicas only serve reads; the primary is what bookings wait on
+        pool = db.engine.pool
+        metrics = getattr(pool, 'metrics', None)
+        if metrics is None:
+            return 0.0, False
+        exhausted = pool.checkedout() >= self.pool_capacity
+        return metrics.recent_wait(), exhausted
+
+    def level(self):
+        """0 = normal, 1 = elevated, 2 = severe, 3 = overloaded."""
+        wait, exhausted = self._pool_pressure()
+        in_flight = self.in_flight
+        if in_flight >= self.max_in_flight:
+            return 3
+        if wait >= self.wait_severe or exhausted or in_flight >= self.max_in_flight * 3 // 4:
+            return 2
+        if wait >= self.wait_elevated or in_flight >= self.max_in_flight // 2:
+            return 1
+        return 0
+
+    def admit(self, priority):
+        """Returns 0 to admit the request, else the load level it was shed at."""
+        level = self.level() if self.enabled else 0
+        with self._lock:
+            if priority in SHED_AT and level >= SHED_AT[priority]:
+                self.shed[priority] += 1
+                return level
+            self.admitted[priority] += 1
+            self.in_flight += 1
+        return 0
+
+    def release(self):
+        with self._lock:
+            self.in_flight = max(self.in_flight - 1, 0)
+
+    def stats(self):
+        wait, exhausted = self._pool_pressure()
+        return {
+            "enabled": self.enabled,
+            "level": self.level(),
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "pool_recent_wait_ms": round(wait * 1000, 3),
+            "pool_exhausted": exhausted,
+            "admitted": self.admitted,
+            "shed": self.shed
+        }
+
+
+def get_admission():
+    return current_app.extensions['admission']
+
+
+def _before_request():
+    endpoint = request.endpoint
+    if endpoint is None or endpoint in EXEMPT_ENDPOINTS or request.blueprint in EXEMPT_BLUEPRINTS:
+        return None
+    if request.method == 'OPTIONS':
+        return None  # CORS preflight never touches the database
+
+    controller = get_admission()
+    priority = route_priority(endpoint, request.method, request.path)
+    level = controller.admit(priority)
+    if level:
+        response = jsonify({"error": "Server busy, please try again shortly"})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(controller.retry_after * level)
+        return response
+    g.admission_counted = True
+    return None
+
+
+def _teardown_request(exc):
+    if g.pop('admission_counted', False):
+        get_admission().release()
+
+
+def init_app(app):
+    """Registers the hooks; call before any other before_request hook that does real work."""
+    app.extensions['admission'] = AdmissionController(app.config)
+    app.before_request(_before_request)
+    app.teardown_request(_teardown_request)
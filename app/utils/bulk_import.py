@@ -0,0 +1,373 @@
+import csv
+import io
+import json
+import multiprocessing
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import insert, select, or_, tuple_
+from werkzeug.security import generate_password_hash
+from app.models import db, User, Student, Tutor, Subject, Class, tutor_class_association
+
+ACCOUNT_TYPES = ('student', 'tutor', 'admin')
+USER_REQUIRED = ('username', 'email', 'password', 'first_name', 'last_name', 'account_type')
+USER_TEXT = USER_REQUIRED + ('major', 'bio')
+
+
+class ImportResult:
+    def __init__(self):
+        self.inserted = 0
+        self.errors = []
+
+    def error(self, row, *messages):
+        self.errors.append({"row": row, "errors": list(messages)})
+
+    def to_dict(self):
+        return {
+            "inserted": self.inserted,
+            "failed": len(self.errors),
+            "errors": sorted(self.errors, key=lambda e: e["row"])
+        }
+
+
+# --- Parsing ---
+def parse_records(text, fmt):
+    """Parses CSV (with a header row) or NDJSON into a list of dicts."""
+    if fmt == 'csv':
+        return [
+            {k.strip(): (v.strip() if isinstance(v, str) else v) for k, v in row.items() if k}
+            for row in csv.DictReader(io.StringIO(text))
+        ]
+    if fmt == 'ndjson':
+        records = []
+        for line_no, line in enumerate(text.splitlines(), start=1):
+            if line.strip():
+                try:
+                    records.append(json.loads(line))
+                except ValueError as e:
+                    raise ValueError(f"Line {line_no}: invalid JSON ({e})") from e
+        return records
+    raise ValueError(f"Unsupported format: {fmt}")
+
+
+def detect_format(content_type=None, filename=None):
+    if filename:
+        if filename.endswith('.csv'):
+            return 'csv'
+        if filename.endswith(('.ndjson', '.jsonl')):
+            return 'ndjson'
+    if content_type:
+        if 'csv' in content_type:
+            return 'csv'
+        if 'ndjson' in content_type or 'jsonl' in content_type:
+            return 'ndjson'
+    return None
+
+
+def _type_errors(record, text=(), lists=()):
+    """
+    Errors for a record that isn't an object, or whose text fields aren't
+    strings or list fields aren't strings or lists of strings. NDJSON can
+    carry any JSON value; CSV rows are always dicts of strings.
+    """
+    if not isinstance(record, dict):
+        return ["Record must be a JSON object"]
+    errors = [f"Invalid {field}: must be a string"
+              for field in text if record.get(field) is not None and not isinstance(record[field], str)]
+    for field in lists:
+        value = record.get(field)
+        if value is not None and not (
+                isinstance(value, str) or isinstance(value, list) and all(isinstance(v, str) for v in value)):
+            errors.append(f"Invalid {field}: must be a list of IDs")
+    return errors
+
+
+def _split_list(value):
+    if value is None or value == '':
+        return []
+    if isinstance(value, list):
+        return value
+    return [v.strip() for v in str(value).split(';') if v.strip()]
+
+
+def _hash_passwords(passwords, workers, hash_password=None):
+    # KDF work is CPU bound: `flask import` spreads it across processes.
+    # spawn keeps the children clear of state inherited through fork. Web
+    # requests hash in-process (workers=1): a pool inside a gevent worker
+    # blocks its hub while spawning and is left behind if the request dies.
+    if workers <= 1 or len(passwords) < 64:
+        return list(map(hash_password or generate_password_hash, passwords))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return list(pool.map(generate_password_hash, passwords, chunksize=64))
+
+
+def _insert_batched(table, rows, batch_size):
+    # executemany with insertmanyvalues: multi-row INSERT ... VALUES batches
+    for i in range(0, len(rows), batch_size):
+        db.session.execute(insert(table), rows[i:i + batch_size])
+
+
+# --- Users ---
+def import_users(records, hash_workers=1, batch_size=1000, hash_password=None):
+    """
+    Creates users with their student/tutor profiles and class links.
+    hash_password, if given, hashes each password outside a process pool.
+    """
+    result = ImportResult()
+    valid = []
+    seen_emails, seen_usernames = set(), set()
+
+    for row_no, record in enumerate(records, start=1):
+        errors = _type_errors(record, USER_TEXT, lists=('classes',))
+        if errors:
+            result.error(row_no, *errors)
+            continue
+        errors = [f"Missing field: {f}" for f in USER_REQUIRED if not record.get(f)]
+        if record.get('account_type') and record['account_type'] not in ACCOUNT_TYPES:
+            errors.append(f"Invalid account_type: {record['account_type']}")
+        if record.get('account_type') == 'tutor':
+            try:
+                float(record.get('hourly_rate') or 0)
+            except (TypeError, ValueError):
+                errors.append("Invalid hourly_rate")
+        if record.get('year'):
+            try:
+                int(record['year'])
+            except (TypeError, ValueError):
+                errors.append("Invalid year")
+        if record.get('email') in seen_emails:
+            errors.append("Duplicate email in import")
+        if record.get('username') in seen_usernames:
+            errors.append("Duplicate username in import")
+        if errors:
+            result.error(row_no, *errors)
+            continue
+        seen_emails.add(record['email'])
+        seen_usernames.add(record['username'])
+        valid.append((row_no, record))
+
+    # One set-based uniqueness check against the existing users
+    taken_emails, taken_usernames = set(), set()
+    if valid:
+        for email, username in db.session.execute(
+            select(User.email, User.username).where(or_(
+                User.email.in_(seen_emails), User.username.in_(seen_usernames)
+            ))
+        ):
+            taken_emails.add(email)
+            taken_usernames.add(username)
+
+    # ...and one for every class ID referenced
+    class_ids = {c for _, r in valid for c in _split_list(r.get('classes'))}
+    known_classes = set()
+    if class_ids:
+        wanted = {uuid.UUID(str(c)) for c in class_ids if _is_uuid(c)}
+        known_classes = {str(c) for c in db.session.scalars(select(Class.id).where(Class.id.in_(wanted)))}
+
+    accepted = []
+    for row_no, record in valid:
+        errors = []
+        if record['email'] in taken_emails:
+            errors.append("Email already exists")
+        if record['username'] in taken_usernames:
+            errors.append("Username already exists")
+        unknown = [c for c in _split_list(record.get('classes')) if str(c) not in known_classes]
+        if unknown:
+            errors.append(f"Unknown class IDs: {', '.join(map(str, unknown))}")
+        if errors:
+            result.error(row_no, *errors)
+        else:
+            accepted.append(record)
+
+    hashes = _hash_passwords([r['password'] for r in accepted], hash_workers, hash_password)
+
+    users, students, tutors, links = [], [], [], []
+    for record, password_hash in zip(accepted, hashes):
+        user_id = uuid.uuid4()
+        users.append({
+            "id": user_id,
+            "username": record['username'],
+            "email": record['email'],
+            "first_name": record['first_name'],
+            "last_name": record['last_name'],
+            "account_type": record['account_type'],
+            "password": password_hash
+        })
+        if record['account_type'] == 'student':
+            students.append({
+                "id": uuid.uuid4(),
+                "user_id": user_id,
+                "major": record.get('major') or 'Undeclared',
+                "year": int(record['year']) if record.get('year') else 1
+            })
+        elif record['account_type'] == 'tutor':
+            tutor_id = uuid.uuid4()
+            tutors.append({
+                "id": tutor_id,
+                "user_id": user_id,
+                "hourly_rate": float(record.get('hourly_rate') or 0),
+                "bio": record.get('bio') or ''
+            })
+            links += [{"tutor_id": tutor_id, "class_id": uuid.UUID(str(c))}
+                      for c in dict.fromkeys(_split_list(record.get('classes')))]
+
+    _insert_batched(User, users, batch_size)
+    _insert_batched(Student, students, batch_size)
+    _insert_batched(Tutor, tutors, batch_size)
+    _insert_batched(tutor_class_association, links, batch_size)
+    result.inserted = len(users)
+    return result
+
+
+def _is_uuid(value):
+    try:
+        uuid.UUID(str(value))
+        return True
+    except ValueError:
+        return False
+
+
+# --- Subjects ---
+def import_subjects(records, batch_size=1000):
+    result = ImportResult()
+    valid = []
+    seen_names, seen_codes = set(), set()
+
+    for row_no, record in enumerate(records, start=1):
+        errors = _type_errors(record, ('name', 'code'))
+        if errors:
+            result.error(row_no, *errors)
+            continue
+        name, code = record.get('name'), record.get('code') or None
+        if not name:
+            errors.append("Missing field: name")
+        if name in seen_names:
+            errors.append("Duplicate name in import")
+        if code and code in seen_codes:
+            errors.append("Duplicate code in import")
+        if errors:
+            result.error(row_no, *errors)
+            continue
+        seen_names.add(name)
+        if code:
+            seen_codes.add(code)
+        valid.append((row_no, name, code))
+
+    taken_names, taken_codes = set(), set()
+    if valid:
+        for name, code in db.session.execute(
+            select(Subject.name, Subject.code).where(or_(
+                Subject.name.in_(seen_names), Subject.code.in_(seen_codes)
+            ))
+        ):
+            taken_names.add(name)
+            taken_codes.add(code)
+
+    rows = []
+    for row_no, name, code in valid:
+        errors = []
+        if name in taken_names:
+            errors.append("Subject name already exists")
+        if code and code in taken_codes:
+            errors.append("Subject code already exists")
+        if errors:
+            result.error(row_no, *errors)
+        else:
+            rows.append({"id": uuid.uuid4(), "name": name, "code": code})
+
+    _insert_batched(Subject, rows, batch_size)
+    result.inserted = len(rows)
+    return result
+
+
+# --- Classes ---
+def import_classes(records, batch_size=1000):
+    """Rows name their subject by subject_id or subject_code, plus a section."""
+    result = ImportResult()
+    valid = []
+    for row_no, record in enumerate(records, start=1):
+        errors = _type_errors(record, ('section', 'subject_id', 'subject_code'))
+        if errors:
+            result.error(row_no, *errors)
+            continue
+        if not record.get('section'):
+            errors.append("Missing field: section")
+        if not (record.get('subject_id') or record.get('subject_code')):
+            errors.append("Missing field: subject_id or subject_code")
+        if record.get('subject_id') and not _is_uuid(record['subject_id']):
+            errors.append("Invalid subject_id")
+        if errors:
+            result.error(row_no, *errors)
+        else:
+            valid.append((row_no, record))
+
+    # Resolve every referenced subject in one query
+    ids = {uuid.UUID(str(r['subject_id'])) for _, r in valid if r.get('subject_id')}
+    codes = {r['subject_code'] for _, r in valid if r.get('subject_code') and not r.get('subject_id')}
+    subject_ids, subject_by_code = set(), {}
+    if ids or codes:
+        for subject_id, code in db.session.execute(
+            select(Subject.id, Subject.code).where(or_(Subject.id.in_(ids), Subject.code.in_(codes)))
+        ):
+            subject_ids.add(subject_id)
+            subject_by_code[code] = subject_id
+
+    resolved = []
+    for row_no, record in valid:
+        if record.get('subject_id'):
+            subject_id = uuid.UUID(str(record['subject_id']))
+            if subject_id not in subject_ids:
+                result.error(row_no, "Subject not found")
+                continue
+        else:
+            subject_id = subject_by_code.get(record['subject_code'])
+            if subject_id is None:
+                result.error(row_no, "Subject not found")
+                continue
+        resolved.append((row_no, subject_id, record['section']))
+
+    # Skip sections that already exist for their subject (one query)
+    existing = set()
+    pairs = {(subject_id, section) for _, subject_id, section in resolved}
+    if pairs:
+        existing = set(db.session.execute(
+            select(Class.subject_id, Class.section).where(tuple_(Class.subject_id, Class.section).in_(pairs))
+        ).all())
+
+    rows, seen = [], set()
+    for row_no, subject_id, section in resolved:
+        if (subject_id, section) in existing:
+            result.error(row_no, "Class section already exists for this subject")
+        elif (subject_id, section) in seen:
+            result.error(row_no, "Duplicate class in import")
+        else:
+            seen.add((subject_id, section))
+            rows.append({"id": uuid.uuid4(), "subject_id": subject_id, "section": section})
+
+    _insert_batched(Class, rows, batch_size)
+    result.inserted = len(rows)
+    return result
+
+
+IMPORTERS = {
+    'users': import_users,
+    'subjects': import_subjects,
+    'classes': import_classes,
+}
+
+
+def run_import(kind, records, config, hash_workers=1, hash_password=None):
+    """
+    Runs one importer and commits; on any error nothing is kept.
+    hash_workers > 1 hashes user passwords in a process pool (CLI only);
+    otherwise each goes through hash_password when given.
+    """
+    kwargs = {"batch_size": config['BULK_IMPORT_BATCH_SIZE']}
+    if kind == 'users':
+        kwargs.update(hash_workers=hash_workers, hash_password=hash_password)
+    try:
+        result = IMPORTERS[kind](records, **kwargs)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return result
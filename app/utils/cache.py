@@ -0,0 +1,293 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from urllib.parse import urlencode
+from flask import current_app, g, has_request_context
+from sqlalchemy import event
+from app.extensions import db
+from app.utils import events
+from app.utils.db_routing import RoutingSession, reads_replica
+from app.utils.shared_store import get_store
+
+# Namespace bumped by anything that can change tutor search results
+SEARCH = 'search'
+# Namespace every key depends on; bumping it drops the whole cache
+ALL = '*'
+
+# Bus event carrying a commit's bumps to the other hosts and processes
+BUMPED = 'cache.bumped'
+# Past this many namespaces in one commit, ALL is sent instead; keeps the
+# payload under the 8000-byte NOTIFY limit
+MAX_BUMPED_NAMESPACES = 128
+# Bump ids remembered per namespace, so each host applies a bump once
+RECENT_BUMPS = 64
+
+# One shared-store purge of expired entries every this many writes
+PURGE_EVERY = 1000
+
+
+class LocalLRU:
+    """Bounded in-process LRU whose entries also expire after a TTL."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TwoTierCache:
+    """
+    Read-through cache for built response bodies: a per-worker LocalLRU in
+    front of the SharedStore every worker on the host sees.
+
+    Keys embed the current version of each namespace they depend on (say
+    "tutor:<id>" and "search"). Write paths bump those versions after their
+    transaction commits, which orphans every key built on the old version
+    in both tiers at once; orphans age out by TTL and LRU. Workers reuse a
+    version for CACHE_VERSION_TTL seconds, so other workers see a bump
+    that much later; the bumping worker sees it at once.
+
+    The store is per host, so each commit also sends its bumps on the
+    event bus (see _on_before_commit). Every process building keys drains
+    them and applies them to its host's store; the bump id makes that
+    idempotent, so a host bumps once however many of its workers (or the
+    committing one) apply it. A queue that overflowed bumps ALL.
+
+    A bump commits on the primary, but reads may go to a replica that
+    hasn't replayed it yet. For READ_YOUR_WRITES_SECONDS after a bump, a
+    request reading a replica doesn't fill keys of that namespace, so old
+    rows can't be cached under the new version.
+    """
+
+    def __init__(self, config):
+        self.enabled = config['CACHE_ENABLED']
+        self.local = LocalLRU(config['CACHE_LOCAL_MAX_ENTRIES'])
+        self.local_ttl = config['CACHE_LOCAL_TTL']
+        self.version_ttl = config['CACHE_VERSION_TTL']
+        self.replica_lag = config['READ_YOUR_WRITES_SECONDS']
+        self.versions = LocalLRU(config['CACHE_LOCAL_MAX_ENTRIES'])   # namespace -> (version, bumped_at)
+        self.queue_size = config['CACHE_EVENT_QUEUE_SIZE']
+        self._subscriber = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.skipped_sets = 0
+        self.remote_bumps = 0
+
+    # --- Bus ---
+    def _subscribe(self):
+        # Once per process: the bus's listener thread does not survive fork
+        if self._pid == os.getpid():
+            return
+        bus = events.get_bus()
+        if self._subscriber is not None:
+            bus.unsubscribe(self._subscriber)
+        self._subscriber = bus.subscribe(max_queued=self.queue_size)
+        self._pid = os.getpid()
+
+    def _sync(self):
+        """Applies the bumps other processes and hosts sent since the last call."""
+        self._subscribe()
+        # A full queue may have dropped bumps
+        if self._subscriber.qsize() >= self.queue_size:
+            self.bump(ALL)
+        while True:
+            try:
+                payload = self._subscriber.get_nowait()
+            except queue.Empty:
+                break
+            if payload['type'] == BUMPED:
+                self.bump(*payload['namespaces'], bump_id=payload['id'])
+                self._count('remote_bumps')
+
+    # --- Keys ---
+    def version(self, namespace):
+        """(version, epoch time of the bump that made it, 0 if unknown)."""
+        cached = self.versions.get(namespace)
+        if cached is None:
+            cached = _version_of(get_store().get(f'cache:version:{namespace}'))
+            self.versions.set(namespace, cached, self.version_ttl)
+        return cached
+
+    def key(self, namespaces, *parts):
+        if self.enabled:
+            self._sync()
+        versions = {ns: self.version(ns) for ns in (ALL, *namespaces)}
+        tags = ','.join(f'{ns}@{version}' for ns, (version, _) in versions.items())
+        key = f"cache:{tags}:{':'.join(str(p) for p in parts)}"
+        if self.replica_lag and reads_replica():
+            settled = time.time() - self.replica_lag
+            if any(bumped_at > settled for _, bumped_at in versions.values()):
+                g.setdefault('cache_unsettled_keys', set()).add(key)
+        return key
+
+    def bump(self, *namespaces, bump_id=None):
+        """
+        Moves each namespace to a new version. With a bump_id, a bump this
+        host's store has already applied is skipped.
+        """
+        store = get_store()
+        now = time.time()
+
+        def apply(current):
+            version, bumped_at = _version_of(current)
+            recent = current[2] if isinstance(current, list) and len(current) > 2 else []
+            if bump_id is None or bump_id not in recent:
+                version, bumped_at = version + 1, now
+                if bump_id is not None:
+                    recent = (recent + [bump_id])[-RECENT_BUMPS:]
+            return [version, bumped_at, recent], (version, bumped_at)
+
+        for namespace in namespaces:
+            version = store.update(f'cache:version:{namespace}', apply)
+            self.versions.set(namespace, version, self.version_ttl)
+
+    # --- Values ---
+    def get(self, key):
+        if not self.enabled:
+            return None
+        value = self.local.get(key)
+        if value is not None:
+            self._count('local_hits')
+            return value
+        value = get_store().get(key)
+        if value is not None:
+            self._count('shared_hits')
+            self.local.set(key, value, self.local_ttl)
+            return value
+        self._count('misses')
+        return None
+
+    def set(self, key, value, ttl):
+        if not self.enabled:
+            return
+        if has_request_context() and key in g.get('cache_unsettled_keys', ()):
+            self._count('skipped_sets')
+            return
+        store = get_store()
+        store.set(key, value, ttl=ttl)
+        self.local.set(key, value, min(ttl, self.local_ttl))
+        self._count('sets')
+        if self.sets % PURGE_EVERY == 0:
+            store.purge_expired()
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self):
+        lookups = self.local_hits + self.shared_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "lookups": lookups,
+            "local_hits": self.local_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.local_hits + self.shared_hits) / lookups, 4) if lookups else None,
+            "local_hit_ratio": round(self.local_hits / lookups, 4) if lookups else None,
+            "sets": self.sets,
+            "skipped_sets": self.skipped_sets,
+            "remote_bumps": self.remote_bumps,
+            "local_entries": len(self.local),
+            "local_max_entries": self.local.max_entries,
+            "local_evictions": self.local.evictions,
+            "local_expirations": self.local.expirations
+        }
+
+
+def _version_of(value):
+    # [version, bumped_at, recent bump ids]; versions stored before bumps
+    # carried their time are plain counters
+    if isinstance(value, list):
+        return value[0], value[1]
+    return value or 0, 0
+
+
+def get_cache():
+    return current_app.extensions['cache']
+
+
+def args_key(args):
+    """Order-independent form of a request's query arguments."""
+    return urlencode(sorted(args.items(multi=True)))
+
+
+def invalidate(*namespaces):
+    """
+    Bumps the namespaces when the current session commits. Bumping before
+    the commit would let a concurrent read cache the old rows again.
+    """
+    db.session.info.setdefault('cache_bumps', set()).update(namespaces)
+
+
+def invalidate_tutor(tutor_id):
+    """For any write that changes what a tutor's profile or search entry shows."""
+    invalidate(f'tutor:{tutor_id}', SEARCH)
+
+
+def _on_before_commit(session):
+    # The bumps go out with the commit; this process applies the same ones
+    # itself right after it, under the same id
+    namespaces = session.info.get('cache_bumps')
+    if not namespaces:
+        return
+    if len(namespaces) > MAX_BUMPED_NAMESPACES:
+        namespaces = {ALL}
+    bump_id = uuid.uuid4().hex
+    session.info['cache_bumps_sent'] = (bump_id, namespaces)
+    events.publish({"type": BUMPED, "id": bump_id, "namespaces": sorted(namespaces)})
+
+
+def _on_after_commit(session):
+    session.info.pop('cache_bumps', None)
+    sent = session.info.pop('cache_bumps_sent', None)
+    if sent:
+        bump_id, namespaces = sent
+        get_cache().bump(*namespaces, bump_id=bump_id)
+
+
+def _on_after_rollback(session):
+    session.info.pop('cache_bumps', None)
+    session.info.pop('cache_bumps_sent', None)
+
+
+def init_app(app):
+    app.extensions['cache'] = TwoTierCache(app.config)
+
+
+# Ahead of the event bus's own hook, which sends what is published by then
+event.listen(RoutingSession, 'before_commit', _on_before_commit, insert=True)
+event.listen(RoutingSession, 'after_commit', _on_after_commit)
+event.listen(RoutingSession, 'after_rollback', _on_after_rollback)
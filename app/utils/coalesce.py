@@ -0,0 +1,121 @@
+import threading
+from functools import wraps
+from flask import current_app, request, make_response
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from app.utils.cache import args_key
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one: the first caller
+    (the leader) runs the function, the rest wait for its result. A follower
+    that waits longer than wait_seconds, or whose leader failed, runs the
+    function itself, so coalescing can only ever save work.
+    """
+
+    def __init__(self, wait_seconds):
+        self.wait_seconds = wait_seconds
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+        self.fallbacks = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+        if leader:
+            try:
+                call.result = fn()
+                return call.result
+            except BaseException:
+                call.failed = True
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if call.done.wait(self.wait_seconds) and not call.failed:
+            return call.result
+        with self._lock:
+            self.fallbacks += 1
+        return fn()
+
+    def stats(self):
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "fallbacks": self.fallbacks,
+            "wait_seconds": self.wait_seconds
+        }
+
+
+def get_single_flight():
+    return current_app.extensions['single_flight']
+
+
+def coalesced(vary='role'):
+    """
+    Shares one in-flight computation between identical concurrent GETs.
+    The key is the path, the normalized query string and, per `vary`, the
+    caller's role ('role'), identity ('identity') or nothing ('none'); a
+    callable `vary` is called per request and its result added instead.
+    Put it under the auth decorators so every caller is still checked.
+    Only 2xx/3xx/4xx responses are shared; a 5xx sends followers to run
+    the view themselves.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not current_app.config['COALESCE_ENABLED'] or request.method != 'GET':
+                return view(*args, **kwargs)
+
+            key = [request.path, args_key(request.args)]
+            if vary == 'role':
+                key.append(get_jwt().get('account_type'))
+            elif vary == 'identity':
+                key.append(get_jwt_identity())
+            elif callable(vary):
+                key.append(vary())
+
+            def run():
+                response = make_response(view(*args, **kwargs))
+                if response.status_code >= 500:
+                    raise _NotShareable(response)
+                # Each caller gets its own Response (after_request hooks
+                # mutate it), built from the leader's bytes and headers
+                return response.get_data(), response.status_code, list(response.headers.items())
+
+            try:
+                body, status, headers = get_single_flight().do(tuple(key), run)
+            except _NotShareable as e:
+                return e.response
+            return current_app.response_class(body, status=status, headers=headers)
+        return wrapper
+    return decorator
+
+
+class _NotShareable(Exception):
+    def __init__(self, response):
+        super().__init__(response.status)
+        self.response = response
+
+
+def init_app(app):
+    app.extensions['single_flight'] = SingleFlight(app.config['COALESCE_WAIT_SECONDS'])
@@ -0,0 +1,41 @@
+from app.extensions import db
+
+
+def make_psycopg2_cooperative():
+    """
+    Installs a psycopg2 wait callback that yields to the gevent hub while a
+    query is in flight, so one worker can serve other greenlets in the
+    meantime instead of blocking on the socket.
+
+    Call once per worker process, after gevent has monkey-patched it.
+    """
+    import psycopg2
+    from psycopg2 import extensions
+    from gevent.socket import wait_read, wait_write
+
+    def gevent_wait_callback(conn, timeout=None):
+        while True:
+            state = conn.poll()
+            if state == extensions.POLL_OK:
+                break
+            elif state == extensions.POLL_READ:
+                wait_read(conn.fileno(), timeout=timeout)
+            elif state == extensions.POLL_WRITE:
+                wait_write(conn.fileno(), timeout=timeout)
+            else:
+                raise psycopg2.OperationalError(f"Bad result from poll: {state!r}")
+
+    extensions.set_wait_callback(gevent_wait_callback)
+
+
+def dispose_engines(app):
+    """
+    Drops any pooled connections inherited from the parent process.
+
+    Connections opened by the gunicorn master (e.g. with preload_app) must
+    never be shared with forked workers. close=False leaves the parent's
+    sockets alone and just gives this process a fresh, empty pool.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
@@ -0,0 +1,92 @@
+import random
+from flask import g, request, current_app, has_request_context
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_sqlalchemy.session import Session
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+
+# Bind keys in SQLALCHEMY_BINDS that hold read replicas
+REPLICA_PREFIX = 'replica_'
+
+# Response header carrying a signed read-your-writes pin; the client sends
+# it back on its next requests, whichever host or dyno they reach
+PRIMARY_PIN_HEADER = 'X-Primary-Pin'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RoutingSession(Session):
+    """
+    Session that sends reads to a replica when the current request allows it
+    (see init_app). Flushes, and everything outside a replica-routed
+    request, go to the primary as usual.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and reads_replica():
+            engine = _replica_engine(self._db)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def reads_replica():
+    """Whether the current request sends its reads to a replica."""
+    return has_request_context() and g.get('db_use_replica', False)
+
+
+def _replica_engine(db):
+    # Stick to one replica for the whole request so reads are consistent
+    key = g.get('db_replica_key')
+    if key is None:
+        keys = [k for k in db.engines if k and k.startswith(REPLICA_PREFIX)]
+        if not keys:
+            return None
+        key = g.db_replica_key = random.choice(keys)
+    return db.engines[key]
+
+
+def _caller_identity():
+    # The view's own decorator rejects bad tokens; here they just mean "no pin"
+    try:
+        verify_jwt_in_request(optional=True)
+        return get_jwt_identity()
+    except Exception:
+        return None
+
+
+def _pin_serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='primary-pin')
+
+
+def _pinned():
+    """Whether the request carries a live pin issued to its caller."""
+    token = request.headers.get(PRIMARY_PIN_HEADER)
+    if not token:
+        return False
+    try:
+        identity = _pin_serializer().loads(token, max_age=current_app.config['READ_YOUR_WRITES_SECONDS'])
+    except BadSignature:  # Includes expired pins
+        return False
+    return identity == _caller_identity()
+
+
+def init_app(app):
+    has_replicas = any(k.startswith(REPLICA_PREFIX) for k in app.config.get('SQLALCHEMY_BINDS') or {})
+
+    @app.before_request
+    def choose_database():
+        # Pins are per user, not per browser: the SPA sends Bearer tokens
+        # cross-origin, so it never sends cookies back. The pin travels
+        # with the client instead of in any one host's state.
+        g.db_use_replica = has_replicas and request.method in SAFE_METHODS and not _pinned()
+
+    @app.after_request
+    def pin_after_write(response):
+        # Read-your-writes: after a successful write this user reads from
+        # the primary until the replicas have had time to catch up
+        window = current_app.config.get('READ_YOUR_WRITES_SECONDS', 0)
+        if has_replicas and window and request.method not in SAFE_METHODS and response.status_code < 400:
+            identity = _caller_identity()
+            if identity:
+                response.headers[PRIMARY_PIN_HEADER] = _pin_serializer().dumps(identity)
+        return response
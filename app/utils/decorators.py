@@ -1,7 +1,9 @@
+import hmac
 from functools import wraps
-from flask import jsonify
-from flask_jwt_extended import get_jwt, jwt_required, get_jwt_identity
+from flask import jsonify, request, current_app
+from flask_jwt_extended import get_jwt, get_jwt_identity, verify_jwt_in_request
 from app.models import User
+from app.utils import tracing
 
 def account_type_required(*required_account_types):
     """
@@ -17,39 +19,65 @@ def account_type_required(*required_account_types):
     """
     def decorator(fn):
         @wraps(fn)
-        @jwt_required()
         def wrapper(*args, **kwargs):
-            current_user = get_jwt_identity()
-            
-            # If you're including account_type in JWT claims (recommended)
-            jwt_data = get_jwt()
-            print("JWT Data:", jwt_data)
-            if 'account_type' in jwt_data:
-                if jwt_data['account_type'] in required_account_types:
-                    return fn(*args, **kwargs)
-                return jsonify({
-                    "error": "Insufficient permissions",
-                    "required_types": required_account_types,
-                    "your_type": jwt_data['account_type']
-                }), 403
-            
-            # Fallback to database query if account_type not in JWT
-            user = User.query.get(current_user)
-            if not user:
-                return jsonify({"error": "User not found"}), 404
-                
-            if user.account_type not in required_account_types:
-                return jsonify({
-                    "error": "Insufficient permissions",
-                    "required_types": required_account_types,
-                    "your_type": user.account_type
-                }), 403
-            
+            # The JWT and role checks get their own span in request traces
+            with tracing.span('auth.account_type', **{'auth.required': ','.join(required_account_types)}):
+                verify_jwt_in_request()
+                denied = _check_account_type(required_account_types)
+            if denied:
+                return denied
             return fn(*args, **kwargs)
         return wrapper
     return decorator
 
+def _check_account_type(required_account_types):
+    """None if the caller may proceed, else the error response."""
+    current_user = get_jwt_identity()
+
+    # If you're including account_type in JWT claims (recommended)
+    jwt_data = get_jwt()
+    if 'account_type' in jwt_data:
+        if jwt_data['account_type'] in required_account_types:
+            return None
+        return jsonify({
+            "error": "Insufficient permissions",
+            "required_types": required_account_types,
+            "your_type": jwt_data['account_type']
+        }), 403
+
+    # Fallback to database query if account_type not in JWT
+    user = User.query.get(current_user)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    if user.account_type not in required_account_types:
+        return jsonify({
+            "error": "Insufficient permissions",
+            "required_types": required_account_types,
+            "your_type": user.account_type
+        }), 403
+
+    return None
+
 # Specific decorators
 tutor_required = account_type_required('tutor')
 student_required = account_type_required('student')
-admin_required = account_type_required('admin')
\ No newline at end of file
+admin_required = account_type_required('admin')
+
+def internal_only(fn):
+    """
+    Restricts a route to operators: the caller must send the configured
+    INTERNAL_METRICS_TOKEN in X-Internal-Token, or, when no token is
+    configured, connect from localhost.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = current_app.config.get('INTERNAL_METRICS_TOKEN')
+        if token:
+            supplied = request.headers.get('X-Internal-Token', '')
+            if not hmac.compare_digest(supplied.encode(), token.encode()):
+                return jsonify({"error": "Forbidden"}), 403
+        elif request.remote_addr not in ('127.0.0.1', '::1'):
+            return jsonify({"error": "Forbidden"}), 403
+        return fn(*args, **kwargs)
+    return wrapper
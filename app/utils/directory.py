@@ -0,0 +1,575 @@
+import heapq
+import logging
+import os
+import queue
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from itertools import islice
+from uuid import UUID
+from flask import current_app
+from sqlalchemy import event, func, or_, select
+from app.extensions import db
+from app.models import AvailabilityRule, Class, Subject, TimeSlot, Tutor, User, tutor_class_association
+from app.utils import cache, events
+from app.utils.db_routing import RoutingSession
+from app.utils.search import AVAILABILITY_BUCKETS, PRICE_BANDS, RATING_THRESHOLDS, SORTS
+
+logger = logging.getLogger(__name__)
+
+# Bus events: some tutors changed, or search changed in a way no tutor id describes
+CHANGED = 'directory.changed'
+RELOAD = 'directory.reload'
+# Past this many tutors in one commit, workers rebuild instead
+MAX_CHANGED_IDS = 100
+
+# Bitset groups: each row is a member of some keys of each group
+GROUPS = ('class', 'subject', 'availability', 'price', 'rating')
+
+# Columns each sort order reads, so a row update only re-sorts the orders it moved
+SORT_COLUMNS = {
+    None: (),
+    'price_asc': ('rate',),
+    'price_desc': ('rate',),
+    'rating': ('rating', 'reviews'),
+    'reviews': ('reviews',),
+    'availability': ('next_at',),
+}
+
+# Matches under 1/SELECTIVE of the rows are sorted directly instead of
+# found by walking the sort order
+SELECTIVE = 32
+
+EPOCH = datetime(1970, 1, 1)
+
+# PRICE_BANDS are contiguous from 0, so a rate's band is found by bisection
+_BAND_STARTS = [low for low, _ in PRICE_BANDS]
+
+# Set bit positions of every byte value, for listing the rows of a bitset
+_BYTE_BITS = [tuple(b for b in range(8) if n >> b & 1) for n in range(256)]
+
+
+def rows_of(bits):
+    """Row numbers set in a bitset, ascending."""
+    rows = []
+    for i, byte in enumerate(bits.to_bytes((bits.bit_length() + 7) // 8, 'little')):
+        if byte:
+            base = i << 3
+            rows.extend(base + b for b in _BYTE_BITS[byte])
+    return rows
+
+
+def bits_of(rows):
+    """Bitset with the given row numbers set."""
+    if not rows:
+        return 0
+    buf = bytearray((max(rows) >> 3) + 1)
+    for row in rows:
+        buf[row >> 3] |= 1 << (row & 7)
+    return int.from_bytes(buf, 'little')
+
+
+class Snapshot:
+    """
+    The tutor directory as columns: one row per tutor, numeric columns in
+    typed arrays, and class, subject, availability, price-band and rating
+    memberships as bitsets (Python ints, one bit per row). Filters AND
+    bitsets together and counts are popcounts. Each sort order is a list
+    of live rows, built on first use and then kept sorted on every change;
+    the price and rating orders also answer range filters by bisection.
+    Removed tutors leave a dead row until the next rebuild.
+    """
+
+    def __init__(self, classes, subjects):
+        self.classes = classes    # class_id -> (subject_id, lowercased section)
+        self.subjects = subjects  # subject_id -> name
+        self.ids = []
+        self.uid = []  # Tutor ids as ints: they order like Postgres orders uuids
+        self.row_of = {}
+        self.rate = array('d')
+        self.rating = array('d')
+        self.reviews = array('l')
+        self.next_at = array('d')  # Epoch seconds, inf when nothing is open
+        self.names = []  # "username\nfirst\nlast", lowercased
+        self.keys = []   # row -> {group: frozenset of keys}
+        self.groups = {group: {} for group in GROUPS}
+        self.live = 0
+        self._orders = {}
+        # Ascending sort keys matching search.SORTS; descending orders negate
+        uid, rate, rating, reviews, next_at = self.uid, self.rate, self.rating, self.reviews, self.next_at
+        self._sort_keys = {
+            None: lambda r: (uid[r],),
+            'price_asc': lambda r: (rate[r], uid[r]),
+            'price_desc': lambda r: (-rate[r], -uid[r]),
+            'rating': lambda r: (-rating[r], -reviews[r], -uid[r]),
+            'reviews': lambda r: (-reviews[r], -uid[r]),
+            'availability': lambda r: (next_at[r], uid[r]),
+        }
+
+    def _keys(self, row):
+        rate = row['rate']
+        return {
+            'class': frozenset(row['classes']),
+            'subject': frozenset(self.classes[c][0] for c in row['classes'] if c in self.classes),
+            'availability': frozenset(row['buckets']),
+            'price': frozenset((band,)) if (band := bisect_right(_BAND_STARTS, rate) - 1) >= 0 else frozenset(),
+            'rating': frozenset(t for t in RATING_THRESHOLDS if row['reviews'] and row['rating'] >= t),
+        }
+
+    def _append(self, tutor_id, row):
+        r = len(self.ids)
+        self.ids.append(tutor_id)
+        self.uid.append(tutor_id.int)
+        self.row_of[tutor_id] = r
+        self.rate.append(row['rate'])
+        self.rating.append(row['rating'])
+        self.reviews.append(row['reviews'])
+        self.next_at.append(row['next_at'])
+        self.names.append(row['name'])
+        self.keys.append({})
+        return r
+
+    def build(self, rows):
+        """Fills an empty snapshot; memberships become bitsets once, at the end."""
+        members = {group: {} for group in GROUPS}
+        for tutor_id, row in rows.items():
+            r = self._append(tutor_id, row)
+            self.keys[r] = self._keys(row)
+            for group, keys in self.keys[r].items():
+                for key in keys:
+                    members[group].setdefault(key, []).append(r)
+        for group, keyed in members.items():
+            self.groups[group] = {key: bits_of(members_of) for key, members_of in keyed.items()}
+        self.live = (1 << len(self.ids)) - 1
+
+    def put(self, tutor_id, row):
+        r = self.row_of.get(tutor_id)
+        if r is not None and self.live >> r & 1:
+            changed = {column for column in ('rate', 'rating', 'reviews', 'next_at')
+                       if getattr(self, column)[r] != row[column]}
+            moved = [sort for sort in self._orders if changed.intersection(SORT_COLUMNS[sort])]
+        else:
+            if r is None:
+                r = self._append(tutor_id, row)
+            self.live |= 1 << r
+            moved = None
+        for sort in moved or ():
+            self._unlink(sort, r)
+        self.rate[r] = row['rate']
+        self.rating[r] = row['rating']
+        self.reviews[r] = row['reviews']
+        self.next_at[r] = row['next_at']
+        self.names[r] = row['name']
+        for sort in self._orders if moved is None else moved:
+            insort(self._orders[sort], r, key=self._sort_keys[sort])
+        self._set_keys(r, self._keys(row))
+
+    def remove(self, tutor_id):
+        r = self.row_of.get(tutor_id)
+        if r is None or not self.live >> r & 1:
+            return
+        for sort in self._orders:
+            self._unlink(sort, r)
+        self.live &= ~(1 << r)
+        self._set_keys(r, {})
+
+    def _unlink(self, sort, r):
+        # Sort keys are unique (they end in the id), so this finds r itself
+        order, key = self._orders[sort], self._sort_keys[sort]
+        del order[bisect_left(order, key(r), key=key)]
+
+    def _set_keys(self, r, keys):
+        bit = 1 << r
+        old = self.keys[r]
+        for group in GROUPS:
+            before, after = old.get(group, frozenset()), keys.get(group, frozenset())
+            bitsets = self.groups[group]
+            for key in before - after:
+                bitsets[key] &= ~bit
+            for key in after - before:
+                bitsets[key] = bitsets.get(key, 0) | bit
+        self.keys[r] = keys
+
+    # --- Queries ---
+    def _order(self, sort):
+        order = self._orders.get(sort)
+        if order is None:
+            order = self._orders[sort] = sorted(rows_of(self.live), key=self._sort_keys[sort])
+        return order
+
+    def _price_between(self, low, high):
+        order, key = self._order('price_asc'), self._sort_keys['price_asc']
+        # (x,) sorts before every (x, uid) key
+        start = bisect_left(order, (low,), key=key) if low is not None else 0
+        end = bisect_left(order, (high,), key=key) if high is not None else len(order)
+        return bits_of(order[start:end])
+
+    def _rated_at_least(self, min_rating):
+        order, key = self._order('rating'), self._sort_keys['rating']
+        # Keys are (-rating, -reviews, -uid), and -reviews is never above 0
+        rows = order[:bisect_left(order, (-min_rating, 1), key=key)]
+        if min_rating <= 0:
+            rows = [r for r in rows if self.reviews[r]]  # No rating to compare
+        return bits_of(rows)
+
+    def filters(self, args):
+        """
+        One bitset per active filter, keyed by facet name as in
+        search.tutor_filters, with the same semantics.
+        """
+        filters = {}
+
+        search_query = args.get('query')
+        if search_query:
+            needle = search_query.lower()
+            matched = bits_of([r for r, name in enumerate(self.names) if needle in name])
+            for class_id, (_, section) in self.classes.items():
+                if needle in section:
+                    matched |= self.groups['class'].get(class_id, 0)
+            filters['query'] = matched
+
+        subject_id = args.get('subject_id')
+        if subject_id:
+            try:
+                filters['subject'] = self.groups['subject'].get(UUID(subject_id), 0)
+            except ValueError:
+                raise ValueError("Invalid subject_id")
+
+        availability = args.get('availability')
+        if availability:
+            if availability not in AVAILABILITY_BUCKETS:
+                raise ValueError("Invalid availability")
+            filters['availability'] = self.groups['availability'].get(availability, 0)
+
+        min_rate = args.get('min_rate', type=float)
+        max_rate = args.get('max_rate', type=float)
+        if min_rate is not None or max_rate is not None:
+            filters['price'] = self._price_between(min_rate, max_rate)
+
+        min_rating = args.get('min_rating', type=float)
+        if min_rating is not None:
+            filters['rating'] = self._rated_at_least(min_rating)
+
+        return filters
+
+    def _mask(self, filters, skip=None):
+        mask = self.live
+        for facet, bits in filters.items():
+            if facet != skip:
+                mask &= bits
+        return mask
+
+    def page(self, filters, sort, page, per_page):
+        """(tutor ids on the page in order, total matches)."""
+        mask = self._mask(filters)
+        total = mask.bit_count()
+        end = page * per_page
+        if end - per_page >= total:
+            return [], total
+        order = self._order(sort)
+        if mask == self.live:
+            top = order[:end]
+        elif total * SELECTIVE < len(order):
+            # Few matches: sorting them beats walking the whole order
+            top = heapq.nsmallest(end, rows_of(mask), key=self._sort_keys[sort])
+        else:
+            data = mask.to_bytes(len(self.ids) // 8 + 1, 'little')
+            top = list(islice((r for r in order if data[r >> 3] >> (r & 7) & 1), end))
+        return [self.ids[r] for r in top[end - per_page:]], total
+
+    def candidates(self, filters):
+        """Every match as columns: (tutor ids, rates, ratings, review counts)."""
+        rows = rows_of(self._mask(filters))
+        ids, rate, rating, reviews = self.ids, self.rate, self.rating, self.reviews
+        return ([ids[r] for r in rows], array('d', (rate[r] for r in rows)),
+                array('d', (rating[r] for r in rows)), array('l', (reviews[r] for r in rows)))
+
+    def facets(self, filters):
+        """Same shape and semantics as search.facet_counts, from popcounts."""
+        groups = self.groups
+        mask = self._mask(filters, 'subject')
+        subjects = []
+        for subject_id, bits in groups['subject'].items():
+            count = (bits & mask).bit_count()
+            if count:
+                subjects.append({"id": str(subject_id), "name": self.subjects.get(subject_id), "count": count})
+        subjects.sort(key=lambda s: (-s["count"], s["name"] or ''))
+
+        mask = self._mask(filters, 'availability')
+        availability = {bucket: (groups['availability'].get(bucket, 0) & mask).bit_count()
+                        for bucket in AVAILABILITY_BUCKETS}
+        mask = self._mask(filters, 'price')
+        price = [{"min": low, "max": high, "count": (groups['price'].get(i, 0) & mask).bit_count()}
+                 for i, (low, high) in enumerate(PRICE_BANDS)]
+        mask = self._mask(filters, 'rating')
+        rating = [{"min": threshold, "count": (groups['rating'].get(threshold, 0) & mask).bit_count()}
+                  for threshold in RATING_THRESHOLDS]
+        return {"subjects": subjects, "availability": availability, "price": price, "rating": rating}
+
+    def footprint(self):
+        """Approximate bytes held by the columns and bitsets."""
+        columns = sum(len(a) * a.itemsize for a in (self.rate, self.rating, self.reviews, self.next_at))
+        columns += sum(len(order) * 8 for order in self._orders.values())
+        bitsets = sum((bits.bit_length() + 7) // 8 for keyed in self.groups.values() for bits in keyed.values())
+        return columns + bitsets + sum(len(name) for name in self.names)
+
+
+def _load(connection, tutor_ids=None, now=None):
+    """
+    {tutor_id: row} for the given tutors (every tutor when None), read on
+    the connection. Tutors that no longer exist are left out.
+    """
+    now = now or datetime.utcnow()
+
+    def scoped(query, column):
+        return query if tutor_ids is None else query.where(column.in_(tutor_ids))
+
+    rows = {}
+    for tutor_id, rate, rating, reviews, next_at, username, first_name, last_name in connection.execute(scoped(
+            select(Tutor.id, Tutor.hourly_rate, Tutor.average_rating, Tutor.review_count, Tutor.next_available_at,
+                   User.username, User.first_name, User.last_name)
+            .join(User, User.id == Tutor.user_id), Tutor.id)):
+        rows[tutor_id] = {
+            "rate": float(rate),
+            "rating": float(rating or 0),
+            "reviews": reviews or 0,
+            "next_at": (next_at - EPOCH).total_seconds() if next_at else float('inf'),
+            "name": '\n'.join(part or '' for part in (username, first_name, last_name)).lower(),
+            "classes": set(),
+            "buckets": set()
+        }
+
+    for tutor_id, class_id in connection.execute(scoped(
+            select(tutor_class_association.c.tutor_id, tutor_class_association.c.class_id),
+            tutor_class_association.c.tutor_id)):
+        if tutor_id in rows:
+            rows[tutor_id]["classes"].add(class_id)
+
+    # Same buckets as search.availability_condition
+    hour = func.extract('hour', TimeSlot.start_time)
+    for tutor_id, start_hour in connection.execute(scoped(
+            select(TimeSlot.tutor_id, hour)
+            .where(TimeSlot.status == 'available', TimeSlot.start_time > now)
+            .group_by(TimeSlot.tutor_id, hour), TimeSlot.tutor_id)):
+        if tutor_id in rows:
+            rows[tutor_id]["buckets"].update(
+                bucket for bucket, (start, end) in AVAILABILITY_BUCKETS.items() if start <= start_hour < end)
+    for tutor_id, start_hour, end_hour in connection.execute(scoped(
+            select(AvailabilityRule.tutor_id, func.extract('hour', AvailabilityRule.start_time),
+                   func.extract('hour', AvailabilityRule.end_time))
+            .where(or_(AvailabilityRule.valid_until.is_(None), AvailabilityRule.valid_until >= now.date())),
+            AvailabilityRule.tutor_id)):
+        if tutor_id in rows:
+            rows[tutor_id]["buckets"].update(
+                bucket for bucket, (start, end) in AVAILABILITY_BUCKETS.items() if start_hour < end and end_hour > start)
+    return rows
+
+
+def _load_classes(connection, class_ids=None):
+    query = select(Class.id, Class.subject_id, Class.section)
+    if class_ids is not None:
+        query = query.where(Class.id.in_(class_ids))
+    classes = {class_id: (subject_id, (section or '').lower())
+               for class_id, subject_id, section in connection.execute(query)}
+    subject_ids = {subject_id for subject_id, _ in classes.values()}
+    query = select(Subject.id, Subject.name)
+    if class_ids is not None:
+        query = query.where(Subject.id.in_(subject_ids))
+    return classes, dict(connection.execute(query).all())
+
+
+class TutorDirectory:
+    """
+    The per-worker Snapshot and its upkeep. Commits that change search
+    results publish the tutors they touched on the event bus (see
+    _on_before_commit); each search first applies what arrived since the
+    last one, reloading just those tutors. A reload event, a queue that
+    overflowed or a snapshot older than max_age means a full rebuild.
+    Loads always read the primary, never a lagging replica.
+
+    Only the first build runs on the request path. Later rebuilds load a
+    new Snapshot on a background thread while searches keep using (and
+    updating) the old one; the next search swaps it in and reapplies the
+    changes that arrived during the load.
+    """
+
+    def __init__(self, config):
+        self.enabled = config['DIRECTORY_ENABLED']
+        self.max_age = config['DIRECTORY_MAX_AGE_SECONDS']
+        self.queue_size = config['DIRECTORY_EVENT_QUEUE_SIZE']
+        self._snapshot = None
+        self._built_at = 0.0
+        self._subscriber = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._rebuilding = False
+        self._fresh = None         # (snapshot, built_at) waiting to be swapped in
+        self._missed = set()       # Tutors changed while a rebuild was loading
+        self._missed_reload = False
+        self.rebuilds = 0
+        self.updates = 0
+
+    def _subscribe(self):
+        # Once per process: the bus's listener thread does not survive fork
+        if self._pid == os.getpid():
+            return
+        bus = events.get_bus()
+        if self._subscriber is not None:
+            bus.unsubscribe(self._subscriber)
+        self._subscriber = bus.subscribe(max_queued=self.queue_size)
+        self._snapshot = None
+        self._pid = os.getpid()
+
+    def _sync(self):
+        self._subscribe()
+        # A full queue may have dropped events
+        reload = self._subscriber.qsize() >= self.queue_size
+        changed = set()
+        while True:
+            try:
+                payload = self._subscriber.get_nowait()
+            except queue.Empty:
+                break
+            if payload['type'] == RELOAD:
+                reload = True
+            elif payload['type'] == CHANGED:
+                changed.update(UUID(tutor_id) for tutor_id in payload['tutor_ids'])
+
+        if self._fresh is not None:
+            # Whatever changed since its load began may be missing from it
+            self._snapshot, self._built_at = self._fresh
+            self._fresh = None
+            changed |= self._missed
+            reload |= self._missed_reload
+            self._missed, self._missed_reload = set(), False
+        elif self._rebuilding:
+            self._missed |= changed
+            self._missed_reload |= reload
+
+        if self._snapshot is None:
+            self._snapshot, self._built_at = self._build()  # Nothing to serve until then
+        elif reload or time.monotonic() - self._built_at > self.max_age:
+            self._start_rebuild()
+            if changed:
+                self._update(changed)
+        elif changed:
+            self._update(changed)
+
+    def _build(self):
+        started = time.monotonic()
+        with db.engine.connect() as connection:
+            classes, subjects = _load_classes(connection)
+            rows = _load(connection)
+        snapshot = Snapshot(classes, subjects)
+        snapshot.build(rows)
+        self.rebuilds += 1
+        logger.info("Tutor directory rebuilt", extra={
+            "tutors": len(rows), "seconds": round(time.monotonic() - started, 3)})
+        return snapshot, started
+
+    def _start_rebuild(self):
+        # Called under self._lock; one rebuild at a time
+        if self._rebuilding:
+            return
+        self._rebuilding = True
+        app = current_app._get_current_object()
+        threading.Thread(target=self._rebuild_in_background, args=(app,),
+                         name='directory-rebuild', daemon=True).start()
+
+    def _rebuild_in_background(self, app):
+        fresh = None
+        try:
+            with app.app_context():
+                fresh = self._build()
+        except Exception:
+            logger.exception("Tutor directory rebuild failed; keeping the old snapshot")
+        with self._lock:
+            self._fresh = fresh
+            self._rebuilding = False
+            if fresh is None:
+                # The old snapshot has the missed changes; a later search retries
+                self._missed, self._missed_reload = set(), False
+                self._built_at = 0.0
+
+    def _update(self, tutor_ids):
+        snapshot = self._snapshot
+        with db.engine.connect() as connection:
+            rows = _load(connection, list(tutor_ids))
+            unknown = {c for row in rows.values() for c in row['classes'] if c not in snapshot.classes}
+            if unknown:
+                classes, subjects = _load_classes(connection, unknown)
+                snapshot.classes.update(classes)
+                snapshot.subjects.update(subjects)
+        for tutor_id in tutor_ids:
+            if tutor_id in rows:
+                snapshot.put(tutor_id, rows[tutor_id])
+            else:
+                snapshot.remove(tutor_id)
+        self.updates += len(tutor_ids)
+
+    def search(self, args, page, per_page, with_facets=True, ranker=None):
+        """
+        (tutor ids of the page in order, total, facets or None) for the
+        search arguments of find_tutors. With a ranking.Ranker the matches
+        are ordered by it instead of ?sort=. Raises ValueError like
+        search.tutor_filters and search.sort_order do.
+        """
+        sort = args.get('sort') or None
+        if ranker is None and sort is not None and sort not in SORTS:
+            raise ValueError(f"Cannot sort by {sort}")
+        with self._lock:
+            self._sync()
+            snapshot = self._snapshot
+            filters = snapshot.filters(args)
+            if ranker is None:
+                tutor_ids, total = snapshot.page(filters, sort, page, per_page)
+            else:
+                candidates = snapshot.candidates(filters)
+            facets = snapshot.facets(filters) if with_facets else None
+        if ranker is not None:
+            # Scored outside the lock: the columns are copies
+            total = len(candidates[0])
+            tutor_ids = ranker.rank(*candidates, limit=page * per_page)[(page - 1) * per_page:]
+        return tutor_ids, total, facets
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            "enabled": self.enabled,
+            "tutors": snapshot.live.bit_count() if snapshot else 0,
+            "rows": len(snapshot.ids) if snapshot else 0,
+            "bytes": snapshot.footprint() if snapshot else 0,
+            "age_seconds": round(time.monotonic() - self._built_at, 1) if snapshot else None,
+            "rebuilds": self.rebuilds,
+            "tutors_updated": self.updates,
+            "queued_events": self._subscriber.qsize() if self._subscriber else 0
+        }
+
+
+def get_directory():
+    return current_app.extensions['tutor_directory']
+
+
+def _on_before_commit(session):
+    # Read off the cache bumps, which every write to searchable data stages:
+    # a tutor namespace names the tutor, a bare SEARCH bump (new users,
+    # imports) does not. Sent even with the directory disabled, since the
+    # suggest index follows them too.
+    namespaces = session.info.get('cache_bumps')
+    if not namespaces:
+        return
+    tutor_ids = sorted(ns.split(':', 1)[1] for ns in namespaces if ns.startswith('tutor:'))
+    if tutor_ids and len(tutor_ids) <= MAX_CHANGED_IDS:
+        events.publish({"type": CHANGED, "tutor_ids": tutor_ids})
+    elif cache.SEARCH in namespaces:
+        events.publish({"type": RELOAD})
+
+
+def init_app(app):
+    app.extensions['tutor_directory'] = TutorDirectory(app.config)
+
+
+# Ahead of the event bus's own hook, which sends what is published by then
+event.listen(RoutingSession, 'before_commit', _on_before_commit, insert=True)
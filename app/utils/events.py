@@ -0,0 +1,164 @@
+import json
+import logging
+import queue
+import select
+import threading
+import time
+from flask import current_app
+from sqlalchemy import event, text
+from app.extensions import db
+from app.utils.db_routing import RoutingSession
+
+# Postgres NOTIFY channel carrying slot events between workers
+CHANNEL = 'slot_events'
+
+logger = logging.getLogger(__name__)
+
+
+class LocalEventBus:
+    """
+    In-process fan-out to subscriber queues. Used on its own in tests and
+    single-process setups, and as the delivery end of PostgresEventBus.
+    """
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, max_queued=100):
+        subscriber = queue.Queue(maxsize=max_queued)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def dispatch(self, payload):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(payload)
+            except queue.Full:
+                pass  # Slow client; it will resync on reconnect
+
+    def send(self, session, payloads):
+        """Called before commit; nothing to do for an in-process bus."""
+
+    def deliver(self, payloads):
+        """Called after commit."""
+        for payload in payloads:
+            self.dispatch(payload)
+
+
+class PostgresEventBus(LocalEventBus):
+    """
+    Cross-worker fan-out over LISTEN/NOTIFY. Events are sent with pg_notify
+    inside the writing transaction, so Postgres only delivers them if it
+    commits. Each worker runs one listener thread that dispatches incoming
+    notifications to its local subscribers.
+    """
+
+    def __init__(self, engine):
+        super().__init__()
+        self._engine = engine
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def subscribe(self, max_queued=100):
+        self._ensure_listener()
+        return super().subscribe(max_queued)
+
+    def send(self, session, payloads):
+        for payload in payloads:
+            session.execute(text("SELECT pg_notify(:channel, :payload)"),
+                            {"channel": CHANNEL, "payload": json.dumps(payload)})
+
+    def deliver(self, payloads):
+        pass  # Delivered back to every worker, us included, by the listener
+
+    def _ensure_listener(self):
+        # Started lazily so it always lives in the (post-fork) worker
+        with self._listener_lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='slot-events-listener', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                # A dedicated connection, detached from the pool for good
+                connection = self._engine.raw_connection()
+                connection.detach()
+                dbapi_connection = connection.dbapi_connection
+                dbapi_connection.autocommit = True
+                with dbapi_connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CHANNEL}")
+
+                while True:
+                    if select.select([dbapi_connection], [], [], 5) == ([], [], []):
+                        continue
+                    dbapi_connection.poll()
+                    while dbapi_connection.notifies:
+                        notify = dbapi_connection.notifies.pop(0)
+                        self.dispatch(json.loads(notify.payload))
+            except Exception:
+                logger.exception("Slot event listener failed, reconnecting")
+                time.sleep(1)
+
+
+def slot_event(kind, slot):
+    """Event payload for a change to a TimeSlot."""
+    return {
+        "type": f"slot.{kind}",
+        "slot_id": str(slot.id),
+        "tutor_id": str(slot.tutor_id),
+        "start_time": slot.start_time.isoformat(),
+        "end_time": slot.end_time.isoformat(),
+        "status": slot.status
+    }
+
+
+def publish(payload):
+    """
+    Queues an event on the current session. It is sent when the session
+    commits and dropped if it rolls back.
+    """
+    db.session.info.setdefault('pending_events', []).append(payload)
+
+
+def get_bus():
+    return current_app.extensions['event_bus']
+
+
+def _on_before_commit(session):
+    payloads = session.info.get('pending_events')
+    if payloads:
+        get_bus().send(session, payloads)
+
+
+def _on_after_commit(session):
+    payloads = session.info.pop('pending_events', None)
+    if payloads:
+        get_bus().deliver(payloads)
+
+
+def _on_after_rollback(session):
+    session.info.pop('pending_events', None)
+
+
+def init_app(app):
+    backend = app.config.get('EVENT_BUS', 'postgres')
+    if backend == 'postgres' and app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgres'):
+        with app.app_context():
+            bus = PostgresEventBus(db.engine)
+    else:
+        bus = LocalEventBus()
+    app.extensions['event_bus'] = bus
+
+
+event.listen(RoutingSession, 'before_commit', _on_before_commit)
+event.listen(RoutingSession, 'after_commit', _on_after_commit)
+event.listen(RoutingSession, 'after_rollback', _on_after_rollback)
@@ -0,0 +1,167 @@
+import heapq
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import select, exists, or_
+from sqlalchemy.orm import selectinload
+from app.models import db, Tutor, TimeSlot, Class, AvailabilityRule, tutor_class_association
+from app.utils.recurrence import virtual_slots
+
+# One bookable slot, as the matcher sees it
+Candidate = namedtuple('Candidate', 'slot_id tutor_id start end hourly_rate average_rating review_count')
+
+Match = namedtuple('Match', 'score candidate overlap_start overlap_end')
+
+# Score weights: tutor rating, share of the slot inside the student's
+# window, and how far below the price ceiling (if one was given) the tutor is
+RATING_WEIGHT = 0.5
+COVERAGE_WEIGHT = 0.3
+PRICE_WEIGHT = 0.2
+
+# Reviews needed before a tutor's average counts in full; fewer pull the
+# rating towards the neutral midpoint
+RATING_CONFIDENCE_REVIEWS = 5
+
+# Longest slot a recurring rule can produce (see create_availability_rule)
+MAX_RULE_SLOT = timedelta(minutes=8 * 60)
+
+
+def merge_windows(windows):
+    """Sorts (start, end) windows and merges the overlapping ones."""
+    merged = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(w) for w in merged]
+
+
+def sweep(windows, candidates, min_overlap):
+    """
+    Sweep-line intersection of merged, sorted windows with candidates sorted
+    by start time. Yields (candidate, overlap_start, overlap_end) for every
+    overlap of at least min_overlap. Windows that end before the current
+    slot starts can't meet any later slot, so the window pointer only moves
+    forward: O(windows + slots + matches).
+    """
+    first = 0
+    for candidate in candidates:
+        while first < len(windows) and windows[first][1] <= candidate.start:
+            first += 1
+        if first == len(windows):
+            return
+        i = first
+        while i < len(windows) and windows[i][0] < candidate.end:
+            overlap_start = max(windows[i][0], candidate.start)
+            overlap_end = min(windows[i][1], candidate.end)
+            if overlap_end - overlap_start >= min_overlap:
+                yield candidate, overlap_start, overlap_end
+            i += 1
+
+
+def score(candidate, overlap_start, overlap_end, price_ceiling):
+    reviews = candidate.review_count or 0
+    rating = float(candidate.average_rating or 0)
+    confidence = min(reviews, RATING_CONFIDENCE_REVIEWS) / RATING_CONFIDENCE_REVIEWS
+    rating_score = (confidence * rating + (1 - confidence) * 2.5) / 5
+
+    slot_length = (candidate.end - candidate.start).total_seconds()
+    coverage = (overlap_end - overlap_start).total_seconds() / slot_length if slot_length else 0
+
+    price_score = 0.0
+    if price_ceiling:
+        price_score = max(0.0, 1 - float(candidate.hourly_rate) / price_ceiling)
+
+    return RATING_WEIGHT * rating_score + COVERAGE_WEIGHT * coverage + PRICE_WEIGHT * price_score
+
+
+def rank(overlaps, price_ceiling, limit, per_tutor):
+    """
+    Keeps the best `per_tutor` overlaps of each tutor (bounded min-heaps),
+    then the best `limit` overall, so a single tutor with many open slots
+    can't fill the whole list.
+    """
+    best = {}
+    for order, (candidate, overlap_start, overlap_end) in enumerate(overlaps):
+        entry = (score(candidate, overlap_start, overlap_end, price_ceiling), -order,
+                 Match(None, candidate, overlap_start, overlap_end))
+        heap = best.setdefault(candidate.tutor_id, [])
+        if len(heap) < per_tutor:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+
+    # Ties go to the earlier slot (larger -order)
+    top = heapq.nlargest(limit, (entry for heap in best.values() for entry in heap))
+    return [match._replace(score=round(value, 4)) for value, _, match in top]
+
+
+def candidate_slots(windows, class_id=None, subject_id=None, max_rate=None):
+    """
+    Available future slots that touch the windows, of tutors linked to the
+    class (or any class of the subject), ordered by start time: concrete
+    slots (only the columns the matcher needs) merged with occurrences of
+    recurring rules.
+    """
+    span_start, span_end = windows[0][0], windows[-1][1]
+
+    linked = select(tutor_class_association.c.tutor_id)
+    if class_id:
+        linked = linked.where(tutor_class_association.c.class_id == class_id)
+    else:
+        linked = linked.join(Class, Class.id == tutor_class_association.c.class_id)\
+            .where(Class.subject_id == subject_id)
+
+    query = select(
+        TimeSlot.id, TimeSlot.tutor_id, TimeSlot.start_time, TimeSlot.end_time,
+        Tutor.hourly_rate, Tutor.average_rating, Tutor.review_count
+    ).join(Tutor, Tutor.id == TimeSlot.tutor_id).where(
+        TimeSlot.status == 'available',
+        TimeSlot.start_time > datetime.utcnow(),
+        TimeSlot.start_time < span_end,
+        TimeSlot.end_time > span_start,
+        exists(linked.where(tutor_class_association.c.tutor_id == Tutor.id))
+    )
+    if max_rate is not None:
+        query = query.where(Tutor.hourly_rate <= max_rate)
+
+    # Stream rows instead of materializing hundreds of thousands of ORM objects
+    result = db.session.execute(
+        query.order_by(TimeSlot.start_time, TimeSlot.id).execution_options(yield_per=2000)
+    )
+    concrete = (Candidate(*row) for row in result)
+
+    # Recurring rules of the same tutors, expanded over the span
+    rules = db.session.query(
+        AvailabilityRule, Tutor.hourly_rate, Tutor.average_rating, Tutor.review_count
+    ).join(Tutor, Tutor.id == AvailabilityRule.tutor_id).options(
+        selectinload(AvailabilityRule.exceptions)
+    ).filter(
+        AvailabilityRule.valid_from <= span_end.date(),
+        or_(AvailabilityRule.valid_until.is_(None), AvailabilityRule.valid_until >= span_start.date()),
+        exists(linked.where(tutor_class_association.c.tutor_id == Tutor.id))
+    )
+    if max_rate is not None:
+        rules = rules.filter(Tutor.hourly_rate <= max_rate)
+    rules = rules.all()
+    stats = {rule.id: tutor_stats for rule, *tutor_stats in rules}
+
+    # Reach back one longest-possible slot for occurrences running into the span
+    expand_start = max(span_start - MAX_RULE_SLOT, datetime.utcnow())
+    recurring = [
+        Candidate(v.id, v.tutor_id, v.start_time, v.end_time, *stats[v.rule_id])
+        for v in virtual_slots([rule for rule, *_ in rules], expand_start, span_end)
+        if v.end_time > span_start
+    ]
+
+    return heapq.merge(concrete, recurring, key=lambda c: c.start)
+
+
+def find_matches(windows, class_id=None, subject_id=None, max_rate=None,
+                 min_overlap=timedelta(minutes=30), limit=20, per_tutor=3):
+    """Ranked (tutor, slot) matches for a student's free windows."""
+    windows = merge_windows(windows)
+    if not windows:
+        return []
+    candidates = candidate_slots(windows, class_id, subject_id, max_rate)
+    return rank(sweep(windows, candidates, min_overlap), max_rate, limit, per_tutor)
@@ -0,0 +1,268 @@
+import atexit
+import json
+import os
+import threading
+import time
+from flask import current_app, g, request
+from app.utils import sql_timing
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+# Requests that matched no route share one label, so a scan of random
+# paths cannot blow up the number of series
+UNMATCHED = 'unmatched'
+
+PREFIX = 'tutormatch_http_'
+
+
+class RouteMetrics:
+    """
+    This worker's request counters, latency histograms, database time and
+    in-flight gauge, keyed by endpoint (the route, not the raw path).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}     # (endpoint, method, status) -> count
+        self.latency = {}      # (endpoint, method) -> [bucket counts..., sum]
+        self.db_seconds = {}   # (endpoint, method) -> seconds
+        self.in_flight = {}    # endpoint -> requests being handled
+
+    def started(self, endpoint):
+        with self._lock:
+            self.in_flight[endpoint] = self.in_flight.get(endpoint, 0) + 1
+
+    def finished(self, endpoint):
+        with self._lock:
+            self.in_flight[endpoint] = max(self.in_flight.get(endpoint, 0) - 1, 0)
+
+    def observe(self, endpoint, method, status, seconds, db_seconds):
+        with self._lock:
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            histogram = self.latency.get((endpoint, method))
+            if histogram is None:
+                histogram = self.latency[(endpoint, method)] = [0] * len(LATENCY_BUCKETS) + [0.0]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    histogram[i] += 1
+                    break
+            histogram[-1] += seconds
+            self.db_seconds[(endpoint, method)] = self.db_seconds.get((endpoint, method), 0.0) + db_seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": [[*key, count] for key, count in self.requests.items()],
+                "latency": [[*key, list(histogram)] for key, histogram in self.latency.items()],
+                "db_seconds": [[*key, seconds] for key, seconds in self.db_seconds.items()],
+                "in_flight": [[endpoint, count] for endpoint, count in self.in_flight.items()]
+            }
+
+
+class MultiprocessStore:
+    """
+    One JSON file per gunicorn worker in a shared directory, rewritten
+    atomically every flush. A scrape sums every file, so whichever worker
+    answers /metrics reports the whole server. Counters of workers that
+    exited stay in their file (renamed dead-<pid>.json by the master's
+    child_exit hook) so totals never go backwards; their gauges are ignored.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, pid, prefix='worker'):
+        return os.path.join(self.directory, f'{prefix}-{pid}.json')
+
+    def write(self, pid, snapshot):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = os.path.join(self.directory, f'.tmp-{pid}')
+        with open(tmp, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, self._path(pid))
+
+    def mark_dead(self, pid):
+        try:
+            os.replace(self._path(pid), self._path(pid, 'dead'))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith('.json') or name.startswith('.tmp-'):
+                os.remove(os.path.join(self.directory, name))
+
+    def collect(self):
+        """Sums every worker's snapshot into one RouteMetrics."""
+        total = RouteMetrics()
+        names = os.listdir(self.directory) if os.path.isdir(self.directory) else []
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for endpoint, method, status, count in snapshot['requests']:
+                key = (endpoint, method, status)
+                total.requests[key] = total.requests.get(key, 0) + count
+            for endpoint, method, histogram in snapshot['latency']:
+                merged = total.latency.setdefault((endpoint, method), [0] * len(LATENCY_BUCKETS) + [0.0])
+                for i, value in enumerate(histogram):
+                    merged[i] += value
+            for endpoint, method, seconds in snapshot['db_seconds']:
+                total.db_seconds[(endpoint, method)] = total.db_seconds.get((endpoint, method), 0.0) + seconds
+            if name.startswith('worker-'):
+                for endpoint, count in snapshot['in_flight']:
+                    total.in_flight[endpoint] = total.in_flight.get(endpoint, 0) + count
+        return total
+
+
+class MetricsRecorder:
+    """Ties this process's RouteMetrics to the store and flushes it periodically."""
+
+    def __init__(self, config):
+        self.enabled = config['METRICS_ENABLED']
+        self.flush_seconds = config['METRICS_FLUSH_SECONDS']
+        self.store = MultiprocessStore(config['METRICS_DIR'])
+        self.metrics = RouteMetrics()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_flusher(self):
+        # With preload_app the recorder is created in the master, so each
+        # worker starts its own flusher (and its own counters) on first use
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            if self._pid is not None:
+                self.metrics = RouteMetrics()
+            self._pid = pid
+            thread = threading.Thread(target=self._flush_forever, name='metrics-flush', daemon=True)
+            thread.start()
+            atexit.register(self.flush)
+
+    def _flush_forever(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+    def flush(self):
+        if self._pid != os.getpid():
+            return
+        try:
+            self.store.write(self._pid, self.metrics.snapshot())
+        except OSError:
+            pass  # A full or missing disk must not take requests down with it
+
+    def collect(self):
+        self.ensure_flusher()
+        self.flush()
+        return self.store.collect()
+
+
+def get_metrics():
+    return current_app.extensions['metrics']
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _bound(bound):
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+def render(metrics):
+    """The collected metrics in the Prometheus text exposition format (0.0.4)."""
+    lines = [
+        f'# HELP {PREFIX}requests_total Requests handled, by route and status code.',
+        f'# TYPE {PREFIX}requests_total counter'
+    ]
+    for (endpoint, method, status), count in sorted(metrics.requests.items()):
+        lines.append(f'{PREFIX}requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}')
+
+    lines += [
+        f'# HELP {PREFIX}request_duration_seconds Time from routing to the response being built.',
+        f'# TYPE {PREFIX}request_duration_seconds histogram'
+    ]
+    for (endpoint, method), histogram in sorted(metrics.latency.items()):
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, histogram):
+            cumulative += count
+            labels = _labels(endpoint=endpoint, method=method, le=_bound(bound))
+            lines.append(f'{PREFIX}request_duration_seconds_bucket{labels} {cumulative}')
+        labels = _labels(endpoint=endpoint, method=method)
+        lines.append(f'{PREFIX}request_duration_seconds_sum{labels} {histogram[-1]!r}')
+        lines.append(f'{PREFIX}request_duration_seconds_count{labels} {cumulative}')
+
+    lines += [
+        f'# HELP {PREFIX}request_db_seconds_total Time spent in SQL statements while handling requests.',
+        f'# TYPE {PREFIX}request_db_seconds_total counter'
+    ]
+    for (endpoint, method), seconds in sorted(metrics.db_seconds.items()):
+        lines.append(f'{PREFIX}request_db_seconds_total{_labels(endpoint=endpoint, method=method)} {seconds!r}')
+
+    lines += [
+        f'# HELP {PREFIX}request_db_time_ratio Share of request time spent in SQL since start.',
+        f'# TYPE {PREFIX}request_db_time_ratio gauge'
+    ]
+    for (endpoint, method), histogram in sorted(metrics.latency.items()):
+        if histogram[-1] > 0:
+            ratio = min(metrics.db_seconds.get((endpoint, method), 0.0) / histogram[-1], 1.0)
+            lines.append(f'{PREFIX}request_db_time_ratio{_labels(endpoint=endpoint, method=method)} {ratio:.6f}')
+
+    lines += [
+        f'# HELP {PREFIX}requests_in_flight Requests being handled right now, across live workers.',
+        f'# TYPE {PREFIX}requests_in_flight gauge'
+    ]
+    for endpoint, count in sorted(metrics.in_flight.items()):
+        lines.append(f'{PREFIX}requests_in_flight{_labels(endpoint=endpoint)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def _before_request():
+    recorder = get_metrics()
+    if not recorder.enabled:
+        return
+    recorder.ensure_flusher()
+    g.metrics_endpoint = request.endpoint or UNMATCHED
+    g.metrics_start = time.perf_counter()
+    recorder.metrics.started(g.metrics_endpoint)
+
+
+def _after_request(response):
+    start = g.pop('metrics_start', None)
+    if start is not None:
+        get_metrics().metrics.observe(
+            g.metrics_endpoint, request.method, str(response.status_code),
+            time.perf_counter() - start, sql_timing.request_sql_time()
+        )
+    return response
+
+
+def _teardown_request(exc):
+    endpoint = g.pop('metrics_endpoint', None)
+    if endpoint is not None:
+        get_metrics().metrics.finished(endpoint)
+
+
+def init_app(app):
+    """Registers the hooks; call before admission.init_app so shed requests are counted too."""
+    app.extensions['metrics'] = MetricsRecorder(app.config)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
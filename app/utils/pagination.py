@@ -0,0 +1,87 @@
+import base64
+import json
+from datetime import datetime, timezone
+from uuid import UUID
+from flask import request, jsonify
+from sqlalchemy import or_, and_
+
+
+def encode_cursor(*values):
+    """Packs the sort key of the last row of a page into an opaque token."""
+    raw = json.dumps([v.isoformat() if hasattr(v, 'isoformat') else str(v) for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Unpacks a token made by encode_cursor into its list of string values.
+    Returns None for an empty token; raises ValueError for a malformed one.
+    """
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def limit_arg(default=20, maximum=100):
+    """Reads ?limit=, clamped to [1, maximum]."""
+    limit = request.args.get('limit', default, type=int)
+    return max(1, min(limit, maximum))
+
+
+def parse_datetime(value):
+    """
+    ISO datetime as the naive UTC the database stores; an offset, if
+    given, is converted. Raises ValueError if malformed.
+    """
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def decode_time_cursor(token):
+    """Decodes a (timestamp, id) cursor. Raises ValueError if malformed."""
+    values = decode_cursor(token)
+    if values is None:
+        return None
+    try:
+        return parse_datetime(values[0]), UUID(values[1])
+    except (ValueError, IndexError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def window_args():
+    """Reads the ?from= / ?to= ISO datetimes. Raises ValueError if malformed."""
+    start, end = request.args.get('from'), request.args.get('to')
+    try:
+        return (
+            parse_datetime(start) if start else None,
+            parse_datetime(end) if end else None
+        )
+    except ValueError as e:
+        raise ValueError(f"Invalid time window: {e}") from e
+
+
+def after_cursor(time_column, id_column, cursor, descending=False):
+    """Keyset condition for rows that sort after cursor on (time, id)."""
+    cursor_time, cursor_id = cursor
+    if descending:
+        return or_(time_column < cursor_time, and_(time_column == cursor_time, id_column < cursor_id))
+    return or_(time_column > cursor_time, and_(time_column == cursor_time, id_column > cursor_id))
+
+
+def paged_response(items, next_cursor):
+    """
+    JSON list response; the cursor for the next page, if any, goes in the
+    X-Next-Cursor header so existing clients still get a plain list.
+    """
+    response = jsonify(items)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
@@ -0,0 +1,167 @@
+import math
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+from app.extensions import db
+
+# Upper bounds (seconds) of the checkout wait histogram buckets
+WAIT_BUCKETS = (0.001, 0.01, 0.1, 1.0, float('inf'))
+
+# Time constant (seconds) of the decaying average of checkout waits
+RECENT_WAIT_DECAY = 5.0
+
+
+class PoolMetrics:
+    """Counters for one connection pool, fed by pool event listeners."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.in_use = 0
+        self.in_use_peak = 0
+        self.overflow_peak = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_buckets = [0] * len(WAIT_BUCKETS)
+        self.last_wait = 0.0
+        self._recent_wait = 0.0
+        self._recent_wait_at = time.monotonic()
+
+    def _decayed(self, now):
+        return self._recent_wait * math.exp(-(now - self._recent_wait_at) / RECENT_WAIT_DECAY)
+
+    def recent_wait(self):
+        """
+        Exponentially decaying average of checkout waits. It also decays
+        while no checkouts happen, so it recovers once load is shed.
+        """
+        with self._lock:
+            return self._decayed(time.monotonic())
+
+    def record_wait(self, seconds, timed_out=False):
+        now = time.monotonic()
+        with self._lock:
+            self.last_wait = seconds
+            self._recent_wait = self._decayed(now) * 0.8 + seconds * 0.2
+            self._recent_wait_at = now
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            for i, bound in enumerate(WAIT_BUCKETS):
+                if seconds <= bound:
+                    self.wait_buckets[i] += 1
+                    break
+            if timed_out:
+                self.timeouts += 1
+
+    # --- Pool event listeners ---
+    def on_checkout(self, pool, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.in_use_peak = max(self.in_use_peak, self.in_use)
+            self.overflow_peak = max(self.overflow_peak, self.in_use - pool.size())
+
+    def on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+            self.in_use = max(self.in_use - 1, 0)
+
+    def on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self, pool):
+        with self._lock:
+            waits = sum(self.wait_buckets)
+            return {
+                "pool_size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "overflow": max(pool.overflow(), 0),
+                "in_use": self.in_use,
+                "in_use_peak": self.in_use_peak,
+                "overflow_peak": self.overflow_peak,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "wait_ms": {
+                    "avg": round(self.wait_total / waits * 1000, 3) if waits else 0.0,
+                    "max": round(self.wait_max * 1000, 3),
+                    "last": round(self.last_wait * 1000, 3),
+                    "recent": round(self._decayed(time.monotonic()) * 1000, 3),
+                    "buckets": {
+                        ("+Inf" if bound == float('inf') else str(bound * 1000)): count
+                        for bound, count in zip(WAIT_BUCKETS, self.wait_buckets)
+                    }
+                }
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that times how long each checkout waits for a connection
+    (including opening a new one) and counts usage through pool events.
+    """
+
+    def __init__(self, *args, **kwargs):
+        recreated = kwargs.get('_dispatch') is not None
+        super().__init__(*args, **kwargs)
+        if not recreated:
+            self.metrics = PoolMetrics()
+            event.listen(self, 'checkout', lambda *a: self.metrics.on_checkout(self, *a))
+            event.listen(self, 'checkin', self.metrics.on_checkin)
+            event.listen(self, 'connect', self.metrics.on_connect)
+            event.listen(self, 'invalidate', self.metrics.on_invalidate)
+
+    def recreate(self):
+        # engine.dispose() swaps in a new pool that inherits our listeners;
+        # hand it the same counters so metrics survive the swap
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record_wait(time.perf_counter() - start)
+        return connection
+
+
+def init_app(app):
+    """
+    Makes every engine use the instrumented pool. Must run before
+    db.init_app(app), which creates the engines.
+    """
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if url.drivername.startswith('sqlite') and url.database in (None, '', ':memory:'):
+        return  # in-memory SQLite needs its StaticPool
+    # Copy so we never mutate the dict shared through config.Config
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    options.setdefault('poolclass', InstrumentedQueuePool)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def pool_stats():
+    """Metrics for every configured engine, keyed by bind name."""
+    stats = {}
+    for name, engine in db.engines.items():
+        metrics = getattr(engine.pool, 'metrics', None)
+        if metrics is not None:
+            stats[name or 'default'] = metrics.snapshot(engine.pool)
+    return stats
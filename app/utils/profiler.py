@@ -0,0 +1,159 @@
+import cProfile
+import json
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from functools import wraps
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from flask import request
+
+HEADER = 'X-Profile'
+
+# One capture at a time per process: Python 3.12 refuses a second active
+# cProfile, and before that the two would record each other's calls
+_capturing = threading.Lock()
+
+# Where a function's own time is booked, matched against its file path
+# (or, for C builtins, its name). First match wins; the rest is framework.
+CATEGORIES = (
+    ('sql', ('sqlalchemy', 'psycopg2', 'sqlite3')),
+    ('serialization', ('json',)),
+    ('hashing', ('werkzeug/security', 'hashlib', 'scrypt', 'pbkdf2')),
+)
+
+
+def _token_serializer(app):
+    return URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='request-profile')
+
+
+def issue_token(app, issued_by):
+    """A token that, sent as X-Profile, profiles the request. See profile_token in admin_routes."""
+    return _token_serializer(app).dumps({"by": str(issued_by)})
+
+
+def _wants_profile(app):
+    token = request.headers.get(HEADER)
+    if token:
+        try:
+            _token_serializer(app).loads(token, max_age=app.config['PROFILE_TOKEN_MAX_AGE'])
+            return True
+        except BadSignature:
+            return False
+    rate = app.config['PROFILE_SAMPLE_RATE']
+    return rate > 0 and random.random() < rate
+
+
+def categorize(stats, app_root):
+    """Splits the profile's total time by category using each function's own time."""
+    split = {'sql': 0.0, 'serialization': 0.0, 'hashing': 0.0, 'app': 0.0, 'framework': 0.0}
+    for (filename, _, name), (_, _, own_time, _, _) in stats.stats.items():
+        where = name if filename == '~' else filename.replace(os.sep, '/')
+        for category, needles in CATEGORIES:
+            if any(needle in where for needle in needles):
+                split[category] += own_time
+                break
+        else:
+            split['app' if filename.startswith(app_root) else 'framework'] += own_time
+    return {category: round(seconds * 1000, 3) for category, seconds in split.items()}
+
+
+class ProfileWriter:
+    """Writes profiles to a directory, keeping only the newest max_files."""
+
+    def __init__(self, directory, max_files):
+        self.directory = directory
+        self.max_files = max_files
+        self._lock = threading.Lock()
+
+    def write(self, profile_id, profile, summary):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"{int(time.time() * 1000)}-{profile_id}")
+        profile.dump_stats(base + '.prof')
+        with open(base + '.json', 'w') as f:
+            json.dump(summary, f)
+        self._rotate()
+
+    def _rotate(self):
+        with self._lock:
+            captures = sorted(name[:-5] for name in os.listdir(self.directory) if name.endswith('.json'))
+            for stale in captures[:-self.max_files] if len(captures) > self.max_files else []:
+                for extension in ('.json', '.prof'):
+                    try:
+                        os.remove(os.path.join(self.directory, stale + extension))
+                    except FileNotFoundError:
+                        pass
+
+
+def _profiled(view, app):
+    app_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # While another request is being profiled this one just runs
+        if not _wants_profile(app) or not _capturing.acquire(blocking=False):
+            return view(*args, **kwargs)
+
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            profile.enable()
+        except ValueError:
+            # Some other profiler (a debugger, say) holds the hook
+            _capturing.release()
+            return view(*args, **kwargs)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            profile.disable()
+            _capturing.release()
+            wall = time.perf_counter() - start
+            profile_id = uuid.uuid4().hex[:12]
+            summary = {
+                "id": profile_id,
+                "endpoint": request.endpoint,
+                "method": request.method,
+                "path": request.path,
+                "at": time.time(),
+                "wall_ms": round(wall * 1000, 3),
+                "split_ms": categorize(pstats.Stats(profile), app_root)
+            }
+            try:
+                app.extensions['profile_writer'].write(profile_id, profile, summary)
+            except OSError:
+                app.logger.exception("Could not write request profile")
+    return wrapper
+
+
+def init_app(app):
+    """
+    Wraps every registered view; call after the blueprints are registered.
+    With PROFILE_SAMPLE_RATE at 0 and no X-Profile header the wrapper costs
+    one header lookup per request.
+    """
+    app.extensions['profile_writer'] = ProfileWriter(app.config['PROFILE_DIR'], app.config['PROFILE_MAX_FILES'])
+    for endpoint, view in list(app.view_functions.items()):
+        if endpoint != 'static':
+            app.view_functions[endpoint] = _profiled(view, app)
+
+
+def load_captures(directory, endpoint=None):
+    """(summary, path to .prof) for every capture in the directory, oldest first."""
+    captures = []
+    if not os.path.isdir(directory):
+        return captures
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.json'):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            with open(path) as f:
+                summary = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if endpoint and summary.get('endpoint') != endpoint:
+            continue
+        captures.append((summary, path[:-5] + '.prof'))
+    return captures
@@ -0,0 +1,244 @@
+import heapq
+import math
+import threading
+import time
+from collections import Counter
+from sqlalchemy import delete, func, insert, or_, select
+from flask import current_app
+from app.extensions import db
+from app.models import Class, Review, Student, Subject, Tutor, TutorCooccurrence, TutoringSession, tutor_class_association
+
+# ?sort= value of the personalized order, also used when no sort is given
+RECOMMENDED = 'recommended'
+
+SIGNALS = ('rating', 'price', 'affinity', 'cooccurrence', 'history')
+
+# Rating prior when nobody has been reviewed yet: the middle of the scale
+DEFAULT_MEAN_RATING = 3.0
+# Seconds a worker reuses the mean rating over all reviews
+MEAN_RATING_TTL = 300
+
+# Price fit is a bell curve around the student's usual rate, at least
+# this wide (fraction of the rate, and dollars)
+PRICE_SPREAD_RATIO = 0.25
+PRICE_SPREAD_MIN = 5.0
+# A subject matching the student's major counts like one booked tutor teaching it
+MAJOR_WEIGHT = 1.0
+# Bookings with one tutor past which repeat signal stops growing
+REPEAT_CAP = 3
+
+
+def parse_weights(spec):
+    """'rating=0.3,price=0.2,...' -> {signal: weight}; raises ValueError."""
+    weights = dict.fromkeys(SIGNALS, 0.0)
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        name, _, value = part.partition('=')
+        name = name.strip()
+        if name not in weights:
+            raise ValueError(f"Unknown ranking signal {name!r}")
+        weights[name] = float(value)
+    return weights
+
+
+def personalized(args):
+    """Whether find_tutors ranks these search arguments for the student."""
+    return args.get('sort') in (None, '', RECOMMENDED)
+
+
+class Profile:
+    """What a student's history says about the tutors they would pick."""
+
+    def __init__(self):
+        self.bookings = {}       # tutor_id -> sessions booked with them
+        self.ratings = {}        # tutor_id -> the student's own mean rating
+        self.rate_mean = None    # Booking-weighted hourly rate, None without history
+        self.rate_spread = None
+        self.affinity = {}       # tutor_id -> 0..1 share of the student's subjects they teach
+        self.cooccurrence = {}   # tutor_id -> 0..1 booked by students who booked the same tutors
+
+    @classmethod
+    def load(cls, user_id):
+        profile = cls()
+        student = db.session.execute(
+            select(Student.id, Student.major).where(Student.user_id == user_id)
+        ).first()
+
+        # Sessions point at the tutor's user row
+        booked = db.session.execute(
+            select(Tutor.id, Tutor.hourly_rate, func.count())
+            .join(TutoringSession, TutoringSession.tutor_id == Tutor.user_id)
+            .where(TutoringSession.student_id == user_id)
+            .group_by(Tutor.id, Tutor.hourly_rate)
+        ).all()
+        profile.bookings = {tutor_id: n for tutor_id, _, n in booked}
+        if booked:
+            total = sum(n for _, _, n in booked)
+            mean = sum(float(rate) * n for _, rate, n in booked) / total
+            variance = sum(n * (float(rate) - mean) ** 2 for _, rate, n in booked) / total
+            profile.rate_mean = mean
+            profile.rate_spread = max(math.sqrt(variance), mean * PRICE_SPREAD_RATIO, PRICE_SPREAD_MIN)
+
+        if student is not None:
+            profile.ratings = {tutor_id: float(rating) for tutor_id, rating in db.session.execute(
+                select(Review.tutor_id, func.avg(Review.rating))
+                .where(Review.student_id == student.id)
+                .group_by(Review.tutor_id)
+            )}
+
+        # Subjects the student studies: those of the tutors they booked,
+        # once per tutor, plus the one whose name or code is their major
+        subjects = Counter()
+        if booked:
+            subjects.update(subject_id for subject_id, in db.session.execute(
+                select(Class.subject_id)
+                .join(tutor_class_association, tutor_class_association.c.class_id == Class.id)
+                .where(tutor_class_association.c.tutor_id.in_(profile.bookings))
+                .group_by(tutor_class_association.c.tutor_id, Class.subject_id)
+            ))
+        if student is not None and student.major:
+            major = student.major.strip().lower()
+            for subject_id in db.session.scalars(
+                    select(Subject.id).where(or_(func.lower(Subject.name) == major, func.lower(Subject.code) == major))):
+                subjects[subject_id] += MAJOR_WEIGHT
+        if subjects:
+            total = sum(subjects.values())
+            affinity = Counter()
+            for tutor_id, subject_id in db.session.execute(
+                    select(tutor_class_association.c.tutor_id, Class.subject_id)
+                    .join(Class, Class.id == tutor_class_association.c.class_id)
+                    .where(Class.subject_id.in_(subjects))
+                    .distinct()):
+                affinity[tutor_id] += subjects[subject_id] / total
+            profile.affinity = {tutor_id: min(share, 1.0) for tutor_id, share in affinity.items()}
+
+        if booked:
+            counts = dict(db.session.execute(
+                select(TutorCooccurrence.other_tutor_id, func.sum(TutorCooccurrence.students))
+                .where(TutorCooccurrence.tutor_id.in_(profile.bookings))
+                .group_by(TutorCooccurrence.other_tutor_id)
+            ).all())
+            if counts:
+                scale = math.log1p(max(counts.values()))
+                profile.cooccurrence = {tutor_id: math.log1p(n) / scale for tutor_id, n in counts.items()}
+        return profile
+
+
+class Ranker:
+    """Scores one student's candidate tutors; see Ranking.ranker."""
+
+    def __init__(self, profile, weights, prior_weight, mean_rating):
+        self.profile = profile
+        self.weights = weights
+        self.prior_weight = prior_weight
+        self.mean_rating = mean_rating
+
+    def scores(self, ids, rates, ratings, reviews):
+        """
+        One score per candidate. The columns are parallel sequences (tutor
+        ids, hourly rates, average ratings, review counts) and each signal
+        is computed over the whole batch at once; the per-student signals
+        only touch the few candidates they name.
+        """
+        profile, w = self.profile, self.weights
+
+        # Bayesian average: a tutor's reviews pulled toward the mean of all
+        # reviews by prior_weight phantom ones, scaled from 1..5 to 0..1
+        c, m, wr = self.prior_weight, self.mean_rating, w['rating']
+        total = [wr * ((c * m + a * k) / (c + k) - 1) / 4 for a, k in zip(ratings, reviews)]
+
+        if profile.rate_mean is not None and w['price']:
+            mean, spread, wp = profile.rate_mean, profile.rate_spread, w['price']
+            exp = math.exp
+            total = [t + wp * exp(-0.5 * ((r - mean) / spread) ** 2) for t, r in zip(total, rates)]
+
+        # Tutors the student keeps booking rank up; once reviewed, their own
+        # rating decides, from -1 (one star) to 1 (five)
+        history = {t: min(n, REPEAT_CAP) / REPEAT_CAP for t, n in profile.bookings.items()}
+        history.update((t, (rating - 3) / 2) for t, rating in profile.ratings.items())
+
+        sparse = [(w[name], signal) for name, signal in (
+            ('affinity', profile.affinity), ('cooccurrence', profile.cooccurrence), ('history', history)
+        ) if w[name] and signal]
+        if sparse:
+            # uuid hashing is slow in Python; their ints hash natively
+            position = dict(zip([t.int for t in ids], range(len(ids))))
+            for weight, signal in sparse:
+                for tutor_id, value in signal.items():
+                    i = position.get(tutor_id.int)
+                    if i is not None:
+                        total[i] += weight * value
+        return total
+
+    def rank(self, ids, rates, ratings, reviews, limit):
+        """The best `limit` candidate ids, in order; ties go by id."""
+        scores = self.scores(ids, rates, ratings, reviews)
+        top = heapq.nlargest(limit, range(len(scores)), key=scores.__getitem__)
+        if not top:
+            return []
+        # Everything scoring at least the last place, so ties at the cut
+        # are broken by id rather than by candidate order
+        cut = scores[top[-1]]
+        tied = [i for i, score in enumerate(scores) if score >= cut]
+        tied.sort(key=lambda i: (-scores[i], ids[i].int))
+        return [ids[i] for i in tied[:limit]]
+
+
+class Ranking:
+    def __init__(self, config):
+        self.weights = parse_weights(config['RANKING_WEIGHTS'])
+        self.prior_weight = config['RANKING_RATING_PRIOR']
+        self._mean_rating = None
+        self._mean_rating_at = 0.0
+        self._lock = threading.Lock()
+
+    def mean_rating(self):
+        """Mean of every review, recomputed at most every MEAN_RATING_TTL seconds."""
+        with self._lock:
+            if self._mean_rating is None or time.monotonic() - self._mean_rating_at > MEAN_RATING_TTL:
+                rating_sum, review_count = db.session.execute(
+                    select(func.sum(Tutor.rating_sum), func.sum(Tutor.review_count))
+                ).one()
+                self._mean_rating = float(rating_sum) / review_count if review_count else DEFAULT_MEAN_RATING
+                self._mean_rating_at = time.monotonic()
+            return self._mean_rating
+
+    def ranker(self, user_id):
+        """A Ranker for the student, with their profile loaded."""
+        return Ranker(Profile.load(user_id), self.weights, self.prior_weight, self.mean_rating())
+
+
+def get_ranking():
+    return current_app.extensions['ranking']
+
+
+def build(config):
+    """
+    Rebuilds tutor_cooccurrence from the booking history in one
+    transaction, keeping pairs booked by at least RANKING_MIN_COOCCURRENCE
+    students. Searches see the old counts until it commits.
+    """
+    started = time.perf_counter()
+    pairs = (
+        select(Tutor.id.label('tutor_id'), TutoringSession.student_id)
+        .join(Tutor, Tutor.user_id == TutoringSession.tutor_id)
+        .distinct()
+        .subquery()
+    )
+    a, b = pairs.alias('a'), pairs.alias('b')
+    students = func.count().label('students')
+    counts = (
+        select(a.c.tutor_id, b.c.tutor_id.label('other_tutor_id'), students)
+        .join(b, (b.c.student_id == a.c.student_id) & (b.c.tutor_id != a.c.tutor_id))
+        .group_by(a.c.tutor_id, b.c.tutor_id)
+        .having(func.count() >= config['RANKING_MIN_COOCCURRENCE'])
+    )
+    db.session.execute(delete(TutorCooccurrence))
+    written = db.session.execute(
+        insert(TutorCooccurrence).from_select(['tutor_id', 'other_tutor_id', 'students'], counts)
+    ).rowcount
+    db.session.commit()
+    return {"pairs": written, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def init_app(app):
+    app.extensions['ranking'] = Ranking(app.config)
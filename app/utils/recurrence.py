@@ -0,0 +1,108 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+from uuid import UUID
+from sqlalchemy import or_
+from sqlalchemy.orm import selectinload
+from app.models import db, AvailabilityRule, TimeSlot
+from app.utils.pagination import parse_datetime
+
+# How far ahead rules are expanded when the caller gives no end
+EXPANSION_HORIZON = timedelta(days=56)
+# Longest window a single request may expand
+MAX_EXPANSION = timedelta(days=92)
+
+# An unbooked occurrence of a rule. Quacks like a TimeSlot for listings;
+# its id is "<rule id>@<start time>" and books like any slot id.
+VirtualSlot = namedtuple('VirtualSlot', 'id tutor_id rule_id start_time end_time status student_id')
+
+
+def virtual_slot_id(rule_id, start):
+    return f"{rule_id}@{start.isoformat()}"
+
+
+def parse_virtual_slot_id(slot_id):
+    """
+    Returns (rule_id, start) for a virtual slot id, None for a plain slot id;
+    a start with an offset is converted to naive UTC like stored times.
+    Raises ValueError if it looks virtual but is malformed.
+    """
+    if '@' not in str(slot_id):
+        return None
+    rule_id, start = str(slot_id).split('@', 1)
+    return UUID(rule_id), parse_datetime(start)
+
+
+def expansion_window(window_start=None, window_end=None):
+    """
+    Clamps a requested window to the future and to MAX_EXPANSION. Open-ended
+    windows stop EXPANSION_HORIZON from now, so paging through them ends.
+    """
+    now = datetime.utcnow()
+    start = max(window_start or now, now)
+    end = min(window_end or now + EXPANSION_HORIZON, start + MAX_EXPANSION)
+    return start, end
+
+
+def active_rules(tutor_ids, window_start, window_end):
+    """Rules of these tutors valid at some point in the window, exceptions preloaded."""
+    return AvailabilityRule.query.options(selectinload(AvailabilityRule.exceptions)).filter(
+        AvailabilityRule.tutor_id.in_(tutor_ids),
+        AvailabilityRule.valid_from <= window_end.date(),
+        or_(AvailabilityRule.valid_until.is_(None), AvailabilityRule.valid_until >= window_start.date())
+    ).all()
+
+
+def virtual_slots(rules, window_start, window_end):
+    """
+    Expands rules into VirtualSlots starting in the window, sorted by
+    (start_time, rule_id). Occurrences already materialized as TimeSlot
+    rows are left out; those rows show up as regular slots.
+    """
+    if not rules or window_start >= window_end:
+        return []
+
+    materialized = set(db.session.query(TimeSlot.rule_id, TimeSlot.start_time).filter(
+        TimeSlot.rule_id.in_([rule.id for rule in rules]),
+        TimeSlot.start_time >= window_start,
+        TimeSlot.start_time < window_end
+    ))
+
+    slots = [
+        VirtualSlot(virtual_slot_id(rule.id, start), rule.tutor_id, rule.id, start, end, 'available', None)
+        for rule in rules
+        for start, end in rule.occurrences(window_start, window_end)
+        if (rule.id, start) not in materialized
+    ]
+    slots.sort(key=lambda s: (s.start_time, s.rule_id))
+    return slots
+
+
+def materialize(rule_id, start):
+    """
+    Returns the TimeSlot for one occurrence of a rule, creating it if needed,
+    or None if the rule has no such occurrence. The rule row is locked for
+    the rest of the transaction, so two students booking the same
+    occurrence line up behind each other instead of both creating it.
+    """
+    rule = AvailabilityRule.query.filter_by(id=rule_id).with_for_update().first()
+    if not rule:
+        return None
+
+    slot = TimeSlot.query.filter_by(rule_id=rule.id, start_time=start).first()
+    if slot:
+        return slot
+
+    occurrence = next(iter(rule.occurrences(start, start + timedelta(microseconds=1))), None)
+    if occurrence is None:
+        return None
+
+    slot = TimeSlot(
+        tutor_id=rule.tutor_id,
+        rule_id=rule.id,
+        start_time=occurrence[0],
+        end_time=occurrence[1],
+        status='available'
+    )
+    db.session.add(slot)
+    db.session.flush()
+    return slot
@@ -0,0 +1,254 @@
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import delete, func, insert, select
+from app.extensions import db
+from app.models import (
+    DailyTutorRollup, RollupWatermark, Review, SyncTombstone, TimeSlot, Tutor, TutoringSession
+)
+
+WATERMARK = 'daily_tutor_rollups'
+
+# Slot statuses that count as sold time
+SOLD = ('booked', 'completed')
+
+METRICS = ('slots_offered', 'offered_minutes', 'slots_booked', 'booked_minutes', 'revenue',
+           'bookings', 'cancellations', 'reviews', 'rating_sum')
+
+# Tutors recomputed per batch of queries
+TUTOR_BATCH = 500
+
+
+def _empty():
+    return dict.fromkeys(METRICS, 0)
+
+
+def _in_range(column, first_day, end_day):
+    conditions = []
+    if first_day is not None:
+        conditions.append(column >= datetime.combine(first_day, datetime.min.time()))
+    if end_day is not None:
+        conditions.append(column < datetime.combine(end_day, datetime.min.time()))
+    return conditions
+
+
+def _stream(query):
+    # Runs when first iterated, so each query is read to the end before the next starts
+    yield from db.session.execute(query.execution_options(yield_per=2000))
+
+
+def tally(slots, bookings, cancellations, reviews):
+    """
+    Folds raw rows into rollup rows keyed (day, tutor_id): slots as
+    (tutor_id, start, end, status, hourly_rate), bookings as (tutor_id,
+    created_at), cancellations as (tutor_id, deleted_at) and reviews as
+    (tutor_id, created_at, rating).
+    """
+    rows = defaultdict(_empty)
+    for tutor_id, start, end, status, hourly_rate in slots:
+        row = rows[(start.date(), tutor_id)]
+        minutes = int((end - start).total_seconds() // 60)
+        row['slots_offered'] += 1
+        row['offered_minutes'] += minutes
+        if status in SOLD:
+            row['slots_booked'] += 1
+            row['booked_minutes'] += minutes
+            row['revenue'] += hourly_rate * Decimal(minutes) / 60
+
+    for tutor_id, created_at in bookings:
+        rows[(created_at.date(), tutor_id)]['bookings'] += 1
+
+    for tutor_id, deleted_at in cancellations:
+        rows[(deleted_at.date(), tutor_id)]['cancellations'] += 1
+
+    for tutor_id, created_at, rating in reviews:
+        row = rows[(created_at.date(), tutor_id)]
+        row['reviews'] += 1
+        row['rating_sum'] += rating
+
+    return rows
+
+
+def compute(tutor_ids, first_day=None, end_day=None):
+    """
+    Rollup rows, keyed (day, tutor_id), for the tutors over [first_day,
+    end_day) (unbounded when None), computed from the raw tables with
+    range scans on the per-tutor indexes.
+    """
+    slots = _stream(
+        select(TimeSlot.tutor_id, TimeSlot.start_time, TimeSlot.end_time, TimeSlot.status, Tutor.hourly_rate)
+        .join(Tutor, Tutor.id == TimeSlot.tutor_id)
+        .where(TimeSlot.tutor_id.in_(tutor_ids), *_in_range(TimeSlot.start_time, first_day, end_day))
+    )
+
+    # Sessions and tombstones point at the tutor's user row
+    bookings = _stream(
+        select(Tutor.id, TutoringSession.created_at)
+        .join(Tutor, Tutor.user_id == TutoringSession.tutor_id)
+        .where(Tutor.id.in_(tutor_ids), *_in_range(TutoringSession.created_at, first_day, end_day))
+    )
+
+    cancellations = _stream(
+        select(Tutor.id, SyncTombstone.deleted_at)
+        .join(Tutor, Tutor.user_id == SyncTombstone.user_id)
+        .where(SyncTombstone.entity == 'tutoring_session', Tutor.id.in_(tutor_ids),
+               *_in_range(SyncTombstone.deleted_at, first_day, end_day))
+    )
+
+    reviews = _stream(
+        select(Review.tutor_id, Review.created_at, Review.rating)
+        .where(Review.tutor_id.in_(tutor_ids), *_in_range(Review.created_at, first_day, end_day))
+    )
+
+    return tally(slots, bookings, cancellations, reviews)
+
+
+def _replace(tutor_ids, first_day, end_day):
+    """Recomputes the tutors' rows over the range; returns the number written."""
+    conditions = [DailyTutorRollup.tutor_id.in_(tutor_ids)]
+    if first_day is not None:
+        conditions.append(DailyTutorRollup.day >= first_day)
+    if end_day is not None:
+        conditions.append(DailyTutorRollup.day < end_day)
+    db.session.execute(delete(DailyTutorRollup).where(*conditions))
+
+    rows = compute(tutor_ids, first_day, end_day)
+    if rows:
+        db.session.execute(insert(DailyTutorRollup), [
+            {"day": day, "tutor_id": tutor_id, **{k: round(v, 2) if k == 'revenue' else v for k, v in row.items()}}
+            for (day, tutor_id), row in rows.items()
+        ])
+    return len(rows)
+
+
+def _dirty_days(since_seq, reviews_since):
+    """
+    Which (tutor, day) pairs changed since the watermarks. Returns
+    ({tutor_id: set of days}, {tutor_ids to recompute in full}, highest
+    change_seq seen, newest review time seen).
+    """
+    days = defaultdict(set)
+    whole = set()
+    max_seq = since_seq
+    tutor_of_user = {}
+
+    for tutor_id, start, seq in db.session.execute(
+            select(TimeSlot.tutor_id, TimeSlot.start_time, TimeSlot.change_seq)
+            .where(TimeSlot.change_seq > since_seq)):
+        days[tutor_id].add(start.date())
+        max_seq = max(max_seq, seq)
+
+    session_changes = db.session.execute(
+        select(TutoringSession.tutor_id, TutoringSession.created_at, TutoringSession.change_seq)
+        .where(TutoringSession.change_seq > since_seq)).all()
+    tombstones = db.session.execute(
+        select(SyncTombstone.user_id, SyncTombstone.entity, SyncTombstone.deleted_at, SyncTombstone.entity_day,
+               SyncTombstone.change_seq)
+        .where(SyncTombstone.change_seq > since_seq)).all()
+    user_ids = {row[0] for row in session_changes} | {row[0] for row in tombstones}
+    if user_ids:
+        tutor_of_user = dict(db.session.execute(
+            select(Tutor.user_id, Tutor.id).where(Tutor.user_id.in_(user_ids))).all())
+
+    for user_id, created_at, seq in session_changes:
+        if user_id in tutor_of_user:
+            days[tutor_of_user[user_id]].add(created_at.date())
+        max_seq = max(max_seq, seq)
+    for user_id, entity, deleted_at, entity_day, seq in tombstones:
+        max_seq = max(max_seq, seq)
+        if user_id not in tutor_of_user:
+            continue  # The student's copy of a session tombstone
+        tutor_id = tutor_of_user[user_id]
+        if entity == 'tutoring_session':
+            # Counted as a cancellation when deleted, and no longer as a
+            # booking on the day it was made
+            days[tutor_id].add(deleted_at.date())
+        if entity_day is not None:
+            days[tutor_id].add(entity_day)
+        else:
+            # Tombstones from before entity_day don't say which day it was
+            whole.add(tutor_id)
+
+    newest_review = None
+    query = select(Review.tutor_id, Review.created_at)
+    if reviews_since is not None:
+        query = query.where(Review.created_at > reviews_since)
+    for tutor_id, created_at in db.session.execute(query):
+        days[tutor_id].add(created_at.date())
+        newest_review = max(newest_review or created_at, created_at)
+
+    return days, whole, max_seq, newest_review
+
+
+def run(config, full=False):
+    """
+    Brings daily_tutor_rollups up to date and commits. Incremental runs
+    read what changed since the watermark (change_seq for slots, sessions
+    and tombstones; created_at for reviews) and recompute only the
+    affected tutor-days. A run without a watermark, or with full=True,
+    rebuilds everything. Concurrent runs serialize on the watermark row.
+    """
+    started = time.perf_counter()
+    watermark = db.session.execute(
+        select(RollupWatermark).where(RollupWatermark.name == WATERMARK).with_for_update()
+    ).scalar_one_or_none()
+    if watermark is None:
+        watermark = RollupWatermark(name=WATERMARK)
+        db.session.add(watermark)
+        full = True
+
+    if full:
+        # Read the high-water marks first: changes made during the rebuild
+        # are picked up again by the next run
+        max_seq = max(
+            db.session.scalar(select(func.max(TimeSlot.change_seq))) or 0,
+            db.session.scalar(select(func.max(TutoringSession.change_seq))) or 0,
+            db.session.scalar(select(func.max(SyncTombstone.change_seq))) or 0
+        )
+        newest_review = db.session.scalar(select(func.max(Review.created_at)))
+        tutor_ids = db.session.scalars(select(Tutor.id)).all()
+        ranges = [(tutor_ids, None, None)]
+    else:
+        # Re-read a little behind the watermarks: a transaction can commit
+        # after one that drew a later change_seq or review timestamp
+        since_seq = max((watermark.change_seq or 0) - config['ROLLUP_SEQ_OVERLAP'], 0)
+        # Without any review yet, the last run bounds where new ones start
+        reviews_since = None
+        if (review_mark := watermark.position or watermark.updated_at) is not None:
+            reviews_since = review_mark - timedelta(seconds=config['ROLLUP_LAG_SECONDS'])
+        days, whole, max_seq, newest_review = _dirty_days(since_seq, reviews_since)
+        max_seq = max(max_seq, watermark.change_seq or 0)
+        newest_review = max(filter(None, (newest_review, watermark.position)), default=None)
+        ranges = [(sorted(whole), None, None)]
+        # One range per batch covers every dirty day of its tutors;
+        # recomputing a clean tutor-day in between is harmless
+        partial = sorted(tutor_id for tutor_id in days if tutor_id not in whole)
+        for i in range(0, len(partial), TUTOR_BATCH):
+            batch = partial[i:i + TUTOR_BATCH]
+            batch_days = set().union(*(days[t] for t in batch))
+            ranges.append((batch, min(batch_days), max(batch_days) + timedelta(days=1)))
+
+    written = recomputed = 0
+    for tutor_ids, first_day, end_day in ranges:
+        for i in range(0, len(tutor_ids), TUTOR_BATCH):
+            batch = tutor_ids[i:i + TUTOR_BATCH]
+            recomputed += len(batch)
+            written += _replace(batch, first_day, end_day)
+
+    watermark.change_seq = max_seq
+    watermark.position = newest_review
+    watermark.updated_at = datetime.utcnow()
+    db.session.commit()
+    return {
+        "full": full,
+        "tutors_recomputed": recomputed,
+        "rows_written": written,
+        "change_seq": max_seq,
+        "seconds": round(time.perf_counter() - started, 3)
+    }
+
+
+def as_of():
+    """When the rollups were last brought up to date, or None."""
+    return db.session.scalar(select(RollupWatermark.updated_at).where(RollupWatermark.name == WATERMARK))
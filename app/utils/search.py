@@ -0,0 +1,277 @@
+from datetime import datetime
+from uuid import UUID
+from sqlalchemy import and_, case, event, exists, func, literal, null, or_, select, union_all, update
+from app.extensions import db
+from app.models import AvailabilityRule, Class, Subject, TimeSlot, Tutor, User, tutor_class_association
+from app.utils import cache
+from app.utils.db_routing import RoutingSession
+from app.utils.recurrence import active_rules, expansion_window, virtual_slots
+
+# Hours [start, end) of each availability bucket, UTC
+AVAILABILITY_BUCKETS = {
+    'morning': (6, 12),
+    'afternoon': (12, 18),
+    'evening': (18, 24),
+}
+
+# hourly_rate bands [min, max); None = open-ended
+PRICE_BANDS = ((0, 20), (20, 40), (40, 60), (60, None))
+
+# "x and up", matching the min_rating filter
+RATING_THRESHOLDS = (4.5, 4.0, 3.0, 2.0)
+
+# ?sort= orders. Each one walks an index on tutors (see the Tutor model),
+# and ends in id so pages are stable when the sort key ties
+SORTS = {
+    'price_asc': (Tutor.hourly_rate.asc(), Tutor.id.asc()),
+    'price_desc': (Tutor.hourly_rate.desc(), Tutor.id.desc()),
+    'rating': (Tutor.average_rating.desc(), Tutor.review_count.desc(), Tutor.id.desc()),
+    'reviews': (Tutor.review_count.desc(), Tutor.id.desc()),
+    'availability': (Tutor.next_available_at.asc().nulls_last(), Tutor.id.asc()),
+}
+DEFAULT_SORT = (Tutor.id.asc(),)
+
+# Tutors whose next_available_at is refreshed per sweep transaction; at
+# most directory.MAX_CHANGED_IDS, so workers update just those rows
+SWEEP_BATCH = 100
+
+
+def availability_condition(start_hour, end_hour, now=None):
+    """
+    The tutor has a future open slot starting in [start_hour, end_hour), or
+    a current recurring rule whose daily window overlaps it.
+    """
+    now = now or datetime.utcnow()
+    open_slot = exists().where(
+        TimeSlot.tutor_id == Tutor.id,
+        TimeSlot.status == 'available',
+        TimeSlot.start_time > now,
+        func.extract('hour', TimeSlot.start_time) >= start_hour,
+        func.extract('hour', TimeSlot.start_time) < end_hour
+    )
+    recurring = exists().where(
+        AvailabilityRule.tutor_id == Tutor.id,
+        or_(AvailabilityRule.valid_until.is_(None), AvailabilityRule.valid_until >= now.date()),
+        func.extract('hour', AvailabilityRule.start_time) < end_hour,
+        func.extract('hour', AvailabilityRule.end_time) > start_hour
+    )
+    return or_(open_slot, recurring)
+
+
+def _teaches_subject(subject_id):
+    return exists().where(
+        tutor_class_association.c.tutor_id == Tutor.id,
+        tutor_class_association.c.class_id == Class.id,
+        Class.subject_id == subject_id
+    ).correlate(Tutor)
+
+
+def _rated_at_least(min_rating):
+    # Tutors without reviews have no rating to compare
+    return and_(Tutor.review_count > 0, Tutor.average_rating >= min_rating)
+
+
+def tutor_filters(args):
+    """
+    The search filters in the query arguments, one condition on Tutor (and
+    User) per facet, keyed by facet name. Every condition is an EXISTS or a
+    plain column test, so the results need no DISTINCT. Raises ValueError
+    on malformed arguments.
+    """
+    filters = {}
+
+    search_query = args.get('query')  # Search term: class name or tutor name
+    if search_query:
+        pattern = f'%{search_query}%'
+        filters['query'] = or_(
+            User.username.ilike(pattern),
+            User.first_name.ilike(pattern),
+            User.last_name.ilike(pattern),
+            # Correlated to Tutor alone: the subject facet joins these tables too
+            exists().where(
+                tutor_class_association.c.tutor_id == Tutor.id,
+                tutor_class_association.c.class_id == Class.id,
+                Class.section.ilike(pattern)
+            ).correlate(Tutor)
+        )
+
+    subject_id = args.get('subject_id')
+    if subject_id:
+        try:
+            filters['subject'] = _teaches_subject(UUID(subject_id))
+        except ValueError:
+            raise ValueError("Invalid subject_id")
+
+    availability = args.get('availability')
+    if availability:
+        if availability not in AVAILABILITY_BUCKETS:
+            raise ValueError("Invalid availability")
+        filters['availability'] = availability_condition(*AVAILABILITY_BUCKETS[availability])
+
+    min_rate = args.get('min_rate', type=float)
+    max_rate = args.get('max_rate', type=float)
+    if min_rate is not None or max_rate is not None:
+        conditions = []
+        if min_rate is not None:
+            conditions.append(Tutor.hourly_rate >= min_rate)
+        if max_rate is not None:
+            conditions.append(Tutor.hourly_rate < max_rate)
+        filters['price'] = and_(*conditions)
+
+    min_rating = args.get('min_rating', type=float)
+    if min_rating is not None:
+        filters['rating'] = _rated_at_least(min_rating)
+
+    return filters
+
+
+def facet_counts(filters):
+    """
+    Tutor counts per subject, availability bucket, price band and rating
+    threshold, in one UNION ALL query. Each facet is counted under every
+    filter except its own, so the other options of a facet stay visible
+    with the counts they would give.
+    """
+    def base(facet, *columns):
+        others = [condition for name, condition in filters.items() if name != facet]
+        return select(literal(facet).label('facet'), *columns).select_from(Tutor).join(User, User.id == Tutor.user_id).where(*others)
+
+    count = func.count(Tutor.id).label('count')
+    members = []
+
+    # Tutors can teach several classes of one subject; count each tutor once
+    members.append(
+        base('subject', null().label('value'), Subject.id.label('subject_id'), Subject.name.label('label'),
+             func.count(func.distinct(Tutor.id)).label('count'))
+        .join(tutor_class_association, tutor_class_association.c.tutor_id == Tutor.id)
+        .join(Class, Class.id == tutor_class_association.c.class_id)
+        .join(Subject, Subject.id == Class.subject_id)
+        .group_by(Subject.id, Subject.name)
+    )
+
+    now = datetime.utcnow()
+    for bucket, (start_hour, end_hour) in AVAILABILITY_BUCKETS.items():
+        members.append(
+            base('availability', literal(bucket).label('value'), null(), null(), count)
+            .where(availability_condition(start_hour, end_hour, now))
+        )
+
+    band = case(*[
+        (and_(Tutor.hourly_rate >= low, *([Tutor.hourly_rate < high] if high is not None else [])), str(i))
+        for i, (low, high) in enumerate(PRICE_BANDS)
+    ], else_=null())
+    members.append(
+        base('price', band.label('value'), null(), null(), count).group_by(band)
+    )
+
+    for threshold in RATING_THRESHOLDS:
+        members.append(
+            base('rating', literal(str(threshold)).label('value'), null(), null(), count)
+            .where(_rated_at_least(threshold))
+        )
+
+    rows = db.session.execute(union_all(*members)).all()
+
+    facets = {
+        "subjects": [],
+        "availability": dict.fromkeys(AVAILABILITY_BUCKETS, 0),
+        "price": [{"min": low, "max": high, "count": 0} for low, high in PRICE_BANDS],
+        "rating": [{"min": threshold, "count": 0} for threshold in RATING_THRESHOLDS]
+    }
+    for facet, value, subject_id, name, n in rows:
+        if facet == 'subject':
+            facets["subjects"].append({"id": str(subject_id), "name": name, "count": n})
+        elif facet == 'availability':
+            facets["availability"][value] = n
+        elif facet == 'price' and value is not None:
+            facets["price"][int(value)]["count"] = n
+        elif facet == 'rating':
+            facets["rating"][RATING_THRESHOLDS.index(float(value))]["count"] = n
+    facets["subjects"].sort(key=lambda s: (-s["count"], s["name"]))
+    return facets
+
+
+def sort_order(args):
+    """ORDER BY columns for ?sort=; raises ValueError for an unknown order."""
+    sort = args.get('sort')
+    if not sort:
+        return DEFAULT_SORT
+    if sort not in SORTS:
+        raise ValueError(f"Cannot sort by {sort}")
+    return SORTS[sort]
+
+
+def next_available(tutor_ids, now=None):
+    """
+    {tutor_id: start of the soonest open slot or unbooked rule occurrence}
+    for the tutors, leaving out those with nothing open within the
+    recurrence expansion horizon.
+    """
+    now = now or datetime.utcnow()
+    soonest = dict(db.session.execute(
+        select(TimeSlot.tutor_id, func.min(TimeSlot.start_time))
+        .where(TimeSlot.tutor_id.in_(tutor_ids), TimeSlot.status == 'available', TimeSlot.start_time > now)
+        .group_by(TimeSlot.tutor_id)
+    ).all())
+    expand_start, expand_end = expansion_window(now)
+    for v in virtual_slots(active_rules(tutor_ids, expand_start, expand_end), expand_start, expand_end):
+        if v.tutor_id not in soonest or v.start_time < soonest[v.tutor_id]:
+            soonest[v.tutor_id] = v.start_time
+    return soonest
+
+
+def update_next_available(tutor_ids, now=None):
+    tutor_ids = list(tutor_ids)
+    soonest = next_available(tutor_ids, now)
+    db.session.execute(update(Tutor), [
+        {"id": tutor_id, "next_available_at": soonest.get(tutor_id)} for tutor_id in tutor_ids
+    ])
+
+
+def refresh_next_available(tutor_id):
+    """
+    For any write to a tutor's slots or rules: recomputes next_available_at
+    just before the current session commits, inside the same transaction.
+    """
+    db.session.info.setdefault('next_available_refresh', set()).add(tutor_id)
+
+
+def sweep_next_available(now=None):
+    """
+    Recomputes next_available_at where the slot it points at has started,
+    and where a tutor with current rules has none (their next occurrence may
+    have come within the expansion horizon). Commits per batch, with the
+    batch's tutors invalidated, so the commit also sends their
+    directory.changed event. Returns the number of tutors updated.
+    """
+    now = now or datetime.utcnow()
+    stale = db.session.scalars(
+        select(Tutor.id).where(or_(
+            Tutor.next_available_at <= now,
+            and_(Tutor.next_available_at.is_(None), exists().where(
+                AvailabilityRule.tutor_id == Tutor.id,
+                or_(AvailabilityRule.valid_until.is_(None), AvailabilityRule.valid_until >= now.date())
+            ))
+        ))
+    ).all()
+    for i in range(0, len(stale), SWEEP_BATCH):
+        batch = stale[i:i + SWEEP_BATCH]
+        update_next_available(batch, now)
+        for tutor_id in batch:
+            cache.invalidate_tutor(tutor_id)
+        db.session.commit()
+    return len(stale)
+
+
+def _on_before_commit(session):
+    tutor_ids = session.info.pop('next_available_refresh', None)
+    if tutor_ids:
+        update_next_available(tutor_ids)
+
+
+def _on_after_rollback(session):
+    session.info.pop('next_available_refresh', None)
+
+
+event.listen(RoutingSession, 'before_commit', _on_before_commit)
+event.listen(RoutingSession, 'after_rollback', _on_after_rollback)
@@ -0,0 +1,117 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from flask import current_app
+
+# How long a write waits for another process's lock before giving up.
+# SQLite's own busy handler sleeps inside C, which under gevent stalls
+# every greenlet of the worker; writes retry here with time.sleep instead,
+# which yields to them.
+BUSY_TIMEOUT_SECONDS = 5
+BUSY_RETRY_MAX_SECONDS = 0.05
+
+
+class SharedStore:
+    """
+    Small key/value store shared by every gunicorn worker on this host,
+    backed by a SQLite file in WAL mode. It stands in for Redis: values
+    are JSON, keys can expire, and update() gives atomic read-modify-write.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    def _conn(self):
+        # Never reuse a connection across fork
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=0, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def _run(self, work):
+        """Runs work(connection), retrying while another process holds SQLite's write lock."""
+        deadline = time.monotonic() + BUSY_TIMEOUT_SECONDS
+        delay = 0.001
+        while True:
+            try:
+                with self._lock:
+                    return work(self._conn())
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e) or time.monotonic() >= deadline:
+                    raise
+            time.sleep(delay)
+            delay = min(delay * 2, BUSY_RETRY_MAX_SECONDS)
+
+    def get(self, key, default=None):
+        row = self._run(lambda connection: connection.execute(
+            "SELECT value, expires_at FROM kv WHERE key = ?", (key,)
+        ).fetchone())
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return default
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        self._run(lambda connection: connection.execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), expires_at)
+        ))
+
+    def delete(self, *keys):
+        self._run(lambda connection: connection.executemany(
+            "DELETE FROM kv WHERE key = ?", [(key,) for key in keys]
+        ))
+
+    def update(self, key, fn, ttl=None):
+        """
+        Atomically replaces the value of key with fn(current)[0] and returns
+        fn(current)[1]; current is None when the key is missing or expired.
+        Serialized across processes by SQLite's write lock.
+        """
+        now = time.time()
+
+        def work(connection):
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+                current = None
+                if row is not None and (row[1] is None or row[1] > now):
+                    current = json.loads(row[0])
+                new_value, result = fn(current)
+                connection.execute(
+                    "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(new_value), now + ttl if ttl else None)
+                )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            return result
+        return self._run(work)
+
+    def incr(self, key, amount=1, ttl=None):
+        return self.update(key, lambda current: ((current or 0) + amount,) * 2, ttl=ttl)
+
+    def purge_expired(self):
+        now = time.time()
+        self._run(lambda connection: connection.execute(
+            "DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+        ))
+
+
+def get_store():
+    return current_app.extensions['shared_store']
+
+
+def init_app(app):
+    app.extensions['shared_store'] = SharedStore(app.config['SHARED_STORE_PATH'])
@@ -0,0 +1,237 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from decimal import Decimal
+from flask import current_app, has_request_context, request
+from app.utils import sql_timing
+
+logger = logging.getLogger(__name__)
+
+# Parameter names whose values are never written, whatever their type
+SECRET_PARAMS = re.compile(r'password|secret|token|email', re.IGNORECASE)
+
+_COMMENTS = re.compile(r'--[^\n]*|/\*.*?\*/', re.DOTALL)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDERS = re.compile(r'%\(\w+\)s|%s|(?<!:):\w+|\?')
+_IN_LISTS = re.compile(r'\bIN \(\?(?:, \?)*\)', re.IGNORECASE)
+_VALUES_ROWS = re.compile(r'(\(\?(?:, \?)*\))(?:, \1)+')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize(statement):
+    """
+    The statement with literals and placeholders replaced by ?, IN lists and
+    multi-row VALUES collapsed, so every call of one query looks the same.
+    """
+    sql = _COMMENTS.sub(' ', statement)
+    sql = _STRINGS.sub('?', sql)
+    sql = _PLACEHOLDERS.sub('?', sql)
+    sql = _NUMBERS.sub('?', sql)
+    sql = _WHITESPACE.sub(' ', sql).strip()
+    sql = re.sub(r'\( ', '(', sql)
+    sql = re.sub(r' \)', ')', sql)
+    sql = re.sub(r' ?, ?', ', ', sql)
+    sql = _IN_LISTS.sub('IN (...)', sql)
+    return _VALUES_ROWS.sub(r'\1, ...', sql)
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+def _redact_value(name, value):
+    if value is None or isinstance(value, bool):
+        return value
+    if name is not None and SECRET_PARAMS.search(str(name)):
+        return '<redacted>'
+    if isinstance(value, (int, float, Decimal)):
+        return float(value) if isinstance(value, Decimal) else value
+    if isinstance(value, (datetime.date, datetime.time, uuid.UUID)):
+        return str(value)
+    if isinstance(value, (str, bytes)):
+        return f'<{type(value).__name__} len={len(value)}>'
+    return f'<{type(value).__name__}>'
+
+
+def redact(parameters):
+    """
+    Parameters safe to write down: numbers, dates and ids are kept because
+    they shape the plan; strings become their length, secrets disappear.
+    """
+    if isinstance(parameters, dict):
+        return {name: _redact_value(name, value) for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_redact_value(None, value) for value in parameters]
+    return _redact_value(None, parameters)
+
+
+class SlowQueryRecorder:
+    """
+    Records statements slower than the threshold. The engine hook only
+    queues them; a background thread per worker runs EXPLAIN (and, for a
+    sample of SELECTs, EXPLAIN ANALYZE) on a connection of its own and
+    appends the record to this worker's JSONL file in SLOW_QUERY_DIR.
+    Each fingerprint is explained at most once per explain_interval.
+    """
+
+    def __init__(self, config):
+        self.enabled = config['SLOW_QUERY_ENABLED']
+        self.threshold = config['SLOW_QUERY_THRESHOLD_MS'] / 1000
+        self.directory = config['SLOW_QUERY_DIR']
+        self.max_bytes = config['SLOW_QUERY_MAX_BYTES']
+        self.explain = config['SLOW_QUERY_EXPLAIN']
+        self.explain_interval = config['SLOW_QUERY_EXPLAIN_INTERVAL']
+        self.analyze_sample_rate = config['SLOW_QUERY_ANALYZE_SAMPLE_RATE']
+        self.analyze_timeout_ms = config['SLOW_QUERY_ANALYZE_TIMEOUT_MS']
+        self._queue = queue.Queue(maxsize=config['SLOW_QUERY_QUEUE_SIZE'])
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._explained_at = {}
+        self.recorded = 0
+        self.dropped = 0
+
+    # --- Request path ---
+    def hook(self, conn, statement, parameters, seconds, executemany):
+        if seconds < self.threshold or threading.current_thread() is self._worker:
+            return
+        record = {
+            "at": time.time(),
+            "duration_ms": round(seconds * 1000, 3),
+            "statement": statement,
+            "executemany": executemany,
+            "endpoint": request.endpoint if has_request_context() else None,
+            "method": request.method if has_request_context() else None
+        }
+        self._ensure_worker()
+        try:
+            # The engine and the raw parameters stay in memory for EXPLAIN;
+            # only the redacted parameters are written
+            self._queue.put_nowait((record, conn.engine, parameters))
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_worker(self):
+        # Started lazily so it always lives in the (post-fork) worker
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='slow-query-recorder', daemon=True)
+                self._worker.start()
+
+    # --- Background ---
+    def _run(self):
+        while True:
+            record, engine, parameters = self._queue.get()
+            try:
+                self._complete(record, engine, parameters)
+                self._write(record)
+                self.recorded += 1
+            except Exception:
+                logger.exception("Could not record slow query")
+
+    def _complete(self, record, engine, parameters):
+        statement = record.pop('statement')
+        normalized = normalize(statement)
+        record['fingerprint'] = fingerprint(normalized)
+        record['sql'] = normalized
+        if record['executemany']:
+            record['params'] = redact(parameters[0]) if parameters else None
+            record['batch_size'] = len(parameters)
+        else:
+            record['params'] = redact(parameters)
+        record['plan'] = None
+
+        is_select = statement.lstrip().upper().startswith(('SELECT', 'WITH'))
+        if not (self.explain and is_select and not record['executemany']):
+            return
+        now = time.monotonic()
+        if now - self._explained_at.get(record['fingerprint'], -self.explain_interval) < self.explain_interval:
+            return
+        self._explained_at[record['fingerprint']] = now
+
+        # ANALYZE runs the query again, so only for a sample and never for
+        # statements that take row locks
+        analyze = (self.analyze_sample_rate > 0 and random.random() < self.analyze_sample_rate
+                   and 'FOR UPDATE' not in statement.upper())
+        try:
+            record['plan'] = self._explain(engine, statement, parameters, analyze)
+            record['analyzed'] = analyze
+        except Exception as e:
+            record['plan_error'] = str(e).splitlines()[0] if str(e) else type(e).__name__
+
+    def _explain(self, engine, statement, parameters, analyze):
+        dialect = engine.dialect.name
+        with engine.connect() as connection:
+            with connection.begin() as transaction:
+                if dialect == 'postgresql':
+                    connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(self.analyze_timeout_ms)}")
+                    options = 'ANALYZE, BUFFERS, FORMAT JSON' if analyze else 'FORMAT JSON'
+                    plan = connection.exec_driver_sql(f"EXPLAIN ({options}) {statement}", parameters).scalar()
+                    plan = json.loads(plan) if isinstance(plan, str) else plan
+                elif dialect == 'sqlite':
+                    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+                    plan = [row[-1] for row in rows]
+                else:
+                    plan = None
+                transaction.rollback()
+        return plan
+
+    def _write(self, record):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'slow-{os.getpid()}.jsonl')
+        try:
+            if os.path.getsize(path) > self.max_bytes:
+                os.replace(path, path + '.1')
+        except FileNotFoundError:
+            pass
+        with open(path, 'a') as f:
+            f.write(json.dumps(record, default=str) + '\n')
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "threshold_ms": self.threshold * 1000,
+            "queued": self._queue.qsize(),
+            "recorded": self.recorded,
+            "dropped": self.dropped
+        }
+
+
+def get_slow_query_recorder():
+    return current_app.extensions['slow_queries']
+
+
+def load_records(directory, since=None):
+    """Every recorded slow query in the directory, including rotated files, oldest first."""
+    records = []
+    if not os.path.isdir(directory):
+        return records
+    for name in sorted(os.listdir(directory)):
+        if not name.startswith('slow-'):
+            continue
+        with open(os.path.join(directory, name)) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Half-written last line
+                if since is None or record['at'] >= since:
+                    records.append(record)
+    records.sort(key=lambda record: record['at'])
+    return records
+
+
+def init_app(app):
+    recorder = app.extensions['slow_queries'] = SlowQueryRecorder(app.config)
+    if recorder.enabled:
+        sql_timing.add_hook(recorder.hook)
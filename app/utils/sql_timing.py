@@ -0,0 +1,40 @@
+import time
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Called as hook(conn, statement, parameters, seconds, executemany) after
+# every statement on any engine; see add_hook()
+_hooks = []
+
+
+def add_hook(hook):
+    if hook not in _hooks:
+        _hooks.append(hook)
+
+
+def request_sql_time():
+    """Seconds the current request has spent in SQL statements so far."""
+    return g.get('sql_time', 0.0)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info['query_start'].pop()
+    if has_request_context():
+        g.sql_time = g.get('sql_time', 0.0) + seconds
+        g.sql_count = g.get('sql_count', 0) + 1
+    for hook in _hooks:
+        hook(conn, statement, parameters, seconds, executemany)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    starts = context.connection.info.get('query_start') if context.connection is not None else None
+    if starts:
+        starts.pop()
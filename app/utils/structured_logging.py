@@ -0,0 +1,214 @@
+import atexit
+import copy
+import datetime
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+from flask import current_app, g, has_request_context, request
+from app.utils import sql_timing, tracing
+
+# Field names whose values never leave the process, at any nesting depth
+SENSITIVE_FIELDS = re.compile(
+    r'password|passwd|secret|token|authorization|cookie|jwt|jti|credential|email', re.IGNORECASE
+)
+REDACTED = '[redacted]'
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+# Incoming request ids are reused only if they look like one
+_VALID_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# Attributes every LogRecord has; anything else was passed in `extra`
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+_CONTEXT_ATTRS = ('request_id', 'trace_id', 'endpoint', 'method', 'path')
+
+request_logger = logging.getLogger('app.requests')
+
+
+def redact(value, depth=0):
+    """Copies dicts and lists, replacing the value of any sensitive key."""
+    if depth > 5:
+        return str(value)
+    if isinstance(value, dict):
+        return {key: REDACTED if SENSITIVE_FIELDS.search(str(key)) else redact(item, depth + 1)
+                for key, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [redact(item, depth + 1) for item in value]
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request context and extra fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc)
+                  .isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        for attr in _CONTEXT_ATTRS:
+            if getattr(record, attr, None) is not None:
+                entry[attr] = getattr(record, attr)
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and key not in _CONTEXT_ATTRS:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestQueueHandler(QueueHandler):
+    """
+    Runs on the calling thread: drops unsampled low-level records, stamps
+    the request context, redacts extra fields and renders the traceback,
+    then hands the record to the queue without blocking. Formatting and
+    the write happen on the listener thread.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def filter(self, record):
+        if (record.levelno < logging.WARNING and has_request_context()
+                and not g.get('log_sampled', True)):
+            return False
+        return super().filter(record)
+
+    def prepare(self, record):
+        prepared = copy.copy(record)
+        for key in set(vars(record)) - _RECORD_ATTRS:
+            value = getattr(record, key)
+            setattr(prepared, key, REDACTED if SENSITIVE_FIELDS.search(key) else redact(value))
+        prepared.msg = record.getMessage()
+        prepared.args = None
+        if record.exc_info:
+            prepared.exc_text = logging.Formatter().formatException(record.exc_info)
+        prepared.exc_info = None
+        if has_request_context():
+            prepared.request_id = g.get('request_id')
+            prepared.endpoint = request.endpoint
+            prepared.method = request.method
+            prepared.path = request.path
+        span = tracing.current_span()
+        if span is not None:
+            prepared.trace_id = span.trace_id
+        for attr in _CONTEXT_ATTRS:
+            if not hasattr(prepared, attr):
+                setattr(prepared, attr, None)
+        return prepared
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1  # Never make a request wait for the log writer
+
+
+class LogPipeline:
+    """
+    The queue, its handler on the 'app' logger and the listener thread that
+    writes to stdout. The listener is (re)started lazily in each process,
+    since threads do not survive gunicorn's fork.
+    """
+
+    def __init__(self, config):
+        self.queue_size = config['LOG_QUEUE_SIZE']
+        self.sample_rate = config['LOG_SAMPLE_RATE']
+        self.slow_request = config['LOG_SLOW_REQUEST_MS'] / 1000
+        self.log_requests = config['LOG_REQUESTS']
+        self.output = logging.StreamHandler(sys.stdout)
+        if config['LOG_FORMAT'] == 'json':
+            self.output.setFormatter(JsonFormatter())
+        else:
+            self.output.setFormatter(logging.Formatter(
+                '%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s'))
+        self.handler = RequestQueueHandler(queue.Queue(maxsize=self.queue_size))
+        self._listener = None
+        self._pid = None
+        self._lock = threading.Lock()
+        atexit.register(self.stop)
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # A queue inherited across fork may carry a lock held mid-put
+            self.handler.queue = queue.Queue(maxsize=self.queue_size)
+            self._listener = QueueListener(self.handler.queue, self.output)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def stop(self):
+        """Flushes what is queued; registered to run at exit."""
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._pid = None
+
+
+def _before_request():
+    pipeline = get_pipeline()
+    pipeline.ensure_started()
+    incoming = request.headers.get(REQUEST_ID_HEADER, '')
+    g.request_id = incoming if _VALID_REQUEST_ID.match(incoming) else uuid.uuid4().hex
+    g.log_sampled = pipeline.sample_rate >= 1 or random.random() < pipeline.sample_rate
+    g.log_start = time.perf_counter()
+
+
+def _after_request(response):
+    request_id = g.get('request_id')
+    if request_id:
+        response.headers[REQUEST_ID_HEADER] = request_id
+    pipeline = get_pipeline()
+    start = g.get('log_start')
+    if start is None or not pipeline.log_requests:
+        return response
+
+    seconds = time.perf_counter() - start
+    # Errors and slow requests are logged even when the request was not sampled
+    level = logging.WARNING if response.status_code >= 500 or seconds >= pipeline.slow_request else logging.INFO
+    request_logger.log(level, "%s %s %s", request.method, request.path, response.status_code, extra={
+        "status": response.status_code,
+        "duration_ms": round(seconds * 1000, 3),
+        "db_ms": round(sql_timing.request_sql_time() * 1000, 3),
+        "db_queries": g.get('sql_count', 0)
+    })
+    return response
+
+
+# One per process: the 'app' logger it is attached to is process-wide too
+_pipeline = None
+
+
+def get_pipeline():
+    return current_app.extensions['log_pipeline']
+
+
+def init_app(app):
+    """
+    Routes the 'app' logger (app.logger and every module logger under app.)
+    through the queue. Call first, so request ids exist before any other
+    before_request hook can log or turn the request away.
+    """
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = LogPipeline(app.config)
+        logger = logging.getLogger('app')
+        logger.handlers = [_pipeline.handler]
+        logger.propagate = False
+    logging.getLogger('app').setLevel(app.config['LOG_LEVEL'].upper())
+    _pipeline.ensure_started()
+    app.extensions['log_pipeline'] = _pipeline
+    app.before_request(_before_request)
+    app.after_request(_after_request)
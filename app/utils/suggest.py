@@ -0,0 +1,319 @@
+import logging
+import os
+import queue
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from uuid import UUID
+from flask import current_app
+from sqlalchemy import select
+from app.extensions import db
+from app.models import Class, Subject, Tutor, User
+from app.utils import events
+from app.utils.directory import CHANGED, RELOAD
+
+logger = logging.getLogger(__name__)
+
+# Bus event: subjects or classes changed; without ids, all of them may have
+CATALOG = 'suggest.catalog'
+
+KINDS = ('tutor', 'subject', 'class')
+
+# Bounds on what one entry adds to the index: keys are cut to this many
+# characters, and only this many words of a text start a key of their own
+MAX_KEY_LENGTH = 48
+MAX_WORDS = 4
+
+# Keys a lookup reads past its first match at most, however many share the prefix
+MAX_SCAN = 256
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+
+
+def normalize(text):
+    """Lowercased, with runs of whitespace as one space."""
+    return ' '.join((text or '').lower().split())
+
+
+def keys_of(*texts):
+    """
+    Index keys for an entry: each text, and the text from each of its
+    first MAX_WORDS words on, so "tina turner" is also found by "tur".
+    """
+    keys = set()
+    for text in texts:
+        words = normalize(text).split(' ')
+        for i in range(min(len(words), MAX_WORDS)):
+            key = ' '.join(words[i:])[:MAX_KEY_LENGTH]
+            if key:
+                keys.add(key)
+    return keys
+
+
+class PrefixIndex:
+    """
+    Keys of every entry in one sorted list, with a parallel list of the
+    entry each belongs to. A lookup bisects to the prefix and reads on
+    while keys still start with it; a change inserts or deletes its few
+    keys in place. Entries are (kind, id) pairs.
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.entries = []
+        self.labels = {}   # entry -> (public id, label, detail)
+        self._keys_of = {}
+
+    def build(self, items):
+        """items: (entry, (public id, label, detail), keys) for every entry."""
+        pairs = []
+        for entry, label, keys in items:
+            self.labels[entry] = label
+            self._keys_of[entry] = tuple(keys)
+            pairs.extend((key, entry) for key in keys)
+        # Ties keep load order; sorting on the entry too would compare uuids
+        pairs.sort(key=lambda pair: pair[0])
+        self.keys = [key for key, _ in pairs]
+        self.entries = [entry for _, entry in pairs]
+
+    def put(self, entry, label, keys):
+        self.remove(entry)
+        self.labels[entry] = label
+        self._keys_of[entry] = tuple(keys)
+        for key in keys:
+            i = bisect_right(self.keys, key)
+            self.keys.insert(i, key)
+            self.entries.insert(i, entry)
+
+    def remove(self, entry):
+        self.labels.pop(entry, None)
+        for key in self._keys_of.pop(entry, ()):
+            i = bisect_left(self.keys, key)
+            while self.entries[i] != entry:
+                i += 1
+            del self.keys[i]
+            del self.entries[i]
+
+    def lookup(self, prefix, limit):
+        """Up to `limit` distinct entries with a key starting with prefix, in key order."""
+        keys, entries = self.keys, self.entries
+        found = []
+        seen = set()
+        i = bisect_left(keys, prefix)
+        end = min(i + MAX_SCAN, len(keys))
+        while i < end and len(found) < limit and keys[i].startswith(prefix):
+            entry = entries[i]
+            if entry not in seen:
+                seen.add(entry)
+                found.append(entry)
+            i += 1
+        return found
+
+    def footprint(self):
+        """Approximate bytes held by the key list, including the strings."""
+        return sum(49 + len(key) for key in self.keys) + 16 * len(self.keys)
+
+
+def _load_tutors(connection, tutor_ids=None):
+    query = select(Tutor.id, User.id, User.username, User.first_name, User.last_name).join(User, User.id == Tutor.user_id)
+    if tutor_ids is not None:
+        query = query.where(Tutor.id.in_(tutor_ids))
+    for tutor_id, user_id, username, first_name, last_name in connection.execute(query):
+        name = ' '.join(part for part in (first_name, last_name) if part)
+        # Tutors are public by their user id elsewhere in the API
+        yield ('tutor', tutor_id), (str(user_id), name or username, username), keys_of(name, username)
+
+
+def _load_subjects(connection, subject_ids=None):
+    query = select(Subject.id, Subject.name, Subject.code)
+    if subject_ids is not None:
+        query = query.where(Subject.id.in_(subject_ids))
+    for subject_id, name, code in connection.execute(query):
+        yield ('subject', subject_id), (str(subject_id), name, code), keys_of(name, code)
+
+
+def _load_classes(connection, class_ids=None):
+    query = select(Class.id, Class.section, Subject.name).join(Subject, Subject.id == Class.subject_id)
+    if class_ids is not None:
+        query = query.where(Class.id.in_(class_ids))
+    for class_id, section, subject_name in connection.execute(query):
+        yield ('class', class_id), (str(class_id), section, subject_name), keys_of(section)
+
+
+class SuggestIndex:
+    """
+    The per-worker PrefixIndex and its upkeep, on the same bus events as
+    the tutor directory: changed tutors are reloaded one by one, and
+    catalog events name the subjects and classes to reload. A reload
+    event, a catalog event without ids, an overflowed queue or an index
+    older than max_age means a full rebuild. Loads read the primary.
+
+    As in the directory, only the first build runs on the request path;
+    later ones load on a background thread while lookups use the old index,
+    and the next lookup swaps the new one in and reapplies what it missed.
+    """
+
+    def __init__(self, config):
+        self.max_age = config['SUGGEST_MAX_AGE_SECONDS']
+        self.queue_size = config['SUGGEST_EVENT_QUEUE_SIZE']
+        self._index = None
+        self._built_at = 0.0
+        self._subscriber = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._rebuilding = False
+        self._fresh = None          # (index, built_at) waiting to be swapped in
+        self._missed = {'tutor': set(), 'subject': set(), 'class': set()}
+        self._missed_reload = False
+        self.rebuilds = 0
+        self.updates = 0
+
+    def _subscribe(self):
+        # Once per process: the bus's listener thread does not survive fork
+        if self._pid == os.getpid():
+            return
+        bus = events.get_bus()
+        if self._subscriber is not None:
+            bus.unsubscribe(self._subscriber)
+        self._subscriber = bus.subscribe(max_queued=self.queue_size)
+        self._index = None
+        self._pid = os.getpid()
+
+    def _sync(self):
+        self._subscribe()
+        # A full queue may have dropped events
+        reload = self._subscriber.qsize() >= self.queue_size
+        changed = {'tutor': set(), 'subject': set(), 'class': set()}
+        while True:
+            try:
+                payload = self._subscriber.get_nowait()
+            except queue.Empty:
+                break
+            if payload['type'] == RELOAD:
+                reload = True
+            elif payload['type'] == CHANGED:
+                changed['tutor'].update(UUID(tutor_id) for tutor_id in payload['tutor_ids'])
+            elif payload['type'] == CATALOG:
+                if 'subject_ids' not in payload and 'class_ids' not in payload:
+                    reload = True
+                changed['subject'].update(UUID(subject_id) for subject_id in payload.get('subject_ids', ()))
+                changed['class'].update(UUID(class_id) for class_id in payload.get('class_ids', ()))
+
+        if self._fresh is not None:
+            # Whatever changed since its load began may be missing from it
+            self._index, self._built_at = self._fresh
+            self._fresh = None
+            for kind, ids in self._missed.items():
+                changed[kind] |= ids
+            reload |= self._missed_reload
+            self._missed, self._missed_reload = {kind: set() for kind in changed}, False
+        elif self._rebuilding:
+            for kind, ids in changed.items():
+                self._missed[kind] |= ids
+            self._missed_reload |= reload
+
+        if self._index is None:
+            self._index, self._built_at = self._build()  # Nothing to serve until then
+        elif reload or time.monotonic() - self._built_at > self.max_age:
+            self._start_rebuild()
+            if any(changed.values()):
+                self._update(changed)
+        elif any(changed.values()):
+            self._update(changed)
+
+    def _build(self):
+        started = time.monotonic()
+        index = PrefixIndex()
+        with db.engine.connect() as connection:
+            items = [*_load_tutors(connection), *_load_subjects(connection), *_load_classes(connection)]
+        index.build(items)
+        self.rebuilds += 1
+        logger.info("Suggest index rebuilt", extra={
+            "entries": len(items), "seconds": round(time.monotonic() - started, 3)})
+        return index, started
+
+    def _start_rebuild(self):
+        # Called under self._lock; one rebuild at a time
+        if self._rebuilding:
+            return
+        self._rebuilding = True
+        app = current_app._get_current_object()
+        threading.Thread(target=self._rebuild_in_background, args=(app,),
+                         name='suggest-rebuild', daemon=True).start()
+
+    def _rebuild_in_background(self, app):
+        fresh = None
+        try:
+            with app.app_context():
+                fresh = self._build()
+        except Exception:
+            logger.exception("Suggest index rebuild failed; keeping the old index")
+        with self._lock:
+            self._fresh = fresh
+            self._rebuilding = False
+            if fresh is None:
+                # The old index has the missed changes; a later lookup retries
+                self._missed = {kind: set() for kind in self._missed}
+                self._missed_reload = False
+                self._built_at = 0.0
+
+    def _update(self, changed):
+        index = self._index
+        loaders = {'tutor': _load_tutors, 'subject': _load_subjects, 'class': _load_classes}
+        with db.engine.connect() as connection:
+            for kind, ids in changed.items():
+                if not ids:
+                    continue
+                found = set()
+                for entry, label, keys in loaders[kind](connection, list(ids)):
+                    index.put(entry, label, keys)
+                    found.add(entry[1])
+                # Gone from the database, or no longer a tutor
+                for missing in ids - found:
+                    index.remove((kind, missing))
+                self.updates += len(ids)
+
+    def suggest(self, text, limit=DEFAULT_LIMIT):
+        """[{"type", "id", "label", "detail"}] for entries with a key starting with text."""
+        prefix = normalize(text)[:MAX_KEY_LENGTH]
+        if not prefix:
+            return []
+        with self._lock:
+            self._sync()
+            index = self._index
+            found = index.lookup(prefix, limit)
+            labels = [index.labels[entry] for entry in found]
+        return [{"type": kind, "id": public_id, "label": label, "detail": detail}
+                for (kind, _), (public_id, label, detail) in zip(found, labels)]
+
+    def stats(self):
+        index = self._index
+        return {
+            "entries": len(index.labels) if index else 0,
+            "keys": len(index.keys) if index else 0,
+            "bytes": index.footprint() if index else 0,
+            "age_seconds": round(time.monotonic() - self._built_at, 1) if index else None,
+            "rebuilds": self.rebuilds,
+            "entries_updated": self.updates,
+            "queued_events": self._subscriber.qsize() if self._subscriber else 0
+        }
+
+
+def get_suggest_index():
+    return current_app.extensions['suggest_index']
+
+
+def catalog_changed(subject_ids=None, class_ids=None):
+    """
+    For any write to subjects or classes: tells every worker's index once
+    the session commits. Without ids, workers rebuild (bulk imports).
+    """
+    payload = {"type": CATALOG}
+    if subject_ids is not None or class_ids is not None:
+        payload["subject_ids"] = [str(i) for i in subject_ids or ()]
+        payload["class_ids"] = [str(i) for i in class_ids or ()]
+    events.publish(payload)
+
+
+def init_app(app):
+    app.extensions['suggest_index'] = SuggestIndex(app.config)
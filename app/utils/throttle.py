@@ -0,0 +1,118 @@
+import time
+import uuid
+from flask import current_app
+from app.utils.shared_store import get_store
+
+HASH_SLOTS_KEY = 'login:hash_slots'
+# A slot left behind by a worker that died mid-check frees itself after this
+HASH_SLOT_LEASE_SECONDS = 30
+# Pause between tries for a hash slot; time.sleep yields under gevent
+HASH_SLOT_POLL_SECONDS = 0.02
+
+
+class LoginThrottle:
+    """
+    Guards /login against credential stuffing:
+
+    * a token bucket per account and per client IP, shared across workers
+      through the SharedStore;
+    * progressive lockout of an account from one IP after repeated
+      failures there, so failures from elsewhere can't lock its owner out;
+    * a cap on concurrent password hash checks across every worker on the
+      host, so a burst can't pin every CPU on KDF work.
+
+    Accounts are user ids once resolved, so a username and an email of the
+    same user share one bucket; unknown names are keyed as typed.
+    """
+
+    def __init__(self, config):
+        self.config = config
+
+    # --- Rate limiting ---
+    def check(self, account, ip):
+        """Consumes one attempt. Returns 0 if allowed, else seconds to wait."""
+        store = get_store()
+        now = time.time()
+
+        locked_until = store.get(f'login:lock:{account}:{ip}', 0)
+        if locked_until > now:
+            return locked_until - now
+
+        return max(
+            self._take(store, f'login:bucket:account:{account}',
+                       self.config['LOGIN_ACCOUNT_BURST'], self.config['LOGIN_ACCOUNT_PER_MINUTE'], now),
+            self._take(store, f'login:bucket:ip:{ip}',
+                       self.config['LOGIN_IP_BURST'], self.config['LOGIN_IP_PER_MINUTE'], now)
+        )
+
+    @staticmethod
+    def _take(store, key, capacity, per_minute, now):
+        rate = per_minute / 60.0
+
+        def take(bucket):
+            tokens, updated = bucket if bucket else (capacity, now)
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                return [tokens - 1, now], 0
+            return [tokens, now], (1 - tokens) / rate
+
+        # A full bucket refills in capacity / rate seconds; forget it after that
+        return store.update(key, take, ttl=capacity / rate + 1)
+
+    def record_failure(self, account, ip):
+        """Counts a failed attempt; past the threshold, locks the account for this IP with exponential backoff."""
+        store = get_store()
+        window = self.config['LOGIN_FAILURE_WINDOW_SECONDS']
+        failures = store.incr(f'login:failures:{account}:{ip}', ttl=window)
+
+        excess = failures - self.config['LOGIN_LOCKOUT_THRESHOLD']
+        if excess >= 0:
+            delay = min(self.config['LOGIN_LOCKOUT_BASE_SECONDS'] * 2 ** excess,
+                        self.config['LOGIN_LOCKOUT_MAX_SECONDS'])
+            store.set(f'login:lock:{account}:{ip}', time.time() + delay, ttl=delay)
+
+    def record_success(self, account, ip):
+        get_store().delete(f'login:failures:{account}:{ip}', f'login:lock:{account}:{ip}')
+
+    # --- Hash concurrency ---
+    def acquire_hash_slot(self):
+        """
+        Takes one of LOGIN_MAX_CONCURRENT_HASHES slots, waiting up to
+        LOGIN_HASH_WAIT_SECONDS. Returns the lease to release, or None.
+        """
+        store = get_store()
+        capacity = self.config['LOGIN_MAX_CONCURRENT_HASHES']
+        lease = uuid.uuid4().hex
+        deadline = time.monotonic() + self.config['LOGIN_HASH_WAIT_SECONDS']
+
+        while True:
+            now = time.time()
+
+            def take(leases):
+                leases = {held: until for held, until in (leases or {}).items() if until > now}
+                if len(leases) >= capacity:
+                    return leases, False
+                leases[lease] = now + HASH_SLOT_LEASE_SECONDS
+                return leases, True
+
+            if store.update(HASH_SLOTS_KEY, take, ttl=HASH_SLOT_LEASE_SECONDS):
+                return lease
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(HASH_SLOT_POLL_SECONDS)
+
+    def release_hash_slot(self, lease):
+        def release(leases):
+            leases = leases or {}
+            leases.pop(lease, None)
+            return leases, None
+
+        get_store().update(HASH_SLOTS_KEY, release, ttl=HASH_SLOT_LEASE_SECONDS)
+
+
+def get_login_throttle():
+    return current_app.extensions['login_throttle']
+
+
+def init_app(app):
+    app.extensions['login_throttle'] = LoginThrottle(app.config)
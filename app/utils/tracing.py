@@ -0,0 +1,295 @@
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import current_app, g, request
+from flask.json.provider import DefaultJSONProvider
+from app.utils import sql_timing
+from app.utils.slow_queries import normalize
+
+logger = logging.getLogger(__name__)
+
+# W3C Trace Context: version-traceid-parentid-flags
+TRACEPARENT_HEADER = 'traceparent'
+_TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+# OTLP span kinds
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+# OTLP status codes
+STATUS_OK, STATUS_ERROR = 1, 2
+
+_current_span = ContextVar('current_span', default=None)
+
+
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'kind', 'start_ns', 'end_ns',
+                 'attributes', 'status', 'status_message', 'root', 'children')
+
+    def __init__(self, name, trace_id, parent_id=None, kind=KIND_INTERNAL, root=None, start_ns=None):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.attributes = {}
+        self.status = None
+        self.status_message = None
+        self.root = root or self
+        self.children = 0
+
+    def child(self, name, kind=KIND_INTERNAL, start_ns=None):
+        return Span(name, self.trace_id, self.span_id, kind, self.root, start_ns)
+
+    def fail(self, exc):
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(exc).__name__}: {exc}"[:200]
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()]
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.status:
+            span["status"] = {"code": self.status, **({"message": self.status_message} if self.status_message else {})}
+        return span
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class SpanExporter:
+    """
+    Batches finished spans on a queue and writes them from a background
+    thread, one OTLP/JSON ExportTraceServiceRequest per line, to this
+    worker's file in TRACE_DIR (readable by the OpenTelemetry Collector's
+    otlpjsonfile receiver). A full queue drops spans rather than block.
+    """
+
+    def __init__(self, config):
+        self.directory = config['TRACE_DIR']
+        self.max_bytes = config['TRACE_MAX_BYTES']
+        self.batch_size = config['TRACE_BATCH_SIZE']
+        self.interval = config['TRACE_EXPORT_INTERVAL']
+        self.resource = [{"key": "service.name", "value": {"stringValue": config['TRACE_SERVICE_NAME']}}]
+        self._queue = queue.Queue(maxsize=config['TRACE_QUEUE_SIZE'])
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self.exported = 0
+        self.dropped = 0
+
+    def submit(self, span):
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_worker(self):
+        # Started lazily so it always lives in the (post-fork) worker
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='span-exporter', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+                self.exported += len(batch)
+            except Exception:
+                logger.exception("Could not export spans")
+
+    def _write(self, batch):
+        line = json.dumps({"resourceSpans": [{
+            "resource": {"attributes": self.resource},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [span.to_otlp() for span in batch]}]
+        }]})
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'traces-{os.getpid()}.jsonl')
+        try:
+            if os.path.getsize(path) > self.max_bytes:
+                os.replace(path, path + '.1')
+        except FileNotFoundError:
+            pass
+        with open(path, 'a') as f:
+            f.write(line + '\n')
+
+    def stats(self):
+        return {"queued": self._queue.qsize(), "exported": self.exported, "dropped": self.dropped}
+
+
+class Tracer:
+    def __init__(self, config):
+        self.sample_rate = config['TRACE_SAMPLE_RATE']
+        self.respect_parent = config['TRACE_RESPECT_PARENT']
+        self.max_spans = config['TRACE_MAX_SPANS']
+        self.exporter = SpanExporter(config)
+
+    def start_root(self, name, traceparent):
+        """A server span continuing the incoming trace, or None if the request is not sampled."""
+        match = _TRACEPARENT.match(traceparent or '')
+        if match and self.respect_parent:
+            trace_id, parent_id, flags = match.groups()
+            if not int(flags, 16) & 1:
+                return None
+        else:
+            trace_id, parent_id = None, None
+            if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+                return None
+        return Span(name, trace_id or os.urandom(16).hex(), parent_id, KIND_SERVER)
+
+    def finish(self, span, end_ns=None):
+        span.end_ns = end_ns or time.time_ns()
+        if span is not span.root:
+            span.root.children += 1
+            if span.root.children > self.max_spans:
+                return  # A runaway loop of queries; the root records the overflow
+        self.exporter.submit(span)
+
+
+def get_tracer():
+    return current_app.extensions['tracer']
+
+
+def current_span():
+    return _current_span.get()
+
+
+def traceparent():
+    """Header value for propagating the current trace to an outgoing call, or None."""
+    span = _current_span.get()
+    return f"00-{span.trace_id}-{span.span_id}-01" if span else None
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    A child of the current span for the duration of the block. Outside a
+    sampled request this does nothing beyond one context variable lookup.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = parent.child(name)
+    child.attributes.update(attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.fail(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        get_tracer().finish(child)
+
+
+def _record_statement(conn, statement, parameters, seconds, executemany):
+    parent = _current_span.get()
+    if parent is None:
+        return
+    end_ns = time.time_ns()
+    child = parent.child('db.query', KIND_CLIENT, start_ns=end_ns - int(seconds * 1e9))
+    child.attributes.update({
+        "db.system": conn.dialect.name,
+        "db.operation": statement.lstrip().split(None, 1)[0].upper() if statement.strip() else '',
+        "db.statement": normalize(statement)
+    })
+    if executemany:
+        child.attributes["db.batch_size"] = len(parameters)
+    get_tracer().finish(child, end_ns)
+
+
+class TracingJSONProvider(DefaultJSONProvider):
+    """Times response building (serialization included) as its own span."""
+
+    def response(self, *args, **kwargs):
+        with span('response.json'):
+            return super().response(*args, **kwargs)
+
+
+def _before_request():
+    tracer = get_tracer()
+    root = tracer.start_root(f"{request.method} {request.url_rule or 'unmatched'}",
+                             request.headers.get(TRACEPARENT_HEADER))
+    if root is None:
+        return
+    root.attributes.update({
+        "http.method": request.method,
+        "http.route": str(request.url_rule or ''),
+        "http.target": request.path,
+        "flask.endpoint": request.endpoint or ''
+    })
+    request_id = g.get('request_id')
+    if request_id:
+        root.attributes["request.id"] = request_id
+    g.trace_root = root
+    g.trace_token = _current_span.set(root)
+
+
+def _after_request(response):
+    root = g.get('trace_root')
+    if root is not None:
+        root.attributes["http.status_code"] = response.status_code
+        if response.status_code >= 500:
+            root.status = STATUS_ERROR
+    return response
+
+
+def _teardown_request(exc):
+    root = g.pop('trace_root', None)
+    if root is None:
+        return
+    _current_span.reset(g.pop('trace_token'))
+    if exc is not None:
+        root.fail(exc)
+    tracer = get_tracer()
+    if root.children > tracer.max_spans:
+        root.attributes["trace.dropped_spans"] = root.children - tracer.max_spans
+    tracer.finish(root)
+
+
+def init_app(app):
+    """Registers the request hooks, the SQL hook and the JSON provider. Call after structured_logging."""
+    tracer = app.extensions['tracer'] = Tracer(app.config)
+    if tracer.sample_rate <= 0 and not tracer.respect_parent:
+        return
+    app.json = TracingJSONProvider(app)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    sql_timing.add_hook(_record_statement)
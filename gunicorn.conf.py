@@ -0,0 +1,90 @@
+import multiprocessing
+import os
+
+# Serving mode: "gevent" (cooperative, default), "gthread" (threaded) or "sync"
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gevent")
+
+# gevent must patch the stdlib before anything else (app, SQLAlchemy pool,
+# threading locks) gets imported, otherwise preload_app leaves us with
+# unpatched primitives in the workers.
+if worker_class == "gevent":
+    from gevent import monkey
+    monkey.patch_all()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+# Database connections each worker may hold (SQLAlchemy pool_size + max_overflow)
+db_pool_size = int(os.environ.get("DB_POOL_SIZE", 5))
+db_max_overflow = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+db_conns_per_worker = db_pool_size + db_max_overflow
+
+# Connections we allow this app to use on the Postgres server, leaving
+# headroom for migrations, psql sessions and replication.
+db_max_connections = int(os.environ.get("DB_MAX_CONNECTIONS", 100))
+db_reserved_connections = int(os.environ.get("DB_RESERVED_CONNECTIONS", 10))
+db_connection_budget = max(db_max_connections - db_reserved_connections, db_conns_per_worker)
+
+# Workers: the usual 2*CPU+1 for sync, one per CPU when each worker is
+# concurrent anyway; never more than the connection budget allows.
+cpu_count = multiprocessing.cpu_count()
+if worker_class == "sync":
+    default_workers = cpu_count * 2 + 1
+else:
+    default_workers = cpu_count
+workers = int(os.environ.get(
+    "WEB_CONCURRENCY",
+    max(1, min(default_workers, db_connection_budget // db_conns_per_worker))
+))
+
+# gevent: greenlets beyond the pool just wait for a checkout, so allow a few
+# per connection to overlap request parsing and serialization with DB work.
+worker_connections = int(os.environ.get(
+    "GUNICORN_WORKER_CONNECTIONS",
+    db_conns_per_worker * int(os.environ.get("GEVENT_REQUESTS_PER_CONNECTION", 4))
+))
+
+# gthread: one thread per connection the pool can hand out
+threads = int(os.environ.get("GUNICORN_THREADS", db_conns_per_worker if worker_class == "gthread" else 1))
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() == "true"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 0))
+
+# The app writes its own per-request log line through a queue (LOG_REQUESTS),
+# so gunicorn's synchronous access log is off unless asked for. When on, it
+# logs the path without the query string, which can carry tokens.
+accesslog = "-" if os.environ.get("GUNICORN_ACCESS_LOG", "false").lower() == "true" else None
+access_log_format = '%(h)s %(t)s "%(m)s %(U)s %(H)s" %(s)s %(b)s %(L)ss "%(a)s"'
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    from app.utils.concurrency import make_psycopg2_cooperative, dispose_engines
+
+    if worker_class == "gevent":
+        make_psycopg2_cooperative()
+
+    # With preload_app the engine was created in the master; make sure this
+    # worker starts with its own pool.
+    if server.cfg.preload_app:
+        dispose_engines(server.app.wsgi())
+
+
+def _metrics_store():
+    from config import Config
+    from app.utils.metrics import MultiprocessStore
+    return MultiprocessStore(Config.METRICS_DIR)
+
+
+def on_starting(server):
+    # Route metrics are summed over the files in METRICS_DIR; start from zero
+    # rather than adding to the counters of a previous server
+    _metrics_store().clear()
+
+
+def child_exit(server, worker):
+    # Keep the exited worker's counters, drop its in-flight gauge
+    _metrics_store().mark_dead(worker.pid)
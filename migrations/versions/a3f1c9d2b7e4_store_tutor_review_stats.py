@@ -0,0 +1,68 @@
+"""Store tutor review stats and index reviews for keyset paging
+
+Revision ID: a3f1c9d2b7e4
+Revises: e0bf2566ea2a
+Create Date: 2026-10-19 09:12:41.118202
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f1c9d2b7e4'
+down_revision = 'e0bf2566ea2a'
+branch_labels = None
+depends_on = None
+
+RATING_COLUMNS = [f'rating_{r}_count' for r in range(1, 6)]
+
+
+def upgrade():
+    with op.batch_alter_table('tutors', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('review_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('rating_sum', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('average_rating', sa.Numeric(precision=3, scale=2), server_default='0', nullable=False))
+        for column in RATING_COLUMNS:
+            batch_op.add_column(sa.Column(column, sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill from the existing reviews
+    op.execute("""
+        UPDATE tutors SET
+            review_count = s.review_count,
+            rating_sum = s.rating_sum,
+            average_rating = round(s.rating_sum::numeric / s.review_count, 2),
+            rating_1_count = s.r1,
+            rating_2_count = s.r2,
+            rating_3_count = s.r3,
+            rating_4_count = s.r4,
+            rating_5_count = s.r5
+        FROM (
+            SELECT tutor_id,
+                   count(*) AS review_count,
+                   sum(rating) AS rating_sum,
+                   count(*) FILTER (WHERE rating = 1) AS r1,
+                   count(*) FILTER (WHERE rating = 2) AS r2,
+                   count(*) FILTER (WHERE rating = 3) AS r3,
+                   count(*) FILTER (WHERE rating = 4) AS r4,
+                   count(*) FILTER (WHERE rating = 5) AS r5
+            FROM reviews
+            GROUP BY tutor_id
+        ) AS s
+        WHERE tutors.id = s.tutor_id
+    """)
+
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.create_index('ix_reviews_tutor_created', ['tutor_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.drop_index('ix_reviews_tutor_created')
+
+    with op.batch_alter_table('tutors', schema=None) as batch_op:
+        for column in reversed(RATING_COLUMNS):
+            batch_op.drop_column(column)
+        batch_op.drop_column('average_rating')
+        batch_op.drop_column('rating_sum')
+        batch_op.drop_column('review_count')
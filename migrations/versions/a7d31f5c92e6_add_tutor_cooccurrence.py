@@ -0,0 +1,31 @@
+"""Add tutor co-occurrence counts for search ranking
+
+Revision ID: a7d31f5c92e6
+Revises: f2c8e61b09d4
+Create Date: 2026-10-19 19:42:10.518364
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d31f5c92e6'
+down_revision = 'f2c8e61b09d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('tutor_cooccurrence',
+    sa.Column('tutor_id', sa.UUID(), nullable=False),
+    sa.Column('other_tutor_id', sa.UUID(), nullable=False),
+    sa.Column('students', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['tutor_id'], ['tutors.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['other_tutor_id'], ['tutors.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('tutor_id', 'other_tutor_id')
+    )
+
+
+def downgrade():
+    op.drop_table('tutor_cooccurrence')
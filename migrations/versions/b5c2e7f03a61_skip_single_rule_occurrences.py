@@ -0,0 +1,36 @@
+"""Let availability exceptions skip a single occurrence of a rule
+
+Revision ID: b5c2e7f03a61
+Revises: a7d31f5c92e6
+Create Date: 2026-10-19 21:14:52.207913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5c2e7f03a61'
+down_revision = 'a7d31f5c92e6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('availability_exceptions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('start_time', sa.DateTime(), nullable=True))
+        batch_op.drop_constraint('uq_availability_exceptions_rule_date', type_='unique')
+        batch_op.create_index('uq_availability_exceptions_rule_date', ['rule_id', 'date'], unique=True,
+                              postgresql_where=sa.text('start_time IS NULL'))
+        batch_op.create_index('uq_availability_exceptions_rule_start', ['rule_id', 'start_time'], unique=True,
+                              postgresql_where=sa.text('start_time IS NOT NULL'))
+
+
+def downgrade():
+    # Single-occurrence exceptions have no whole-day equivalent
+    op.execute("DELETE FROM availability_exceptions WHERE start_time IS NOT NULL")
+    with op.batch_alter_table('availability_exceptions', schema=None) as batch_op:
+        batch_op.drop_index('uq_availability_exceptions_rule_start')
+        batch_op.drop_index('uq_availability_exceptions_rule_date')
+        batch_op.create_unique_constraint('uq_availability_exceptions_rule_date', ['rule_id', 'date'])
+        batch_op.drop_column('start_time')
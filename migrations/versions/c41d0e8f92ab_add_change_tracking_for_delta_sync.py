@@ -0,0 +1,58 @@
+"""Add change tracking for delta sync
+
+Revision ID: c41d0e8f92ab
+Revises: b8e27d41c6a0
+Create Date: 2026-10-19 11:26:53.804117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41d0e8f92ab'
+down_revision = 'b8e27d41c6a0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(sa.schema.CreateSequence(sa.Sequence('sync_change_seq')))
+
+    # The server defaults number existing rows; new rows get their value
+    # from the model defaults
+    for table in ('time_slots', 'tutoring_session'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True))
+            batch_op.add_column(sa.Column('change_seq', sa.BigInteger(), server_default=sa.text("nextval('sync_change_seq')"), nullable=False))
+
+    with op.batch_alter_table('time_slots', schema=None) as batch_op:
+        batch_op.create_index('ix_time_slots_tutor_change_seq', ['tutor_id', 'change_seq'], unique=False)
+
+    op.create_table('sync_tombstones',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('entity', sa.String(length=30), nullable=False),
+    sa.Column('entity_id', sa.UUID(), nullable=False),
+    sa.Column('change_seq', sa.BigInteger(), server_default=sa.text("nextval('sync_change_seq')"), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('sync_tombstones', schema=None) as batch_op:
+        batch_op.create_index('ix_sync_tombstones_user_change_seq', ['user_id', 'change_seq'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('sync_tombstones', schema=None) as batch_op:
+        batch_op.drop_index('ix_sync_tombstones_user_change_seq')
+    op.drop_table('sync_tombstones')
+
+    with op.batch_alter_table('time_slots', schema=None) as batch_op:
+        batch_op.drop_index('ix_time_slots_tutor_change_seq')
+
+    for table in ('tutoring_session', 'time_slots'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('change_seq')
+            batch_op.drop_column('updated_at')
+
+    op.execute(sa.schema.DropSequence(sa.Sequence('sync_change_seq')))
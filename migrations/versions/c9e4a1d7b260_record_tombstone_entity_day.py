@@ -0,0 +1,26 @@
+"""Record the analytics day of deleted rows on their sync tombstones
+
+Revision ID: c9e4a1d7b260
+Revises: b5c2e7f03a61
+Create Date: 2026-10-19 21:48:03.664120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9e4a1d7b260'
+down_revision = 'b5c2e7f03a61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('sync_tombstones', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('entity_day', sa.Date(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('sync_tombstones', schema=None) as batch_op:
+        batch_op.drop_column('entity_day')
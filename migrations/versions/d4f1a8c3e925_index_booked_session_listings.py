@@ -0,0 +1,31 @@
+"""Index booked session listings in page order
+
+Revision ID: d4f1a8c3e925
+Revises: c9e4a1d7b260
+Create Date: 2026-10-20 09:12:41.518302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4f1a8c3e925'
+down_revision = 'c9e4a1d7b260'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('time_slots', schema=None) as batch_op:
+        batch_op.drop_index('ix_time_slots_student_start')
+        batch_op.create_index('ix_time_slots_student_start', ['student_id', 'start_time', 'id'], unique=False)
+        batch_op.create_index('ix_time_slots_tutor_booked_start', ['tutor_id', 'start_time', 'id'], unique=False,
+                              postgresql_where=sa.text('student_id IS NOT NULL'))
+
+
+def downgrade():
+    with op.batch_alter_table('time_slots', schema=None) as batch_op:
+        batch_op.drop_index('ix_time_slots_tutor_booked_start')
+        batch_op.drop_index('ix_time_slots_student_start')
+        batch_op.create_index('ix_time_slots_student_start', ['student_id', 'start_time'], unique=False)
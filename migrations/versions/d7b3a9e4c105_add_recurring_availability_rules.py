@@ -0,0 +1,61 @@
+"""Add recurring availability rules
+
+Revision ID: d7b3a9e4c105
+Revises: c41d0e8f92ab
+Create Date: 2026-10-19 13:02:37.418260
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7b3a9e4c105'
+down_revision = 'c41d0e8f92ab'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('availability_rules',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('tutor_id', sa.UUID(), nullable=False),
+    sa.Column('weekday', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.Time(), nullable=False),
+    sa.Column('end_time', sa.Time(), nullable=False),
+    sa.Column('slot_minutes', sa.Integer(), nullable=False),
+    sa.Column('valid_from', sa.Date(), nullable=False),
+    sa.Column('valid_until', sa.Date(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['tutor_id'], ['tutors.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('availability_rules', schema=None) as batch_op:
+        batch_op.create_index('ix_availability_rules_tutor_weekday', ['tutor_id', 'weekday'], unique=False)
+
+    op.create_table('availability_exceptions',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('rule_id', sa.UUID(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.ForeignKeyConstraint(['rule_id'], ['availability_rules.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('rule_id', 'date', name='uq_availability_exceptions_rule_date')
+    )
+
+    with op.batch_alter_table('time_slots', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('rule_id', sa.UUID(), nullable=True))
+        batch_op.create_foreign_key('time_slots_rule_id_fkey', 'availability_rules', ['rule_id'], ['id'], ondelete='SET NULL')
+        batch_op.create_unique_constraint('uq_time_slots_rule_start', ['rule_id', 'start_time'])
+
+
+def downgrade():
+    with op.batch_alter_table('time_slots', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_time_slots_rule_start', type_='unique')
+        batch_op.drop_constraint('time_slots_rule_id_fkey', type_='foreignkey')
+        batch_op.drop_column('rule_id')
+
+    op.drop_table('availability_exceptions')
+
+    with op.batch_alter_table('availability_rules', schema=None) as batch_op:
+        batch_op.drop_index('ix_availability_rules_tutor_weekday')
+    op.drop_table('availability_rules')
@@ -0,0 +1,71 @@
+"""Add daily analytics rollups
+
+Revision ID: e5a0c7d2f318
+Revises: d7b3a9e4c105
+Create Date: 2026-10-19 15:48:12.690114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a0c7d2f318'
+down_revision = 'd7b3a9e4c105'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('daily_tutor_rollups',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('tutor_id', sa.UUID(), nullable=False),
+    sa.Column('slots_offered', sa.Integer(), nullable=False),
+    sa.Column('offered_minutes', sa.Integer(), nullable=False),
+    sa.Column('slots_booked', sa.Integer(), nullable=False),
+    sa.Column('booked_minutes', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('bookings', sa.Integer(), nullable=False),
+    sa.Column('cancellations', sa.Integer(), nullable=False),
+    sa.Column('reviews', sa.Integer(), nullable=False),
+    sa.Column('rating_sum', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['tutor_id'], ['tutors.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('day', 'tutor_id')
+    )
+    with op.batch_alter_table('daily_tutor_rollups', schema=None) as batch_op:
+        batch_op.create_index('ix_daily_tutor_rollups_tutor_day', ['tutor_id', 'day'], unique=False)
+
+    op.create_table('rollup_watermarks',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('change_seq', sa.BigInteger(), nullable=True),
+    sa.Column('position', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+    # Watermark scans: everything changed since a change_seq or time
+    with op.batch_alter_table('time_slots', schema=None) as batch_op:
+        batch_op.create_index('ix_time_slots_change_seq', ['change_seq'], unique=False)
+    with op.batch_alter_table('tutoring_session', schema=None) as batch_op:
+        batch_op.create_index('ix_tutoring_session_change_seq', ['change_seq'], unique=False)
+    with op.batch_alter_table('sync_tombstones', schema=None) as batch_op:
+        batch_op.create_index('ix_sync_tombstones_change_seq', ['change_seq'], unique=False)
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.create_index('ix_reviews_created_at', ['created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.drop_index('ix_reviews_created_at')
+    with op.batch_alter_table('sync_tombstones', schema=None) as batch_op:
+        batch_op.drop_index('ix_sync_tombstones_change_seq')
+    with op.batch_alter_table('tutoring_session', schema=None) as batch_op:
+        batch_op.drop_index('ix_tutoring_session_change_seq')
+    with op.batch_alter_table('time_slots', schema=None) as batch_op:
+        batch_op.drop_index('ix_time_slots_change_seq')
+
+    op.drop_table('rollup_watermarks')
+
+    with op.batch_alter_table('daily_tutor_rollups', schema=None) as batch_op:
+        batch_op.drop_index('ix_daily_tutor_rollups_tutor_day')
+    op.drop_table('daily_tutor_rollups')
@@ -0,0 +1,32 @@
+"""Index each user's sessions and booked slots by change sequence
+
+Revision ID: e8b2c5f71d39
+Revises: d4f1a8c3e925
+Create Date: 2026-10-20 10:03:17.842156
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8b2c5f71d39'
+down_revision = 'd4f1a8c3e925'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('tutoring_session', schema=None) as batch_op:
+        batch_op.create_index('ix_tutoring_session_student_change_seq', ['student_id', 'change_seq'], unique=False)
+        batch_op.create_index('ix_tutoring_session_tutor_change_seq', ['tutor_id', 'change_seq'], unique=False)
+    with op.batch_alter_table('time_slots', schema=None) as batch_op:
+        batch_op.create_index('ix_time_slots_student_change_seq', ['student_id', 'change_seq'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('time_slots', schema=None) as batch_op:
+        batch_op.drop_index('ix_time_slots_student_change_seq')
+    with op.batch_alter_table('tutoring_session', schema=None) as batch_op:
+        batch_op.drop_index('ix_tutoring_session_tutor_change_seq')
+        batch_op.drop_index('ix_tutoring_session_student_change_seq')
@@ -0,0 +1,47 @@
+"""Index tutor search sort orders and store next availability
+
+Revision ID: f2c8e61b09d4
+Revises: e5a0c7d2f318
+Create Date: 2026-10-19 17:06:33.402187
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c8e61b09d4'
+down_revision = 'e5a0c7d2f318'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('tutors', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('next_available_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_tutors_hourly_rate', ['hourly_rate', 'id'], unique=False)
+        batch_op.create_index('ix_tutors_rating', ['average_rating', 'review_count', 'id'], unique=False)
+        batch_op.create_index('ix_tutors_review_count', ['review_count', 'id'], unique=False)
+        batch_op.create_index('ix_tutors_next_available', ['next_available_at', 'id'], unique=False)
+
+    # Backfill from concrete slots; `flask search sweep` adds the tutors
+    # whose next opening is a recurring rule occurrence
+    op.execute("""
+        UPDATE tutors SET next_available_at = s.next_available_at
+        FROM (
+            SELECT tutor_id, min(start_time) AS next_available_at
+            FROM time_slots
+            WHERE status = 'available' AND start_time > (now() AT TIME ZONE 'utc')
+            GROUP BY tutor_id
+        ) AS s
+        WHERE tutors.id = s.tutor_id
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('tutors', schema=None) as batch_op:
+        batch_op.drop_index('ix_tutors_next_available')
+        batch_op.drop_index('ix_tutors_review_count')
+        batch_op.drop_index('ix_tutors_rating')
+        batch_op.drop_index('ix_tutors_hourly_rate')
+        batch_op.drop_column('next_available_at')
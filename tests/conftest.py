@@ -0,0 +1,46 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Settings must be in place before config.py is imported. These tests
+# cover code that answers without touching the database, so no Postgres
+# is needed to run them.
+_scratch = tempfile.mkdtemp(prefix='tutormatch-tests-')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(_scratch, 'unused.sqlite3'))
+os.environ.setdefault('SECRET_KEY', 'test-secret-key')
+os.environ.setdefault('JWT_SECRET_KEY', 'test-jwt-secret-key-of-at-least-32-bytes')
+os.environ.setdefault('EVENT_BUS', 'local')
+os.environ.setdefault('SHARED_STORE_PATH', os.path.join(_scratch, 'shared.sqlite3'))
+os.environ.setdefault('PROFILE_DIR', os.path.join(_scratch, 'profiles'))
+os.environ.setdefault('LOG_REQUESTS', 'false')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import create_app
+    app = create_app()
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth(app):
+    """auth(account_type, user_id=None) -> request headers with a Bearer token."""
+    import uuid
+    from flask_jwt_extended import create_access_token
+
+    def headers(account_type, user_id=None):
+        with app.app_context():
+            token = create_access_token(identity=str(user_id or uuid.uuid4()),
+                                        additional_claims={"account_type": account_type})
+        return {"Authorization": f"Bearer {token}"}
+    return headers
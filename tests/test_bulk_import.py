@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from app.utils import bulk_import
+from app.utils.bulk_import import import_classes, import_subjects, import_users, parse_records
+
+
+def errors_of(result):
+    return {e["row"]: e["errors"] for e in result.to_dict()["errors"]}
+
+
+def test_parse_ndjson_keeps_any_json_value_for_per_row_checks():
+    assert parse_records('{"name": "a"}\n\n[1, 2]\n"text"\n', 'ndjson') == [{"name": "a"}, [1, 2], "text"]
+
+
+def test_parse_ndjson_rejects_invalid_json():
+    with pytest.raises(ValueError, match="Line 2"):
+        parse_records('{}\n{oops\n', 'ndjson')
+
+
+@pytest.mark.parametrize('importer', [import_users, import_subjects, import_classes])
+def test_non_object_records_are_row_errors(app, importer):
+    with app.app_context():
+        result = importer([[1, 2], "text", 5, None])
+    assert result.inserted == 0
+    assert errors_of(result) == {row: ["Record must be a JSON object"] for row in range(1, 5)}
+
+
+def test_user_fields_of_the_wrong_type_are_row_errors(app):
+    records = [
+        {"username": ["a"], "email": "a@x", "password": "pw", "first_name": "A", "last_name": "B",
+         "account_type": "student"},
+        {"username": "b", "email": {"at": "x"}, "password": "pw", "first_name": "A", "last_name": "B",
+         "account_type": {"tutor": 1}},
+        {"username": "c", "email": "c@x", "password": "pw", "first_name": "A", "last_name": "B",
+         "account_type": "tutor", "classes": [{"id": 1}]},
+    ]
+    with app.app_context():
+        result = import_users(records)
+    assert errors_of(result) == {
+        1: ["Invalid username: must be a string"],
+        2: ["Invalid email: must be a string", "Invalid account_type: must be a string"],
+        3: ["Invalid classes: must be a list of IDs"],
+    }
+
+
+def test_subject_and_class_fields_of_the_wrong_type_are_row_errors(app):
+    with app.app_context():
+        subjects = import_subjects([{"name": {"en": "Math"}}, {"name": "Math", "code": 101}])
+        classes = import_classes([{"section": ["A"], "subject_code": "M"}, {"section": "A", "subject_id": 7}])
+    assert errors_of(subjects) == {1: ["Invalid name: must be a string"], 2: ["Invalid code: must be a string"]}
+    assert errors_of(classes) == {1: ["Invalid section: must be a string"], 2: ["Invalid subject_id: must be a string"]}
+
+
+def test_http_import_reports_bad_lines_per_row(client, auth):
+    body = '\n'.join(json.dumps(value) for value in ([1], {"name": ["x"]}))
+    response = client.post('/api/admin/import/subjects', data=body, content_type='application/x-ndjson',
+                           headers=auth('admin'))
+    assert response.status_code == 200
+    assert response.get_json() == {"inserted": 0, "failed": 2, "errors": [
+        {"row": 1, "errors": ["Record must be a JSON object"]},
+        {"row": 2, "errors": ["Invalid name: must be a string"]},
+    ]}
+
+
+def test_passwords_hash_in_process_unless_workers_are_given(monkeypatch):
+    def no_pool(*args, **kwargs):
+        raise AssertionError("no process pool expected")
+    monkeypatch.setattr(bulk_import, 'ProcessPoolExecutor', no_pool)
+    monkeypatch.setattr(bulk_import, 'generate_password_hash', lambda password: f'hashed:{password}')
+    assert bulk_import._hash_passwords(['pw'] * 100, 1) == ['hashed:pw'] * 100
+
+
+def test_http_user_imports_past_the_cap_are_sent_to_the_cli(app, client, auth):
+    rows = app.config['BULK_IMPORT_HTTP_MAX_USERS'] + 1
+    body = '\n'.join(json.dumps({"username": f"u{i}"}) for i in range(rows))
+    response = client.post('/api/admin/import/users', data=body, content_type='application/x-ndjson',
+                           headers=auth('admin'))
+    assert response.status_code == 413
+    assert 'flask import' in response.get_json()["message"]
+
+
+def test_uploads_past_max_content_length_are_refused(app, client, auth):
+    body = b'x' * (app.config['MAX_CONTENT_LENGTH'] + 1)
+    response = client.post('/api/admin/import/subjects', data=body, content_type='text/csv',
+                           headers=auth('admin'))
+    assert response.status_code == 413
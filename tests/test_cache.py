@@ -0,0 +1,128 @@
+import time
+
+import pytest
+from flask import g
+
+from app.utils import cache as cache_module
+from app.utils.cache import ALL, BUMPED, TwoTierCache
+from app.utils.events import get_bus
+from app.utils.shared_store import SharedStore
+
+
+@pytest.fixture
+def store(app, tmp_path, monkeypatch):
+    store = SharedStore(str(tmp_path / 'shared.sqlite3'))
+    monkeypatch.setitem(app.extensions, 'shared_store', store)
+    with app.app_context():
+        yield store
+
+
+def make_cache(app, **overrides):
+    settings = dict(CACHE_ENABLED=True, CACHE_VERSION_TTL=60, READ_YOUR_WRITES_SECONDS=10)
+    return TwoTierCache(dict(app.config, **dict(settings, **overrides)))
+
+
+def count_reads(store, monkeypatch):
+    reads = []
+    get = store.get
+    monkeypatch.setattr(store, 'get', lambda key, default=None: reads.append(key) or get(key, default))
+    return reads
+
+
+def test_versions_are_reused_for_their_ttl(app, store, monkeypatch):
+    cache = make_cache(app)
+    reads = count_reads(store, monkeypatch)
+    with app.test_request_context():
+        first = cache.key(['search'], 'a')
+        assert cache.key(['search'], 'a') == first
+    assert reads == ['cache:version:*', 'cache:version:search']
+
+
+def test_versions_are_reread_after_their_ttl(app, store, monkeypatch):
+    cache = make_cache(app, CACHE_VERSION_TTL=0.05)
+    with app.test_request_context():
+        before = cache.key(['search'], 'a')
+        # Another worker bumps
+        make_cache(app).bump('search')
+        assert cache.key(['search'], 'a') == before
+        time.sleep(0.06)
+        assert cache.key(['search'], 'a') != before
+
+
+def test_bump_is_seen_at_once_by_the_bumping_worker(app, store):
+    cache = make_cache(app)
+    with app.test_request_context():
+        before = cache.key(['tutor:1', 'search'], 'a')
+        cache.bump('search')
+        after = cache.key(['tutor:1', 'search'], 'a')
+    assert before == 'cache:*@0,tutor:1@0,search@0:a'
+    assert after == 'cache:*@0,tutor:1@0,search@1:a'
+
+
+def test_plain_counter_versions_still_read(app, store):
+    store.set('cache:version:search', 7)
+    cache = make_cache(app)
+    assert cache.version('search') == (7, 0)
+    cache.bump('search')
+    assert cache.version('search')[0] == 8
+
+
+def fill(app, cache, use_replica):
+    # A request of its own, with its own g
+    with app.app_context(), app.test_request_context():
+        g.db_use_replica = use_replica
+        key = cache.key(['search'], 'page')
+        cache.set(key, {'rows': 1}, 60)
+        return cache.get(key)
+
+
+def test_replica_reads_do_not_fill_right_after_a_bump(app, store):
+    cache = make_cache(app)
+    cache.bump('search')
+    assert fill(app, cache, use_replica=True) is None
+    assert cache.skipped_sets == 1
+    # The primary has the new rows
+    assert fill(app, cache, use_replica=False) == {'rows': 1}
+
+
+def test_replica_reads_fill_once_the_lag_window_passed(app, store, monkeypatch):
+    cache = make_cache(app)
+    cache.bump('search')
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 11)
+    assert fill(app, cache, use_replica=True) == {'rows': 1}
+
+
+def test_bus_bumps_apply_once_per_host(app, store):
+    sender, worker, other_worker = make_cache(app), make_cache(app), make_cache(app)
+    with app.test_request_context():
+        worker.key(['search'], 'a')
+        other_worker.key(['search'], 'a')  # Both subscribed
+        # The committing process applies its bump, then the bus brings it back
+        sender.bump('search', bump_id='b1')
+        get_bus().deliver([{"type": BUMPED, "id": 'b1', "namespaces": ['search']},
+                           {"type": BUMPED, "id": 'b2', "namespaces": ['tutor:1']}])
+        worker.key(['search'], 'a')
+        other_worker.key(['search'], 'a')
+    assert store.get('cache:version:search')[0] == 1
+    assert store.get('cache:version:tutor:1')[0] == 1
+    assert worker.remote_bumps == other_worker.remote_bumps == 2
+
+
+def test_an_overflowed_queue_bumps_everything(app, store):
+    cache = make_cache(app, CACHE_EVENT_QUEUE_SIZE=2)
+    with app.test_request_context():
+        before = cache.key(['search'], 'a')
+        get_bus().deliver([{"type": 'directory.reload'}] * 3)
+        assert cache.key(['search'], 'a') != before
+    assert cache.version(ALL)[0] == 1
+
+
+def test_commits_send_large_bumps_as_all(app, store, monkeypatch):
+    class Session:
+        info = {'cache_bumps': {f'tutor:{i}' for i in range(cache_module.MAX_BUMPED_NAMESPACES + 1)}}
+    published = []
+    monkeypatch.setattr(cache_module.events, 'publish', published.append)
+    cache_module._on_before_commit(Session)
+    assert published == [{"type": BUMPED, "id": Session.info['cache_bumps_sent'][0], "namespaces": [ALL]}]
+    assert len(Session.info['cache_bumps']) == cache_module.MAX_BUMPED_NAMESPACES + 1
@@ -0,0 +1,40 @@
+import uuid
+
+from flask_jwt_extended import create_access_token
+
+from app.utils.db_routing import PRIMARY_PIN_HEADER, _pin_serializer, _pinned
+
+
+def _headers(app, user_id, pin_for=None):
+    with app.app_context():
+        headers = {"Authorization": f"Bearer {create_access_token(identity=user_id)}"}
+        if pin_for is not None:
+            headers[PRIMARY_PIN_HEADER] = _pin_serializer().dumps(pin_for)
+    return headers
+
+
+def test_a_pin_holds_for_its_own_user(app):
+    user_id = str(uuid.uuid4())
+    with app.test_request_context('/', headers=_headers(app, user_id, pin_for=user_id)):
+        assert _pinned()
+
+
+def test_no_pin_means_replica_reads(app):
+    with app.test_request_context('/', headers=_headers(app, str(uuid.uuid4()))):
+        assert not _pinned()
+
+
+def test_a_pin_is_not_honoured_for_another_user(app):
+    with app.test_request_context('/', headers=_headers(app, str(uuid.uuid4()), pin_for=str(uuid.uuid4()))):
+        assert not _pinned()
+
+
+def test_forged_and_expired_pins_are_ignored(app, monkeypatch):
+    user_id = str(uuid.uuid4())
+    headers = _headers(app, user_id)
+    with app.test_request_context('/', headers={**headers, PRIMARY_PIN_HEADER: user_id}):
+        assert not _pinned()
+    headers = _headers(app, user_id, pin_for=user_id)
+    monkeypatch.setitem(app.config, 'READ_YOUR_WRITES_SECONDS', -1)
+    with app.test_request_context('/', headers=headers):
+        assert not _pinned()
@@ -0,0 +1,210 @@
+import random
+import threading
+import time
+import uuid
+
+import pytest
+from sqlalchemy.sql import operators
+from werkzeug.datastructures import MultiDict
+
+from app.utils.directory import CHANGED, RELOAD, Snapshot, TutorDirectory, bits_of, rows_of
+from app.utils.events import get_bus
+from app.utils.search import AVAILABILITY_BUCKETS, SORTS
+
+# Snapshot row field holding each column the SQL sort orders read
+FIELDS = {'hourly_rate': 'rate', 'average_rating': 'rating', 'review_count': 'reviews',
+          'next_available_at': 'next_at', 'id': 'uid'}
+
+
+def sql_order(rows, sort):
+    """Tutor ids of rows as ORDER BY search.SORTS[sort] would return them."""
+    items = [dict(row, uid=tutor_id.int, id=tutor_id) for tutor_id, row in rows.items()]
+    clauses = SORTS[sort] if sort else ()
+    # Stable sorts from the last key to the first give the multi-key order;
+    # a missing next_available_at is inf in the snapshot, last under nulls_last
+    for clause in reversed(clauses):
+        if clause.modifier is operators.nulls_last_op:
+            clause = clause.element
+        field = FIELDS[clause.element.key]
+        items.sort(key=lambda item: item[field], reverse=clause.modifier is operators.desc_op)
+    if not clauses:
+        items.sort(key=lambda item: item['uid'])
+    return [item['id'] for item in items]
+
+
+def make_rows(n, seed, classes):
+    rng = random.Random(seed)
+    rows = {}
+    for i in range(n):
+        reviews = rng.choice([0, 0, 1, 3, 10])
+        rows[uuid.UUID(int=rng.getrandbits(128))] = {
+            # Few distinct values, so every order has ties to break by id
+            "rate": float(rng.choice([10, 20, 25, 40, 60, 80])),
+            "rating": rng.choice([3.0, 4.0, 4.5, 5.0]) if reviews else 0.0,
+            "reviews": reviews,
+            "next_at": rng.choice([float('inf'), 1000.0, 2000.0, 3000.0]),
+            "name": f"tutor{i}\nann\nl{i}",
+            "classes": set(rng.sample(list(classes), rng.randint(0, 2))),
+            "buckets": set(rng.sample(list(AVAILABILITY_BUCKETS), rng.randint(0, 2))),
+        }
+    return rows
+
+
+@pytest.fixture
+def catalog():
+    subjects = {uuid.uuid4(): f'Subject {i}' for i in range(3)}
+    classes = {uuid.uuid4(): (subject_id, f'sec-{i}{j}')
+               for i, subject_id in enumerate(subjects) for j in range(2)}
+    return classes, subjects
+
+
+def snapshot_of(rows, catalog):
+    snapshot = Snapshot(*catalog)
+    snapshot.build(rows)
+    return snapshot
+
+
+def matches(rows, classes, args):
+    """Tutor ids the SQL filters of search.tutor_filters would keep."""
+    kept = set()
+    for tutor_id, row in rows.items():
+        if 'query' in args:
+            needle = args['query'].lower()
+            if needle not in row['name'] and not any(needle in classes[c][1] for c in row['classes']):
+                continue
+        if 'subject_id' in args and uuid.UUID(args['subject_id']) not in {classes[c][0] for c in row['classes']}:
+            continue
+        if 'availability' in args and args['availability'] not in row['buckets']:
+            continue
+        if 'min_rate' in args and row['rate'] < float(args['min_rate']):
+            continue
+        if 'max_rate' in args and row['rate'] >= float(args['max_rate']):
+            continue
+        if 'min_rating' in args and not (row['reviews'] and row['rating'] >= float(args['min_rating'])):
+            continue
+        kept.add(tutor_id)
+    return kept
+
+
+def test_bitsets_round_trip():
+    assert rows_of(bits_of([0, 7, 8, 300])) == [0, 7, 8, 300]
+    assert bits_of([]) == 0 and rows_of(0) == []
+
+
+@pytest.mark.parametrize('sort', [None, *SORTS])
+def test_every_sort_matches_its_sql_order(catalog, sort):
+    rows = make_rows(150, 1, catalog[0])
+    snapshot = snapshot_of(rows, catalog)
+    expected = sql_order(rows, sort)
+    pages = [snapshot.page({}, sort, page, 40) for page in range(1, 5)]
+    assert [tutor_id for ids, _ in pages for tutor_id in ids] == expected
+    assert {total for _, total in pages} == {150}
+
+
+@pytest.mark.parametrize('args', [
+    {'min_rate': '20', 'max_rate': '60'},
+    {'max_rate': '25'},
+    {'min_rating': '4'},
+    {'min_rating': '0'},
+    {'availability': 'evening'},
+    {'query': 'sec-1'},
+    {'query': 'ANN', 'min_rate': '40'},
+    {'subject': 0, 'availability': 'morning', 'min_rating': '3'},
+])
+@pytest.mark.parametrize('sort', [None, 'price_desc', 'rating', 'availability'])
+def test_filters_match_the_sql_filters(catalog, args, sort):
+    rows = make_rows(300, 2, catalog[0])
+    snapshot = snapshot_of(rows, catalog)
+    args = dict(args)
+    if 'subject' in args:
+        args['subject_id'] = str(list(catalog[1])[args.pop('subject')])
+    kept = matches(rows, catalog[0], args)
+    expected = [tutor_id for tutor_id in sql_order(rows, sort) if tutor_id in kept]
+
+    filters = snapshot.filters(MultiDict(args))
+    # Both the selective path (sorting the few matches) and the order walk
+    ids, total = snapshot.page(filters, sort, 1, 500)
+    assert (ids, total) == (expected, len(expected))
+    ids, total = snapshot.page(filters, sort, 2, 7)
+    assert ids == expected[7:14]
+
+
+def test_orders_stay_sorted_through_updates(catalog):
+    rows = make_rows(120, 3, catalog[0])
+    snapshot = snapshot_of(rows, catalog)
+    for sort in [None, *SORTS]:
+        snapshot.page({}, sort, 1, 10)  # Build every order before changing rows
+
+    rng = random.Random(4)
+    changed = make_rows(40, 5, catalog[0])
+    for tutor_id, row in zip(rng.sample(list(rows), 40), changed.values()):
+        rows[tutor_id] = row
+        snapshot.put(tutor_id, row)
+    for tutor_id in rng.sample(list(rows), 15):
+        del rows[tutor_id]
+        snapshot.remove(tutor_id)
+    added = make_rows(10, 6, catalog[0])
+    rows.update(added)
+    for tutor_id, row in added.items():
+        snapshot.put(tutor_id, row)
+
+    for sort in [None, *SORTS]:
+        assert snapshot.page({}, sort, 1, 500) == (sql_order(rows, sort), len(rows))
+    args = {'min_rate': '20', 'min_rating': '4', 'availability': 'afternoon'}
+    kept = matches(rows, catalog[0], args)
+    assert snapshot.page(snapshot.filters(MultiDict(args)), 'rating', 1, 500)[0] == \
+        [tutor_id for tutor_id in sql_order(rows, 'rating') if tutor_id in kept]
+
+
+def test_facets_count_every_filter_but_their_own(catalog):
+    rows = make_rows(200, 7, catalog[0])
+    snapshot = snapshot_of(rows, catalog)
+    args = {'availability': 'morning', 'min_rate': '20', 'max_rate': '40'}
+    facets = snapshot.facets(snapshot.filters(MultiDict(args)))
+
+    without_availability = matches(rows, catalog[0], {'min_rate': '20', 'max_rate': '40'})
+    assert facets['availability'] == {
+        bucket: sum(bucket in rows[t]['buckets'] for t in without_availability) for bucket in AVAILABILITY_BUCKETS}
+    without_price = matches(rows, catalog[0], {'availability': 'morning'})
+    assert [band['count'] for band in facets['price']] == [
+        sum(low <= rows[t]['rate'] and (high is None or rows[t]['rate'] < high) for t in without_price)
+        for low, high in ((band['min'], band['max']) for band in facets['price'])]
+
+
+def test_rebuilds_load_in_the_background_and_replay_what_they_missed(app, monkeypatch):
+    directory = TutorDirectory(app.config)
+    release = threading.Event()
+    built, updates = [], []
+
+    def build():
+        if built:
+            release.wait(5)
+        built.append(object())
+        return built[-1], time.monotonic()
+    monkeypatch.setattr(directory, '_build', build)
+    monkeypatch.setattr(directory, '_update', lambda ids: updates.append((directory._snapshot, set(ids))))
+
+    def sync():
+        with directory._lock:
+            directory._sync()
+
+    changed = uuid.uuid4()
+    with app.app_context():
+        sync()  # The first build is in line
+        first = directory._snapshot
+        get_bus().deliver([{"type": RELOAD}])
+        sync()
+        assert directory._snapshot is first
+        # Still served, and kept current, while the rebuild loads
+        get_bus().deliver([{"type": CHANGED, "tutor_ids": [str(changed)]}])
+        sync()
+        assert directory._snapshot is first and updates == [(first, {changed})]
+
+        release.set()
+        deadline = time.monotonic() + 5
+        while directory._fresh is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        sync()
+    assert directory._snapshot is built[1]
+    assert updates[-1] == (built[1], {changed})
+    assert not directory._rebuilding
@@ -0,0 +1,55 @@
+import time
+
+import pytest
+
+
+def _open(client, url, **kwargs):
+    response = client.get(url, buffered=False, **kwargs)
+    response.close()
+    return response
+
+
+def test_stream_token_opens_the_stream(client, auth):
+    issued = client.post('/api/events/token', headers=auth('student'))
+    assert issued.status_code == 200
+    assert issued.get_json()['expires_in'] == 60
+
+    response = _open(client, f"/api/events/slots?token={issued.get_json()['token']}")
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+
+
+def test_stream_token_requires_an_access_token(client):
+    assert client.post('/api/events/token').status_code == 401
+
+
+def test_stream_accepts_the_authorization_header(client, auth):
+    assert _open(client, '/api/events/slots', headers=auth('tutor')).status_code == 200
+
+
+def test_stream_no_longer_takes_access_tokens_in_the_url(client, auth):
+    access_token = auth('student')['Authorization'].split()[1]
+    assert _open(client, f'/api/events/slots?jwt={access_token}').status_code == 401
+    assert _open(client, f'/api/events/slots?token={access_token}').status_code == 401
+
+
+def test_expired_stream_token_is_refused(app, client, auth, monkeypatch):
+    token = client.post('/api/events/token', headers=auth('student')).get_json()['token']
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + app.config['SSE_TOKEN_SECONDS'] + 5)
+    response = _open(client, f'/api/events/slots?token={token}')
+    assert response.status_code == 401
+    assert response.get_json() == {"error": "Stream token expired"}
+
+
+@pytest.mark.parametrize('token', ['', 'garbage'])
+def test_malformed_stream_token(client, token):
+    assert _open(client, f'/api/events/slots?token={token}').status_code == 401
+
+
+@pytest.mark.parametrize('query, error', [('class_id=not-a-uuid', 'Invalid class_id'),
+                                          ('availability=noon', 'Invalid availability')])
+def test_malformed_stream_filters(client, auth, query, error):
+    response = _open(client, f'/api/events/slots?{query}', headers=auth('student'))
+    assert response.status_code == 400
+    assert response.get_json() == {"error": error}
@@ -0,0 +1,64 @@
+import random
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.utils.matching import Candidate, merge_windows, sweep
+
+
+def _match(client, auth, windows):
+    return client.post('/api/student/match', headers=auth('student'),
+                       json={"windows": windows, "class_id": str(uuid.uuid4())})
+
+
+def test_match_accepts_offset_windows_next_to_naive_ones(client, auth):
+    # Aware and naive times used to meet in one comparison and raise a TypeError
+    response = _match(client, auth, [
+        {"start": "2026-03-01T09:00:00+02:00", "end": "2026-03-01T12:00:00+02:00"},
+        {"start": "2026-05-01T09:00:00", "end": "2026-05-01T12:00:00"},
+    ])
+    assert response.status_code == 400
+    assert "31 days" in response.get_json()["error"]
+
+
+def test_match_compares_offset_windows_in_utc(client, auth):
+    # 10:00+02:00 is 08:00 UTC, before the 09:00 UTC start
+    response = _match(client, auth, [{"start": "2026-03-01T09:00:00Z", "end": "2026-03-01T10:00:00+02:00"}])
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Each window must end after it starts"}
+
+
+@pytest.mark.parametrize('windows', [[{"start": "soon", "end": "later"}], [{"start": "2026-03-01T09:00:00"}], ["x"]])
+def test_match_rejects_malformed_windows(client, auth, windows):
+    response = _match(client, auth, windows)
+    assert response.status_code == 400
+
+
+def _at(minutes):
+    return datetime(2026, 3, 1) + timedelta(minutes=minutes)
+
+
+def test_merge_windows_sorts_and_joins_overlapping_and_touching():
+    windows = [(_at(300), _at(360)), (_at(0), _at(60)), (_at(30), _at(90)), (_at(90), _at(120)), (_at(10), _at(20))]
+    assert merge_windows(windows) == [(_at(0), _at(120)), (_at(300), _at(360))]
+    assert merge_windows([]) == []
+
+
+def test_sweep_finds_every_overlap_a_brute_force_would():
+    rng = random.Random(5)
+    for _ in range(50):
+        windows = merge_windows([(_at(s), _at(s + rng.randint(10, 180)))
+                                 for s in (rng.randint(0, 2000) for _ in range(rng.randint(1, 8)))])
+        candidates = sorted((Candidate(i, i % 4, _at(s), _at(s + rng.choice([30, 60, 90])), 20, 4, 1)
+                             for i, s in enumerate(rng.randint(0, 2100) for _ in range(40))),
+                            key=lambda c: c.start)
+        min_overlap = timedelta(minutes=rng.choice([1, 30, 45]))
+
+        expected = []
+        for c in candidates:
+            for start, end in windows:
+                overlap_start, overlap_end = max(start, c.start), min(end, c.end)
+                if overlap_end - overlap_start >= min_overlap:
+                    expected.append((c, overlap_start, overlap_end))
+        assert list(sweep(windows, candidates, min_overlap)) == expected
@@ -0,0 +1,62 @@
+import uuid
+from datetime import datetime
+
+import pytest
+
+from app.utils.pagination import decode_time_cursor, encode_cursor, parse_datetime, window_args
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2026-03-01T10:00:00', datetime(2026, 3, 1, 10)),
+    ('2026-03-01T10:00:00+00:00', datetime(2026, 3, 1, 10)),
+    ('2026-03-01T10:00:00Z', datetime(2026, 3, 1, 10)),
+    ('2026-03-01T12:30:00+02:30', datetime(2026, 3, 1, 10)),
+    ('2026-03-01T01:00:00-10:00', datetime(2026, 3, 1, 11)),
+])
+def test_parse_datetime_returns_naive_utc(value, expected):
+    parsed = parse_datetime(value)
+    assert parsed == expected
+    assert parsed.tzinfo is None
+
+
+def test_parse_datetime_rejects_garbage():
+    with pytest.raises(ValueError):
+        parse_datetime('next tuesday')
+
+
+def test_window_args_converts_offsets(app):
+    with app.test_request_context('/?from=2026-03-01T12:00:00%2B02:00&to=2026-03-02T00:00:00Z'):
+        start, end = window_args()
+    assert (start, end) == (datetime(2026, 3, 1, 10), datetime(2026, 3, 2))
+    # Comparable with the naive times the database returns
+    assert start < datetime(2026, 3, 1, 11) < end
+
+
+def test_window_args_rejects_malformed(app):
+    with app.test_request_context('/?from=yesterday'):
+        with pytest.raises(ValueError):
+            window_args()
+
+
+def test_time_cursor_round_trip():
+    slot_id = uuid.uuid4()
+    assert decode_time_cursor(encode_cursor(datetime(2026, 3, 1, 10), slot_id)) == (datetime(2026, 3, 1, 10), slot_id)
+    assert decode_time_cursor(None) is None
+
+
+def test_time_cursor_with_offset_is_naive_utc():
+    slot_id = uuid.uuid4()
+    cursor = encode_cursor('2026-03-01T12:00:00+02:00', slot_id)
+    assert decode_time_cursor(cursor) == (datetime(2026, 3, 1, 10), slot_id)
+
+
+@pytest.mark.parametrize('token', ['!!!', encode_cursor('2026-03-01T10:00:00'), encode_cursor('x', uuid.uuid4())])
+def test_time_cursor_rejects_malformed(token):
+    with pytest.raises(ValueError):
+        decode_time_cursor(token)
+
+
+def test_listing_cursor_header_is_exposed_to_the_frontend(client):
+    response = client.get('/api/tutor/availability',
+                          headers={'Origin': 'https://tutor-match-4ce860e71f03.herokuapp.com'})
+    assert 'X-Next-Cursor' in response.headers.get('Access-Control-Expose-Headers', '')
@@ -0,0 +1,53 @@
+import os
+import threading
+
+from app.utils import profiler
+
+
+def view_body(entered, release):
+    def view():
+        entered.set()
+        release.wait(5)
+        return 'done'
+    return view
+
+
+def test_overlapping_requests_run_unprofiled(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.extensions, 'profile_writer', profiler.ProfileWriter(str(tmp_path), 10))
+    monkeypatch.setitem(app.config, 'PROFILE_SAMPLE_RATE', 1.0)
+    entered, release = threading.Event(), threading.Event()
+    slow = profiler._profiled(view_body(entered, release), app)
+    fast = profiler._profiled(lambda: 'fast', app)
+
+    results = []
+
+    def first_request():
+        with app.test_request_context('/slow'):
+            results.append(slow())
+    thread = threading.Thread(target=first_request)
+    thread.start()
+    assert entered.wait(5)
+
+    # A second request while the first is being profiled is served, not profiled
+    with app.test_request_context('/fast'):
+        assert fast() == 'fast'
+    assert not os.listdir(tmp_path)
+
+    release.set()
+    thread.join(5)
+    assert results == ['done']
+    assert len([name for name in os.listdir(tmp_path) if name.endswith('.json')]) == 1
+
+    # The capture slot is free again
+    with app.test_request_context('/fast'):
+        assert fast() == 'fast'
+    assert len([name for name in os.listdir(tmp_path) if name.endswith('.json')]) == 2
+
+
+def test_profile_header_is_allowed_cross_origin(client):
+    response = client.options('/api/student/tutors', headers={
+        'Origin': 'https://tutor-match-4ce860e71f03.herokuapp.com',
+        'Access-Control-Request-Method': 'GET',
+        'Access-Control-Request-Headers': 'Authorization, X-Profile',
+    })
+    assert 'x-profile' in response.headers.get('Access-Control-Allow-Headers', '').lower()
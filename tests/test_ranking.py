@@ -0,0 +1,74 @@
+import random
+import uuid
+
+import pytest
+
+from app.utils.ranking import SIGNALS, Profile, Ranker, parse_weights
+
+
+def test_parse_weights_defaults_missing_signals_to_zero():
+    assert parse_weights(' rating=0.5 , price=0.25,') == {
+        **dict.fromkeys(SIGNALS, 0.0), 'rating': 0.5, 'price': 0.25}
+    assert parse_weights('') == dict.fromkeys(SIGNALS, 0.0)
+
+
+@pytest.mark.parametrize('spec', ['rating=0.5,popularity=1', 'rating=lots', 'rating'])
+def test_parse_weights_rejects_malformed(spec):
+    with pytest.raises(ValueError):
+        parse_weights(spec)
+
+
+def ranker(profile=None, weights='rating=1', prior_weight=5, mean_rating=3.0):
+    return Ranker(profile or Profile(), parse_weights(weights), prior_weight, mean_rating)
+
+
+def ids(n):
+    return sorted((uuid.uuid4() for _ in range(n)), key=lambda i: i.int)
+
+
+def test_rating_is_pulled_toward_the_mean_by_few_reviews():
+    one_review, many_reviews = ids(2)
+    ranked = ranker().rank([one_review, many_reviews], [20, 20], [5.0, 4.6], [1, 50], limit=2)
+    assert ranked == [many_reviews, one_review]
+
+
+def test_ties_go_by_id_whatever_the_candidate_order():
+    tutors = ids(6)
+    shuffled = random.Random(1).sample(tutors, len(tutors))
+    ranked = ranker().rank(shuffled, [20] * 6, [4.0] * 6, [3] * 6, limit=4)
+    assert ranked == tutors[:4]
+
+
+def test_history_and_affinity_reorder_equal_ratings():
+    a, b, c = ids(3)
+    profile = Profile()
+    profile.bookings = {c: 2}
+    profile.affinity = {b: 0.5}
+    ranked = ranker(profile, 'rating=1,affinity=0.2,history=0.3').rank(
+        [a, b, c], [20, 20, 20], [4.0, 4.0, 4.0], [3, 3, 3], limit=3)
+    assert ranked == [c, b, a]
+
+    # Once reviewed, the student's own rating replaces the repeat signal
+    profile.ratings = {c: 1.0}
+    ranked = ranker(profile, 'rating=1,affinity=0.2,history=0.3').rank(
+        [a, b, c], [20, 20, 20], [4.0, 4.0, 4.0], [3, 3, 3], limit=3)
+    assert ranked == [b, a, c]
+
+
+def test_rank_is_the_top_of_the_full_score_order():
+    rng = random.Random(2)
+    tutors = ids(200)
+    profile = Profile()
+    profile.rate_mean, profile.rate_spread = 30.0, 7.5
+    profile.bookings = {t: rng.randint(1, 5) for t in rng.sample(tutors, 10)}
+    profile.cooccurrence = {t: rng.random() for t in rng.sample(tutors, 30)}
+    r = ranker(profile, 'rating=0.4,price=0.2,cooccurrence=0.2,history=0.2')
+    rates = [float(rng.choice([15, 20, 30, 45])) for _ in tutors]
+    ratings = [rng.choice([0.0, 3.5, 4.0, 5.0]) for _ in tutors]
+    reviews = [rng.choice([0, 2, 10]) for _ in tutors]
+
+    scores = r.scores(tutors, rates, ratings, reviews)
+    expected = [tutors[i] for i in sorted(range(len(tutors)), key=lambda i: (-scores[i], tutors[i].int))]
+    for limit in (1, 10, 57, 200, 500):
+        assert r.rank(tutors, rates, ratings, reviews, limit) == expected[:limit]
+    assert r.rank([], [], [], [], 10) == []
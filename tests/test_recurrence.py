@@ -0,0 +1,51 @@
+import uuid
+from datetime import date, datetime, time
+
+from app.models import AvailabilityException, AvailabilityRule
+from app.utils.recurrence import parse_virtual_slot_id, virtual_slot_id
+
+# 2026-03-02 is a Monday
+WINDOW = (datetime(2026, 3, 1), datetime(2026, 3, 17))
+
+
+def monday_rule(*exceptions):
+    return AvailabilityRule(weekday=0, start_time=time(9), end_time=time(12), slot_minutes=60,
+                            valid_from=date(2026, 1, 1), valid_until=None, exceptions=list(exceptions))
+
+
+def starts(rule):
+    return [start for start, _ in rule.occurrences(*WINDOW)]
+
+
+def test_occurrences_cover_each_matching_weekday():
+    assert starts(monday_rule()) == [
+        datetime(2026, 3, d, h) for d in (2, 9, 16) for h in (9, 10, 11)
+    ]
+
+
+def test_whole_day_exception_skips_the_day():
+    rule = monday_rule(AvailabilityException(date=date(2026, 3, 9)))
+    assert starts(rule) == [datetime(2026, 3, d, h) for d in (2, 16) for h in (9, 10, 11)]
+
+
+def test_single_occurrence_exception_skips_only_that_slot():
+    rule = monday_rule(AvailabilityException(date=date(2026, 3, 9), start_time=datetime(2026, 3, 9, 10)))
+    skipped = starts(rule)
+    assert datetime(2026, 3, 9, 10) not in skipped
+    assert datetime(2026, 3, 9, 9) in skipped and datetime(2026, 3, 9, 11) in skipped
+    assert len(skipped) == 8
+
+
+def test_to_dict_separates_days_off_from_skipped_occurrences():
+    rule = monday_rule(AvailabilityException(date=date(2026, 3, 9)),
+                       AvailabilityException(date=date(2026, 3, 16), start_time=datetime(2026, 3, 16, 11)))
+    data = rule.to_dict()
+    assert data["exceptions"] == ["2026-03-09"]
+    assert data["skipped_occurrences"] == ["2026-03-16T11:00:00"]
+
+
+def test_virtual_slot_ids_with_an_offset_become_naive_utc():
+    rule_id = uuid.uuid4()
+    assert parse_virtual_slot_id(f"{rule_id}@2026-03-09T06:00:00-04:00") == (rule_id, datetime(2026, 3, 9, 10))
+    assert parse_virtual_slot_id(virtual_slot_id(rule_id, datetime(2026, 3, 9, 10))) == (rule_id, datetime(2026, 3, 9, 10))
+    assert parse_virtual_slot_id(str(rule_id)) is None
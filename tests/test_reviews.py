@@ -0,0 +1,11 @@
+import uuid
+
+import pytest
+
+
+@pytest.mark.parametrize('rating', [True, False, 0, 6, 4.5, '5', None])
+def test_create_review_rejects_invalid_ratings(client, auth, rating):
+    response = client.post(f'/api/students/sessions/{uuid.uuid4()}/reviews',
+                           json={"rating": rating}, headers=auth('student'))
+    assert response.status_code == 400
+    assert response.get_json() == {"message": "Rating must be an integer from 1 to 5"}
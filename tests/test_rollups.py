@@ -0,0 +1,37 @@
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+from app.utils.rollups import METRICS, tally
+
+
+def test_tally_folds_each_source_into_its_day():
+    a, b = uuid.uuid4(), uuid.uuid4()
+    day1, day2 = datetime(2026, 3, 1), datetime(2026, 3, 2)
+    rows = tally(
+        slots=[
+            (a, day1.replace(hour=9), day1.replace(hour=10), 'available', Decimal('30')),
+            (a, day1.replace(hour=11), day1.replace(hour=12, minute=30), 'booked', Decimal('30')),
+            (a, day2.replace(hour=9), day2.replace(hour=9, minute=45), 'completed', Decimal('30')),
+            (b, day1.replace(hour=23), day2.replace(hour=1), 'booked', Decimal('20.50')),
+        ],
+        bookings=[(a, day1.replace(hour=8)), (a, day1.replace(hour=20)), (b, day2)],
+        cancellations=[(a, day2.replace(hour=7))],
+        reviews=[(a, day1.replace(hour=12), 5), (a, day1.replace(hour=13), 3)],
+    )
+
+    assert set(rows) == {(day1.date(), a), (day2.date(), a), (day1.date(), b), (day2.date(), b)}
+    assert rows[(day1.date(), a)] == {
+        'slots_offered': 2, 'offered_minutes': 150, 'slots_booked': 1, 'booked_minutes': 90,
+        'revenue': Decimal('45'), 'bookings': 2, 'cancellations': 0, 'reviews': 2, 'rating_sum': 8}
+    assert rows[(day2.date(), a)] == {
+        'slots_offered': 1, 'offered_minutes': 45, 'slots_booked': 1, 'booked_minutes': 45,
+        'revenue': Decimal('22.5'), 'bookings': 0, 'cancellations': 1, 'reviews': 0, 'rating_sum': 0}
+    # A slot counts on the day it starts, even when it runs past midnight
+    assert rows[(day1.date(), b)]['booked_minutes'] == 120
+    assert rows[(day1.date(), b)]['revenue'] == Decimal('41')
+    assert rows[(day2.date(), b)] == {**dict.fromkeys(METRICS, 0), 'bookings': 1}
+
+
+def test_tally_of_nothing_is_empty():
+    assert tally([], [], [], []) == {}
@@ -0,0 +1,25 @@
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from app.utils import search
+from app.utils.directory import MAX_CHANGED_IDS, Snapshot
+
+
+@pytest.mark.parametrize('bucket', list(search.AVAILABILITY_BUCKETS))
+def test_known_availability_buckets_filter(bucket):
+    assert 'availability' in search.tutor_filters(MultiDict({'availability': bucket}))
+    assert 'availability' in Snapshot({}, {}).filters(MultiDict({'availability': bucket}))
+
+
+@pytest.mark.parametrize('value', ['weird', 'any', 'Morning'])
+def test_unknown_availability_is_rejected(value):
+    args = MultiDict({'availability': value})
+    with pytest.raises(ValueError, match='Invalid availability'):
+        search.tutor_filters(args)
+    with pytest.raises(ValueError, match='Invalid availability'):
+        Snapshot({}, {}).filters(args)
+
+
+
+def test_sweep_batches_fit_one_changed_event():
+    assert search.SWEEP_BATCH <= MAX_CHANGED_IDS
@@ -0,0 +1,121 @@
+import threading
+import time
+import uuid
+
+from app.utils.events import get_bus
+from app.utils.suggest import CATALOG, MAX_KEY_LENGTH, MAX_SCAN, PrefixIndex, SuggestIndex, keys_of
+
+
+def entry(kind='tutor'):
+    return kind, uuid.uuid4()
+
+
+def test_keys_start_at_each_leading_word():
+    assert keys_of('Tina  Turner', 'tt1') == {'tina turner', 'turner', 'tt1'}
+    assert keys_of('a b c d e f') == {'a b c d e f', 'b c d e f', 'c d e f', 'd e f'}
+    assert keys_of(None, '') == set()
+    assert max(map(len, keys_of('x' * 100))) == MAX_KEY_LENGTH
+
+
+def test_lookup_returns_distinct_entries_in_key_order():
+    tina, tom, calc = entry(), entry(), entry('subject')
+    index = PrefixIndex()
+    index.build([
+        (tina, ('1', 'Tina Turner', 'tt'), keys_of('Tina Turner', 'tt')),
+        (tom, ('2', 'Tom', 'tom'), keys_of('Tom', 'tom')),
+        (calc, ('3', 'Calculus', 'MATE3031'), keys_of('Calculus', 'MATE3031')),
+    ])
+    assert index.lookup('t', 10) == [tina, tom]  # "tina turner" < "tom" < "tt" < "turner"
+    assert index.lookup('tu', 10) == [tina]
+    assert index.lookup('mate', 10) == [calc]
+    assert index.lookup('t', 1) == [tina]
+    assert index.lookup('z', 10) == []
+
+
+def test_put_replaces_an_entries_keys():
+    tina = entry()
+    index = PrefixIndex()
+    index.build([(tina, ('1', 'Tina Turner', 'tt'), keys_of('Tina Turner', 'tt'))])
+    index.put(tina, ('1', 'Tina Smith', 'ts'), keys_of('Tina Smith', 'ts'))
+    assert index.lookup('tur', 10) == []
+    assert index.lookup('smi', 10) == [tina]
+    assert index.labels[tina] == ('1', 'Tina Smith', 'ts')
+    assert index.keys == sorted(index.keys)
+
+
+def test_remove_drops_only_that_entry():
+    a, b = entry(), entry()
+    index = PrefixIndex()
+    # Both share every key, so removal must find the right one among equals
+    index.build([(a, ('a', 'Ann', ''), keys_of('Ann')), (b, ('b', 'Ann', ''), keys_of('Ann'))])
+    index.remove(a)
+    assert index.lookup('ann', 10) == [b]
+    assert a not in index.labels
+    index.remove(a)  # Already gone
+    index.remove(b)
+    assert index.keys == [] and index.entries == []
+
+
+def test_incremental_changes_match_a_rebuild():
+    names = ['ann lee', 'anna bell', 'bo ann', 'carl', 'ann-marie', 'lee ann']
+    entries = [entry() for _ in names]
+    index = PrefixIndex()
+    for e, name in zip(entries, names):
+        index.put(e, (str(e[1]), name, ''), keys_of(name))
+    index.remove(entries[1])
+    index.put(entries[3], ('', 'annie', ''), keys_of('annie'))
+
+    rebuilt = PrefixIndex()
+    rebuilt.build([(e, ('', name, ''), keys_of(name)) for e, name in zip(entries, names)
+                   if e != entries[1] and e != entries[3]] + [(entries[3], ('', 'annie', ''), keys_of('annie'))])
+    assert index.keys == rebuilt.keys
+    assert set(index.lookup('ann', 10)) == set(rebuilt.lookup('ann', 10))
+    assert entries[1] not in index.lookup('ann', 10)
+
+
+def test_lookup_scans_a_bounded_number_of_keys():
+    crowd = [entry() for _ in range(MAX_SCAN)]
+    late = entry()
+    index = PrefixIndex()
+    index.build([(e, ('', 'x', ''), ['same']) for e in crowd] + [(late, ('', 'y', ''), ['samez'])])
+    found = index.lookup('same', 1000)
+    assert len(found) == MAX_SCAN
+    assert late not in found
+
+
+def test_rebuilds_load_in_the_background_and_replay_what_they_missed(app, monkeypatch):
+    suggest = SuggestIndex(app.config)
+    release = threading.Event()
+    built, updates = [], []
+
+    def build():
+        if built:
+            release.wait(5)
+        built.append(PrefixIndex())
+        return built[-1], time.monotonic()
+    monkeypatch.setattr(suggest, '_build', build)
+    monkeypatch.setattr(suggest, '_update', lambda changed: updates.append((suggest._index, changed['class'])))
+
+    def sync():
+        with suggest._lock:
+            suggest._sync()
+
+    class_id = uuid.uuid4()
+    with app.app_context():
+        sync()  # The first build is in line
+        first = suggest._index
+        get_bus().deliver([{"type": CATALOG}])  # No ids: rebuild
+        sync()
+        assert suggest._index is first
+        get_bus().deliver([{"type": CATALOG, "class_ids": [str(class_id)]}])
+        sync()
+        assert suggest._index is first and updates == [(first, {class_id})]
+
+        release.set()
+        deadline = time.monotonic() + 5
+        while suggest._fresh is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        sync()
+    assert suggest._index is built[1]
+    assert updates[-1] == (built[1], {class_id})
+    assert not suggest._rebuilding
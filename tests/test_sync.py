@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+from app.routes.sync_routes import _merge_changes
+
+SETTLED = datetime(2026, 3, 1, 12)
+OLD = SETTLED - timedelta(minutes=1)
+FRESH = SETTLED + timedelta(seconds=1)
+
+
+def change(seq, kind='slots', changed_at=OLD, name=None):
+    return (seq, changed_at, kind, name or f'{kind}-{seq}')
+
+
+def no_group(seq):
+    raise AssertionError(f"group {seq} should not be refetched")
+
+
+def seqs(changes):
+    return [seq for seq, _, _, _ in changes]
+
+
+def test_merges_sources_in_change_order():
+    sources = [[change(1), change(4)], [change(2, 'sessions')], [change(3, 'deleted')]]
+    changes, has_more = _merge_changes(sources, 10, SETTLED, no_group)
+    assert seqs(changes) == [1, 2, 3, 4]
+    assert not has_more
+
+
+def test_cuts_a_page_between_groups():
+    changes, has_more = _merge_changes([[change(1), change(2), change(3)]], 2, SETTLED, no_group)
+    assert seqs(changes) == [1, 2]
+    assert has_more
+
+
+def test_page_ending_inside_a_group_takes_the_whole_group():
+    # The slot and its session share seq 2; the fetch of each source was
+    # cut at limit + 1 rows, so part of the group may be missing
+    group = [change(2, 'slots'), change(2, 'sessions'), change(2, 'sessions', name='other-session')]
+    sources = [[change(1), change(2, 'slots')], [change(2, 'sessions')]]
+    changes, has_more = _merge_changes(sources, 2, SETTLED, lambda seq: group if seq == 2 else [])
+    assert changes == [change(1)] + group
+    assert has_more
+
+
+def test_page_of_one_group_is_never_empty():
+    group = [change(5, 'slots'), change(5, 'sessions')]
+    changes, has_more = _merge_changes([[change(5, 'slots')], [change(5, 'sessions')]], 1, SETTLED, lambda seq: group)
+    assert changes == group
+    assert has_more
+
+
+def test_holds_back_everything_from_the_first_fresh_change():
+    # 3 is fresh, so 4 (settled, but after 3 in order) waits with it: a
+    # transaction holding an unseen seq below 3 might still commit
+    sources = [[change(1), change(3, changed_at=FRESH), change(4)], [change(2, 'sessions')]]
+    changes, has_more = _merge_changes(sources, 10, SETTLED, no_group)
+    assert seqs(changes) == [1, 2]
+    assert not has_more
+
+
+def test_nothing_settled_returns_nothing():
+    changes, has_more = _merge_changes([[change(1, changed_at=FRESH)]], 10, SETTLED, no_group)
+    assert changes == [] and not has_more
+
+
+def test_rows_without_a_timestamp_count_as_settled():
+    changes, _ = _merge_changes([[change(1, changed_at=None), change(2)]], 10, SETTLED, no_group)
+    assert seqs(changes) == [1, 2]
@@ -0,0 +1,105 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from app.utils import shared_store
+from app.utils.shared_store import SharedStore
+from app.utils.throttle import LoginThrottle
+
+
+@pytest.fixture
+def store(app, tmp_path, monkeypatch):
+    store = SharedStore(str(tmp_path / 'shared.sqlite3'))
+    monkeypatch.setitem(app.extensions, 'shared_store', store)
+    with app.app_context():
+        yield store
+
+
+def throttle(app, **overrides):
+    return LoginThrottle(dict(app.config, **overrides))
+
+
+def test_lockout_is_per_account_and_ip(app, store):
+    t = throttle(app, LOGIN_LOCKOUT_THRESHOLD=2, LOGIN_ACCOUNT_BURST=100, LOGIN_IP_BURST=100)
+    for _ in range(2):
+        t.record_failure('user-1', '10.0.0.1')
+    assert t.check('user-1', '10.0.0.1') > 0
+    # The owner elsewhere, and other accounts from that IP, are not locked out
+    assert t.check('user-1', '10.0.0.2') == 0
+    assert t.check('user-2', '10.0.0.1') == 0
+
+    t.record_success('user-1', '10.0.0.1')
+    assert t.check('user-1', '10.0.0.1') == 0
+
+
+def test_account_bucket_is_shared_across_ips(app, store):
+    t = throttle(app, LOGIN_ACCOUNT_BURST=2, LOGIN_ACCOUNT_PER_MINUTE=1, LOGIN_IP_BURST=100)
+    assert t.check('user-1', '10.0.0.1') == 0
+    assert t.check('user-1', '10.0.0.2') == 0
+    assert t.check('user-1', '10.0.0.3') > 0
+
+
+def test_hash_slots_are_shared_through_the_store(app, store):
+    # Two throttles stand for two workers on one host
+    first = throttle(app, LOGIN_MAX_CONCURRENT_HASHES=2, LOGIN_HASH_WAIT_SECONDS=0)
+    second = throttle(app, LOGIN_MAX_CONCURRENT_HASHES=2, LOGIN_HASH_WAIT_SECONDS=0)
+    a, b = first.acquire_hash_slot(), second.acquire_hash_slot()
+    assert a and b and a != b
+    assert first.acquire_hash_slot() is None
+    assert second.acquire_hash_slot() is None
+
+    second.release_hash_slot(a)
+    assert first.acquire_hash_slot()
+
+
+def test_hash_slot_waits_for_a_release(app, store):
+    t = throttle(app, LOGIN_MAX_CONCURRENT_HASHES=1, LOGIN_HASH_WAIT_SECONDS=2)
+    held = t.acquire_hash_slot()
+
+    def release():
+        with app.app_context():
+            t.release_hash_slot(held)
+    timer = threading.Timer(0.1, release)
+    timer.start()
+    started = time.monotonic()
+    assert t.acquire_hash_slot()
+    assert time.monotonic() - started < 1.5
+    timer.join()
+
+
+def test_abandoned_hash_slots_expire(app, store, monkeypatch):
+    t = throttle(app, LOGIN_MAX_CONCURRENT_HASHES=1, LOGIN_HASH_WAIT_SECONDS=0)
+    assert t.acquire_hash_slot()
+    assert t.acquire_hash_slot() is None
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 31)
+    assert t.acquire_hash_slot()
+
+
+def _hold_write_lock(path, seconds):
+    other = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    other.execute("BEGIN IMMEDIATE")
+    timer = threading.Timer(seconds, lambda: other.execute("COMMIT"))
+    timer.start()
+    return timer
+
+
+def test_store_writes_wait_out_another_writer(store):
+    store.set('k', 1)
+    timer = _hold_write_lock(store.path, 0.2)
+    started = time.monotonic()
+    assert store.incr('k') == 2
+    assert time.monotonic() - started >= 0.15
+    timer.join()
+
+
+def test_store_gives_up_after_busy_timeout(store, monkeypatch):
+    store.set('k', 1)
+    monkeypatch.setattr(shared_store, 'BUSY_TIMEOUT_SECONDS', 0.1)
+    timer = _hold_write_lock(store.path, 0.5)
+    with pytest.raises(sqlite3.OperationalError):
+        store.set('k', 2)
+    timer.join()
+    assert store.get('k') == 1